@@ -0,0 +1,339 @@
+# surface sag and edge geometry of a prescription, in NumPy, without OpticStudio
+# the sag of every surface is sampled on a radial grid from the axis to its semi-diameter
+# ('cir', or the CONF SDIA value of each configuration), as the writers set it up:
+#   z(r) = c r^2 / (1 + sqrt(1 - (1+k) c^2 r^2)) + sum_N a_N r^N
+# (an Extended Odd Asphere with normalization radius 1.0; a plain surface has k = 0 and
+# no a_N). the asphere polynomial of all the surfaces of all the configurations (and,
+# with sag_reports, of a whole corpus) is one product of the (rows x powers) coefficient
+# matrix, scaled by each row's semi-diameter, with a shared (powers x grid) power basis.
+#
+# check_sag turns the surfaces that cannot be right into preflight_validator.PreflightIssue
+# warnings, so a mis-transcribed coefficient or radius is caught before OpticStudio:
+#   sag_domain        the conic sqrt fails inside the semi-diameter (the surface ends)
+#   sag_overflow      the asphere sag is not finite inside the semi-diameter
+#   sag               the asphere sag at the semi-diameter is larger than the semi-diameter
+#   center_thickness  a glass element that is not thicker than 0 on the axis
+#   edge_thickness    a glass element whose surfaces cross before its edge
+#   edge_gap          an air gap whose surfaces cross before its edge
+# a surface without a semi-diameter is sampled out to its axial beam: the paraxial marginal
+# ray height of paraxial_trace, when the trace has the indices for it. that is less than
+# OpticStudio's automatic semi-diameter (the off-axis beams, whose paraxial heights
+# overshoot the real ones at wide fields), so what it flags is inside any aperture the
+# lens can have. a gap is checked out to the smaller height of its two surfaces. 'MIRROR' reverses the
+# direction of the thicknesses after it, as in paraxial_trace.
+#
+# usage:
+#   report = asphere_sag_check.sag_report(lens)
+#   report.edge_sag, report.min_thickness                     # (configs x surfaces)
+#   issues = asphere_sag_check.check_sag(report, fn)
+#   reports = asphere_sag_check.sag_reports(lenses)            # one evaluation for a corpus
+#
+#   python asphere_sag_check.py <dir | glob | manifest.txt> [...] [--points N] [--quiet]
+
+import argparse
+import sys
+
+import numpy as np
+
+import paraxial_trace
+
+# radial samples from the axis to the semi-diameter (both included)
+SAG_POINTS = 65
+
+# check_sag limits
+# asphere sag at the semi-diameter, as a fraction of the semi-diameter
+MAX_SAG_RATIO = 1.0
+# thinnest glass on the axis, and anywhere out to the edge (lens units)
+MIN_CENTER_THICKNESS = 0.0
+MIN_EDGE_THICKNESS = 0.0
+
+# lenses evaluated together by the command line (bounds the memory of one product)
+BATCH_LENSES = 256
+
+
+class SagReport(object):
+    # sag and thickness profiles of one lens; (configs x surfaces) arrays, the gap
+    # arrays hold the gap after each surface (nan for the last surface, before the image)
+    __slots__ = (
+        'system',             # paraxial_trace.ParaxialSystem (CONF operands applied)
+        'asph_rows',          # {surface: ASPH row}
+        'conic',              # (surfaces) conic constant, 0 for a plain surface
+        'grid',               # (points) r over the height, 0..1
+        'height',             # semi-diameter, or the axial beam height; nan when neither is known
+        'estimated',          # bool, height is the axial beam height
+        'surface_sag',        # (configs x surfaces x points) sag out to each height
+        'edge_sag',           # sag at the height
+        'domain_radius',      # r where the conic sqrt fails, inf when it never does
+        'gap_height',         # r out to which the gap is checked
+        'center_thickness',   # along the direction of propagation (negative after a mirror flips)
+        'edge_thickness',     # at gap_height
+        'min_thickness',      # thinnest point out to gap_height
+        'min_radius',         # r of min_thickness
+        'is_glass',           # (configs x surfaces) bool, the gap after the surface is not air
+        )
+
+    @property
+    def n_configs(self):
+        return self.system.n_configs
+
+    @property
+    def n_surfaces(self):
+        return self.system.n_surfaces
+
+    def __repr__(self):
+        return (f"SagReport({self.n_surfaces} surfaces x {self.n_configs} configs, {len(self.asph_rows)} aspheres, "
+                f"min glass thickness {np.nanmin(np.where(self.is_glass, self.min_thickness, np.nan), initial=np.inf):.4g})")
+
+
+def scaled_coefficients(coeffs, height):
+    # a_N h^N (rows x powers), with coeffs in column N; taken in log space, so a tiny
+    # coefficient on a high power does not overflow through h^N alone
+    powers = np.arange(coeffs.shape[1])
+    with np.errstate(divide='ignore', over='ignore', invalid='ignore'):
+        log_scaled = np.log(np.abs(coeffs)) + powers*np.log(height)[:, None]
+        return np.where(coeffs != 0, np.sign(coeffs)*np.exp(log_scaled), 0.0)
+
+
+def sag(curvature, conic, coeffs, height, n_points=SAG_POINTS):
+    # sag (rows x points) of each row's surface at r = height*grid; nan outside the
+    # conic's domain (and for a nan height)
+    grid = np.linspace(0.0, 1.0, n_points)
+    basis = grid[None, :]**np.arange(coeffs.shape[1])[:, None]    # (powers x points)
+    r = height[:, None]*grid
+    c = curvature[:, None]
+    with np.errstate(invalid='ignore', over='ignore'):
+        base = c*r*r/(1.0 + np.sqrt(1.0 - (1.0 + conic[:, None])*(c*r)**2))
+        return base + scaled_coefficients(coeffs, height) @ basis
+
+
+def domain_radius(curvature, conic):
+    # r where 1 - (1+k) c^2 r^2 turns negative (inf when it never does)
+    q = (1.0 + conic)*curvature*curvature
+    with np.errstate(divide='ignore'):
+        return np.where(q > 0, 1.0/np.sqrt(np.where(q > 0, q, 1.0)), np.inf)
+
+
+def asphere_matrix(Prescription, n_powers):
+    # (conic, coefficients) per surface: (surfaces), (surfaces x n_powers) with the
+    # coefficient on r^N in column N; blank cells are 0, as the writers leave them
+    n_surf = Prescription.n_surfaces
+    conic = np.zeros(n_surf)
+    coeffs = np.zeros((n_surf, n_powers))
+    asph_rows = {}
+    for a, s in enumerate(Prescription.asph_surf.tolist()):
+        if 0 <= s < n_surf:
+            asph_rows[s] = a
+    rows = np.array(list(asph_rows.values()), dtype=np.int64)
+    surfs = np.array(list(asph_rows.keys()), dtype=np.int64)
+    if len(rows) > 0:
+        conic[surfs] = np.nan_to_num(Prescription.conic[rows])
+        coeffs[np.ix_(surfs, Prescription.coeff_index)] = np.nan_to_num(Prescription.asph_coeffs[rows])
+    return conic, coeffs, asph_rows
+
+
+def sag_reports(prescriptions, glass_index=None, n_points=SAG_POINTS):
+    # SagReport of each prescription; the sag of every sampled surface of every lens is
+    # one matrix product (and the clear apertures one paraxial trace). glass_index gives
+    # the indices of the trace, and tells glass from air (a catalog glass without an
+    # index is still glass)
+    prescriptions = list(prescriptions)
+    if len(prescriptions) < 1:
+        return []
+    n_powers = 1 + max([int(lens.coeff_index.max()) for lens in prescriptions if len(lens.coeff_index) > 0] + [0])
+    systems = [paraxial_trace.build_system(lens, glass_index) for lens in prescriptions]
+    all_metrics = paraxial_trace.trace_systems(systems)
+    lenses = []
+    parts = []   # per lens: (curvature, conic, coeffs, height) rows
+    for lens, system, metrics in zip(prescriptions, systems, all_metrics):
+        conic, coeffs, asph_rows = asphere_matrix(lens, n_powers)
+        n_configs = system.n_configs
+        curvature = system.curvature
+        beam = np.abs(metrics.marginal_height)
+        beam[:, 0] = np.nan   # the object surface
+        estimated = np.isnan(system.semi_diameter) & np.isfinite(beam) & (beam > 0)
+        height = np.where(estimated, beam, system.semi_diameter)
+        # the gap after surface s, sampled on both its surfaces out to the smaller height
+        # (fmin: a missing one does not count)
+        gap_height = np.fmin(height[:, :-1], height[:, 1:])
+        front = np.tile(np.arange(0, lens.n_surfaces - 1), n_configs)
+        back = front + 1
+        parts.append((
+            np.concatenate([curvature.ravel(), curvature[:, :-1].ravel(), curvature[:, 1:].ravel()]),
+            np.concatenate([np.tile(conic, n_configs), conic[front], conic[back]]),
+            np.concatenate([np.tile(coeffs, (n_configs, 1)), coeffs[front], coeffs[back]]),
+            np.concatenate([height.ravel(), gap_height.ravel(), gap_height.ravel()]),
+            ))
+        lenses.append((system, asph_rows, conic, height, estimated, gap_height))
+    profiles = sag(*[np.concatenate(columns) for columns in zip(*parts)], n_points=n_points)
+
+    reports = []
+    grid = np.linspace(0.0, 1.0, n_points)
+    start = 0
+    for system, asph_rows, conic, height, estimated, gap_height in lenses:
+        n_configs, n_surf = system.curvature.shape
+        n_own = n_configs*n_surf
+        n_gap = n_configs*(n_surf - 1)
+        surface_sag = profiles[start:start + n_own].reshape(n_configs, n_surf, n_points)
+        front_sag = profiles[start + n_own:start + n_own + n_gap].reshape(n_configs, n_surf - 1, n_points)
+        back_sag = profiles[start + n_own + n_gap:start + n_own + 2*n_gap].reshape(n_configs, n_surf - 1, n_points)
+        start += n_own + 2*n_gap
+        report = _report(system, asph_rows, conic, gap_height, grid, surface_sag, front_sag, back_sag)
+        report.height = height
+        report.estimated = estimated
+        reports.append(report)
+    return reports
+
+
+def _report(system, asph_rows, conic, gap_height, grid, surface_sag, front_sag, back_sag):
+    n_configs, n_surf = system.curvature.shape
+    # the sign bit of the index is the direction after each surface (paraxial_trace
+    # flips it at a mirror; a nan index keeps it)
+    direction = np.where(np.signbit(system.index), -1.0, 1.0)
+
+    report = SagReport()
+    report.system = system
+    report.asph_rows = asph_rows
+    report.conic = conic
+    report.grid = grid
+    report.surface_sag = surface_sag
+    report.edge_sag = surface_sag[:, :, -1]
+    report.domain_radius = domain_radius(system.curvature, conic[None, :])
+    report.is_glass = np.abs(system.index) != 1.0
+
+    def gap_array(values):
+        return np.concatenate([values, np.full((n_configs, 1), np.nan)], axis=1)
+
+    report.gap_height = gap_array(gap_height)
+    report.center_thickness = direction*system.thickness
+    with np.errstate(invalid='ignore'):
+        profile = direction[:, :-1, None]*(system.thickness[:, :-1, None] + back_sag - front_sag)
+    # a gap with an unsampled (nan) point has no minimum; the surface checks report why
+    sampled = ~np.isnan(profile).any(axis=2)
+    lowest = np.argmin(np.where(np.isnan(profile), np.inf, profile), axis=2)
+    min_thickness = np.where(sampled, np.take_along_axis(profile, lowest[:, :, None], axis=2)[:, :, 0], np.nan)
+    report.edge_thickness = gap_array(profile[:, :, -1])
+    report.min_thickness = gap_array(min_thickness)
+    report.min_radius = gap_array(np.where(sampled, grid[lowest]*gap_height, np.nan))
+    return report
+
+
+def sag_report(Prescription, glass_index=None, n_points=SAG_POINTS):
+    return sag_reports([Prescription], glass_index, n_points)[0]
+
+
+def check_sag(report, fn=''):
+    # PreflightIssue warnings for the surfaces and gaps that cannot be right; a warning
+    # that holds in several configurations is reported once, with the configs listed
+    import preflight_validator
+    system = report.system
+    n_configs, n_surf = system.curvature.shape
+    found = {}   # (code, block, row, column, message) -> configs
+
+    def add(c, code, block, row, column, message):
+        found.setdefault((code, block, row, column, message), []).append(c)
+
+    def height_name(c, s):
+        return 'axial beam height' if report.estimated[c, s] else 'semi-diameter'
+
+    def surface_cell(s):
+        # the ASPH row of an asphere, else the SURF radius
+        if s in report.asph_rows:
+            return 'ASPH', report.asph_rows[s] + 1, 'ka'
+        return 'SURF', s + 1, 'r'
+
+    height = report.height
+    with np.errstate(invalid='ignore'):
+        finite_sag = np.isfinite(report.surface_sag).all(axis=2)
+        outside_domain = report.domain_radius < height
+        too_deep = np.abs(report.edge_sag) > MAX_SAG_RATIO*height
+    for c in range(0, n_configs):
+        for s in range(1, n_surf):
+            if np.isnan(height[c, s]):
+                continue
+            if outside_domain[c, s]:
+                radius = np.inf if system.curvature[c, s] == 0 else 1.0/system.curvature[c, s]
+                add(c, 'sag_domain', *surface_cell(s),
+                    f"surface {s} ends at r={report.domain_radius[c, s]:.4g}, inside its {height_name(c, s)} "
+                    f"{height[c, s]:.4g} (radius {radius:.6g}, conic {report.conic[s]:.6g})")
+            elif s not in report.asph_rows:
+                continue
+            elif not finite_sag[c, s]:
+                r = report.grid[np.flatnonzero(~np.isfinite(report.surface_sag[c, s]))[-1]]*height[c, s]
+                add(c, 'sag_overflow', 'ASPH', report.asph_rows[s] + 1, '',
+                    f"the sag of surface {s} overflows at r={r:.4g} (an a_N exponent may be mis-typed)")
+            elif too_deep[c, s]:
+                add(c, 'sag', 'ASPH', report.asph_rows[s] + 1, '',
+                    f"the sag of surface {s} is {report.edge_sag[c, s]:.4g} at its {height_name(c, s)} "
+                    f"{height[c, s]:.4g} (an a_N coefficient may be mis-typed)")
+
+    # gaps between surfaces 1 .. n-1 (not the object distance, nor the image distance)
+    for c in range(0, n_configs):
+        for s in range(1, n_surf - 1):
+            center = report.center_thickness[c, s]
+            if not np.isfinite(center):
+                continue
+            glass = report.is_glass[c, s]
+            if glass and (center <= MIN_CENTER_THICKNESS):
+                add(c, 'center_thickness', 'SURF', s + 1, 'd',
+                    f"the element after surface {s} is {center:.4g} thick on the axis")
+                continue
+            thinnest = report.min_thickness[c, s]
+            if np.isnan(thinnest) or (center < 0):
+                continue
+            if glass and (thinnest < MIN_EDGE_THICKNESS):
+                add(c, 'edge_thickness', 'SURF', s + 1, 'd',
+                    f"the element after surface {s} is {thinnest:.4g} thick at r={report.min_radius[c, s]:.4g} "
+                    f"(center {center:.4g}, edge {report.edge_thickness[c, s]:.4g}; check the radii and a_N)")
+            elif (not glass) and (thinnest < 0):
+                add(c, 'edge_gap', 'SURF', s + 1, 'd',
+                    f"surfaces {s} and {s + 1} cross at r={report.min_radius[c, s]:.4g} "
+                    f"(air gap {center:.4g} on the axis, {report.edge_thickness[c, s]:.4g} at r={report.gap_height[c, s]:.4g})")
+
+    chk = preflight_validator._Checker(fn)
+    for (code, block, row, column, message), configs in found.items():
+        if len(configs) < n_configs:
+            prefix = 'config' if len(configs) == 1 else 'configs'
+            message = f"{prefix} {', '.join(str(c + 1) for c in configs)}: {message}"
+        chk.warning(code, block, row, column, message)
+    return chk.issues
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Check the surface sag and edge geometry of patent data workbooks, without OpticStudio.')
+    parser.add_argument('inputs', nargs='+', help='workbook directories, glob patterns, or manifest files (.txt/.lst)')
+    parser.add_argument('--glass-dir', default=None, help='AGF glass catalog directory (only tells glass from air)')
+    parser.add_argument('--points', type=int, default=SAG_POINTS, help=f"radial samples per surface (default: {SAG_POINTS})")
+    parser.add_argument('--quiet', action='store_true', help='only print the lenses with warnings')
+    args = parser.parse_args(argv)
+
+    import batch_import
+    import read_excel_data
+    files = batch_import.find_workbooks(args.inputs)
+    if len(files) < 1:
+        print("ERROR: no workbooks found")
+        return 1
+    glass_index = paraxial_trace.load_glass_index(args.glass_dir)
+    n_lenses = 0
+    n_warned = 0
+    for first in range(0, len(files), BATCH_LENSES):
+        lenses = []
+        for fn in files[first:first + BATCH_LENSES]:
+            try:
+                lenses.append((fn, read_excel_data.read_excel_patent_data(fn, as_prescription=True)))
+            except Exception as e:
+                print(f"ERROR: {fn}: {type(e).__name__}: {e}")
+        reports = sag_reports([lens for fn, lens in lenses], glass_index, args.points)
+        for (fn, lens), report in zip(lenses, reports):
+            issues = check_sag(report, fn)
+            n_lenses += 1
+            n_warned += len(issues) > 0
+            if (len(issues) > 0) or not args.quiet:
+                print(f"{fn}: {report}")
+            for issue in issues:
+                print(f"    {issue}")
+    print(f"\nasphere sag: {n_lenses} lenses checked, {n_warned} with warnings")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,399 @@
+# headless batch import of patent data workbooks into Zemax
+# opens one ZOSAPI connection, and reuses it for every workbook in the batch
+#
+# usage:
+#   python batch_import.py <dir | glob | manifest.txt> [more inputs...]
+#
+# a directory imports every *.xlsx (or .parquet/.json/.csv, see block_formats) in it,
+# a glob pattern imports every match, and a manifest (.txt/.lst) lists one workbook
+# path per line ('#' for comments). when a directory has a workbook and an up-to-date
+# converted copy of it, only the converted copy (the faster read) is imported.
+# one bad workbook is reported and skipped; it never stops the batch.
+# --prefetch N parses the next N workbooks in the background while one is written
+# (pipelined_import). --preflight checks every workbook first (preflight_validator), without OpticStudio,
+# and only the clean ones are imported. --manifest FILE records every import (import_manifest): a rerun
+# skips the workbooks whose output is up to date, and retries only failed, changed and new ones.
+# --embodiments imports multi-lens workbooks (one lens per sheet, or repeated META..WAVE groups in a
+# sheet) in one streaming pass each, writing <workbook>_<label>_ZemaxImport.zmx per lens.
+
+import argparse
+import glob
+import os
+import re
+import sys
+import time
+import traceback
+
+import block_formats
+import import_backends
+import import_profiler
+import read_excel_data
+
+MANIFEST_EXTENSIONS = ('.txt', '.lst')
+
+
+def default_out_file(excel_file):
+    # set the outfile name based on the workbook name (same rule as main.py)
+    return os.path.splitext(excel_file)[0] + '_ZemaxImport.zmx'
+
+
+def embodiment_out_file(excel_file, label, used=None):
+    # one .zmx per lens of a multi-lens workbook: <workbook>_<label>_ZemaxImport.zmx
+    # used (optional): set of the names already given to the workbook's other lenses; labels
+    # that only differ in characters a file name cannot hold (sheets 'Ex 1' and 'Ex_1', or a
+    # sheet 'Group_2' and the 2nd lens of sheet 'Group') get _2, _3 ... instead of overwriting
+    label = re.sub(r'[^\w.-]+', '_', label).strip('_') or 'lens'
+    root = os.path.splitext(excel_file)[0]
+    out_file = root + f'_{label}_ZemaxImport.zmx'
+    if used is None:
+        return out_file
+    n = 1
+    # case-insensitive, as on Windows file systems
+    while out_file.lower() in used:
+        n += 1
+        out_file = root + f'_{label}_{n}_ZemaxImport.zmx'
+    used.add(out_file.lower())
+    return out_file
+
+
+def is_excel_lock_file(fn):
+    # skip Excel lock files (~$name.xlsx)
+    return os.path.basename(fn).startswith('~$')
+
+
+def read_manifest(manifest_fn):
+    # one workbook per line; relative paths are relative to the manifest
+    base_dir = os.path.dirname(os.path.abspath(manifest_fn))
+    files = []
+    with open(manifest_fn, 'r') as f:
+        for line in f:
+            line = line.strip()
+            if (len(line) < 1) or line.startswith('#'):
+                continue
+            if not os.path.isabs(line):
+                line = os.path.join(base_dir, line)
+            files.append(line)
+    return files
+
+
+def find_workbooks(inputs, prefer_converted=True):
+    # expand directories, glob patterns and manifests into a list of workbooks
+    # prefer_converted: in a directory, take an up-to-date converted copy over its workbook
+    files = []
+    for item in inputs:
+        if os.path.isdir(item):
+            found = sorted(fn for fn in glob.glob(os.path.join(item, '*')) if block_formats.is_input_file(fn))
+            if prefer_converted:
+                found = block_formats.preferred_inputs(found)
+        elif item.lower().endswith(MANIFEST_EXTENSIONS) and os.path.isfile(item):
+            found = read_manifest(item)
+        else:
+            found = sorted(glob.glob(item))
+            if len(found) < 1:
+                print(f"warning: no workbooks found for '{item}'")
+        for fn in found:
+            if is_excel_lock_file(fn):
+                continue
+            fn = os.path.abspath(fn)
+            if fn not in files:
+                files.append(fn)
+    return files
+
+
+def import_workbook(excel_file, zos, out_file=None, backend=None, cache=None, update=False, lens=None):
+    # import a single workbook through an already open connection
+    # returns a result dict; errors are caught and reported, never raised
+    # cache: optional parse_cache.ParseCache, to skip re-parsing unchanged workbooks
+    # update: patch the previous import of this workbook instead of rebuilding it
+    # lens: the workbook already parsed (e.g. by pipelined_import), only the write is done
+    if backend is None:
+        backend = import_backends.get_backend('zosapi')
+    if out_file is None:
+        out_file = default_out_file(excel_file)
+    result = {
+        'file': excel_file,
+        'out_file': out_file,
+        'status': 'ok',
+        'error': '',
+        'read_time': 0.0,
+        'write_time': 0.0,
+        }
+
+    t0 = time.perf_counter()
+    try:
+        with import_profiler.get_profiler().workbook(excel_file):
+            if lens is not None:
+                lens_data = lens
+            elif cache is None:
+                lens_data = read_excel_data.read_excel_patent_data(excel_file, as_prescription=True)
+            else:
+                n_hits = cache.hits
+                lens_data = cache.load(excel_file)
+                result['parse_cache'] = 'hit' if cache.hits > n_hits else 'miss'
+            t1 = time.perf_counter()
+            result['read_time'] = t1 - t0
+            if update:
+                result['mode'] = backend.update(lens_data, zos, out_file)
+            else:
+                # write_patent_data_to_zemax starts from TheSystem.New(False)
+                backend.write(lens_data, zos, out_file)
+            result['write_time'] = time.perf_counter() - t1
+    except Exception as e:
+        result['status'] = 'failed'
+        result['error'] = f"{type(e).__name__}: {e}"
+        result['traceback'] = traceback.format_exc()
+    result['total_time'] = time.perf_counter() - t0
+    return result
+
+
+def import_embodiments(excel_file, zos, backend=None, update=False, preflight=False, infer_catalogs=False):
+    # import every lens of a multi-lens workbook (read_excel_data.iter_embodiment_blocks)
+    # through an already open connection: one open of the workbook, one pass over it,
+    # and one .zmx per lens (embodiment_out_file); each lens is let go before the next is read
+    # preflight: check each lens's blocks first, and skip the ones with errors
+    # returns a result dict per lens; a bad lens is reported, and never stops the others
+    # (only a workbook that cannot be read any further ends the pass)
+    if preflight:
+        import preflight_validator
+    embodiments = read_excel_data.iter_embodiment_blocks(excel_file)
+    used = set()
+    results = []
+    while True:
+        t0 = time.perf_counter()
+        try:
+            embodiment = next(embodiments, None)
+        except Exception as e:
+            # the workbook itself could not be read (any lens already imported is kept)
+            results.append(failed_result(excel_file, default_out_file(excel_file), e))
+            break
+        if embodiment is None:
+            break
+        label = embodiment.label
+        out_file = embodiment_out_file(excel_file, label, used)
+        if out_file != embodiment_out_file(excel_file, label):
+            print(f"warning: {excel_file} [{label}]: output name already taken by another lens, writing {os.path.basename(out_file)}")
+        lens = None
+        result = None
+        try:
+            if preflight:
+                issues = preflight_validator.validate_blocks(embodiment.blocks, excel_file, infer_catalogs)
+                if preflight_validator.has_errors(issues):
+                    result = preflight_result(excel_file, issues, out_file)
+            if result is None:
+                lens = read_excel_data.lens_data_from_blocks(embodiment.blocks, as_prescription=True)
+        except Exception as e:
+            result = failed_result(excel_file, out_file, e)
+        embodiment = None
+        if lens is not None:
+            read_time = time.perf_counter() - t0
+            result = import_workbook(excel_file, zos, out_file, backend, update=update, lens=lens)
+            result['read_time'] += read_time
+            result['total_time'] += read_time
+            lens = None
+        result['embodiment'] = label
+        results.append(result)
+    return results
+
+
+def failed_result(excel_file, out_file, e):
+    # result dict of a lens that failed before it could be written
+    return {
+        'file': excel_file,
+        'out_file': out_file,
+        'status': 'failed',
+        'error': f"{type(e).__name__}: {e}",
+        'traceback': traceback.format_exc(),
+        'read_time': 0.0,
+        'write_time': 0.0,
+        'total_time': 0.0,
+        }
+
+
+def preflight_result(excel_file, issues, out_file=None):
+    # result dict of a workbook the preflight check rejected (it is never imported)
+    errors = [issue for issue in issues if issue.is_error]
+    more = f" (and {len(errors) - 1} more)" if len(errors) > 1 else ''
+    return {
+        'file': excel_file,
+        'out_file': default_out_file(excel_file) if out_file is None else out_file,
+        'status': 'invalid',
+        'error': f"{errors[0]}{more}",
+        'read_time': 0.0,
+        'write_time': 0.0,
+        'total_time': 0.0,
+        }
+
+
+def print_result(result, i, n, lens=None):
+    # i/n count workbooks; lens (optional) numbers the lens within its workbook
+    counter = f"{i+1}/{n}" if lens is None else f"{i+1}/{n} lens {lens+1}"
+    mode = f" ({result['mode']})" if 'mode' in result else ''
+    embodiment = f" [{result['embodiment']}]" if 'embodiment' in result else ''
+    print(f"[{counter}] {result['status']:6s} {result['total_time']:8.2f} s  {result['file']}{embodiment}{mode}")
+    if result['status'] != 'ok':
+        print(f"    {result['error']}")
+
+
+def run_batch(files, zos, backend=None, cache=None, update=False, verbose=True, on_result=None):
+    # import every workbook through the same connection
+    # on_result (optional): called with each result as soon as it is done (e.g. import_manifest)
+    results = []
+    for i, fn in enumerate(files):
+        result = import_workbook(fn, zos, backend=backend, cache=cache, update=update)
+        results.append(result)
+        if on_result is not None:
+            on_result(result)
+        if verbose:
+            print_result(result, i, len(files))
+    return results
+
+
+def run_embodiments(files, zos, backend=None, update=False, preflight=False, infer_catalogs=False, verbose=True):
+    # run_batch for multi-lens workbooks: every lens of every workbook, through the same connection
+    # (progress lines read [workbook/workbooks lens k])
+    results = []
+    for i, fn in enumerate(files):
+        lenses = import_embodiments(fn, zos, backend=backend, update=update, preflight=preflight, infer_catalogs=infer_catalogs)
+        for k, result in enumerate(lenses):
+            results.append(result)
+            if verbose:
+                print_result(result, i, len(files), k)
+    return results
+
+
+def print_summary(results, total_time):
+    n_ok = sum(1 for r in results if r['status'] == 'ok')
+    n_skipped = sum(1 for r in results if r['status'] == 'skipped')
+    n_failed = len(results) - n_ok - n_skipped
+    noun = 'lenses' if any('embodiment' in r for r in results) else 'workbooks'
+    print(f"\nimported {n_ok} of {len(results) - n_skipped} {noun} in {total_time:.2f} s ({n_failed} failed)")
+    if n_skipped > 0:
+        print(f"skipped {n_skipped} workbooks already up to date")
+    n_hits = sum(1 for r in results if r.get('parse_cache') == 'hit')
+    n_misses = sum(1 for r in results if r.get('parse_cache') == 'miss')
+    if n_hits + n_misses > 0:
+        print(f"parse cache: {n_hits} hits, {n_misses} misses")
+    for r in results:
+        if r['status'] not in ('ok', 'skipped'):
+            embodiment = f" [{r['embodiment']}]" if 'embodiment' in r else ''
+            print(f"  failed: {r['file']}{embodiment}\n    {r['error']}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Import a batch of patent data workbooks into Zemax, using one OpticStudio connection.')
+    parser.add_argument('inputs', nargs='+', help='workbook directories, glob patterns, or manifest files (.txt/.lst)')
+    parser.add_argument('--backend', default='zosapi', choices=sorted(import_backends.BACKENDS.keys()), help='writer backend (default: zosapi)')
+    parser.add_argument('--workers', type=int, default=1, help='number of parallel OpticStudio instances (one license seat each)')
+    parser.add_argument('--cache-dir', default=None, help='reuse parsed workbooks from this cache directory')
+    parser.add_argument('--cache-max-mb', type=float, default=256, help='size cap of the parse cache, in MiB (default: 256)')
+    parser.add_argument('--clear-cache', action='store_true', help='empty the parse cache before importing')
+    parser.add_argument('--prefetch', type=int, default=0, metavar='N', help='parse up to N workbooks ahead of the writer (single connection only)')
+    parser.add_argument('--parsers', type=int, default=1, help='with --prefetch, number of parser threads/processes (default: 1)')
+    parser.add_argument('--parser-processes', action='store_true', help='with --prefetch, parse in processes instead of threads')
+    parser.add_argument('--update', action='store_true', help='patch the previous *_ZemaxImport.zmx of each workbook instead of rebuilding it')
+    parser.add_argument('--profile', default=None, metavar='MODE',
+                        help="per-stage timing: 'summary', 'jsonl', or a .jsonl file; add '+alloc' for allocations (see import_profiler)")
+    parser.add_argument('--cprofile-dir', default=None, help='with --profile, also dump a cProfile file per stage')
+    parser.add_argument('--preflight', action='store_true', help='check every workbook first (no OpticStudio), and import only the clean ones')
+    parser.add_argument('--preflight-workers', type=int, default=None, help='processes for the preflight check (default: one per CPU)')
+    parser.add_argument('--lde-export', default=None, choices=['csv', 'parquet'], help='read the LDE back after each import and save it next to the .zmx')
+    parser.add_argument('--manifest', default=None, metavar='FILE',
+                        help='record each import in FILE, and skip workbooks whose output is up to date (resumable batches)')
+    parser.add_argument('--force', action='store_true', help='with --manifest, import every workbook even when it is up to date')
+    parser.add_argument('--embodiments', action='store_true',
+                        help='multi-lens workbooks: import every sheet (and every repeated META..WAVE group) as its own <workbook>_<label>_ZemaxImport.zmx')
+    args = parser.parse_args(argv)
+    if args.embodiments:
+        # the lenses are streamed out of each workbook by a single writer, and the cache
+        # and manifest keep one entry per workbook
+        for option, value in [('--workers', args.workers > 1), ('--prefetch', args.prefetch > 0),
+                              ('--cache-dir', args.cache_dir is not None), ('--manifest', args.manifest is not None)]:
+            if value:
+                parser.error(f"{option} cannot be combined with --embodiments")
+
+    files = find_workbooks(args.inputs)
+    if len(files) < 1:
+        print("ERROR: no workbooks found")
+        return 1
+
+    cache = None
+    cache_max_bytes = int(args.cache_max_mb*2**20)
+    if args.cache_dir is not None:
+        import parse_cache
+        cache = parse_cache.ParseCache(args.cache_dir, cache_max_bytes)
+        if args.clear_cache:
+            cache.invalidate()
+
+    if (args.profile is not None) or (args.cprofile_dir is not None):
+        import_profiler.configure(args.profile or 'summary', args.cprofile_dir)
+
+    t_start = time.perf_counter()
+
+    manifest = None
+    on_result = None
+    skipped = []
+    if args.manifest is not None:
+        # resume: only what failed, changed or was never imported is left to do
+        import import_manifest
+        manifest = import_manifest.ImportManifest(args.manifest)
+        manifest_backend = import_backends.get_backend(args.backend)
+        files, skipped = manifest.plan(files, manifest_backend, force=args.force)
+        on_result = lambda result: manifest.record(result, manifest_backend)
+        print(f"manifest: {len(skipped)} up to date, {len(files)} to import")
+
+    invalid = []
+    if args.preflight and not args.embodiments:
+        # structural errors found here would otherwise surface half-way through a session
+        import preflight_validator
+        preflight = preflight_validator.scan(files, args.preflight_workers, infer_catalogs=(args.backend == 'zosapi'))
+        invalid = [preflight_result(fn, issues) for fn, issues in preflight.items() if preflight_validator.has_errors(issues)]
+        files = preflight_validator.clean_files(preflight)
+        if on_result is not None:
+            for result in invalid:
+                on_result(result)
+        print(f"preflight: {len(files)} clean, {len(invalid)} rejected in {time.perf_counter() - t_start:.2f} s")
+
+    if len(files) < 1:
+        results = []
+    elif args.workers > 1:
+        # spread the workbooks over a pool of connections
+        import parallel_import
+        results = parallel_import.run_parallel(files, backend_name=args.backend, pool_size=args.workers,
+                                               cache_dir=args.cache_dir, cache_max_bytes=cache_max_bytes, update=args.update,
+                                               lde_export=args.lde_export, on_result=on_result)
+    else:
+        # initialize the zemax connection once (requires valid Zemax license)
+        backend = import_backends.get_backend(args.backend)
+        backend.lde_export = args.lde_export
+        t_connect = time.perf_counter()
+        zos = backend.connect()
+        print(f"connected to {backend.name} backend in {time.perf_counter() - t_connect:.2f} s")
+
+        if args.embodiments:
+            # one pass over each workbook; with --preflight, each lens is checked just before it is written
+            results = run_embodiments(files, zos, backend=backend, update=args.update, preflight=args.preflight,
+                                      infer_catalogs=(args.backend == 'zosapi'))
+        elif args.prefetch > 0:
+            # parse ahead in the background while this thread writes
+            import pipelined_import
+            parser_kind = pipelined_import.PARSER_PROCESS if args.parser_processes else pipelined_import.PARSER_THREAD
+            results = pipelined_import.run_pipelined(files, zos, backend=backend, update=args.update, prefetch=args.prefetch,
+                                                     parsers=args.parsers, parser_kind=parser_kind,
+                                                     cache_dir=args.cache_dir, cache_max_bytes=cache_max_bytes, on_result=on_result)
+        else:
+            results = run_batch(files, zos, backend=backend, cache=cache, update=args.update, on_result=on_result)
+
+        # clean up ZOS connection
+        backend.close(zos)
+        zos = None
+
+    results = skipped + invalid + results
+    if manifest is not None:
+        manifest.close()
+    print_summary(results, time.perf_counter() - t_start)
+    import_profiler.get_profiler().report()
+    return 0 if all(r['status'] in ('ok', 'skipped') for r in results) else 2
+
+
+if __name__ == '__main__':
+    sys.exit(main())
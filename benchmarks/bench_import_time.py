@@ -0,0 +1,90 @@
+# benchmark: interpreter start-up cost of the command-line entry points
+# runs each case in a fresh interpreter with `python -X importtime`, and checks the
+# measured import time against a budget, and that heavy modules stay unloaded
+#
+# usage (from the repo root):
+#   python benchmarks/bench_import_time.py [--repeat N]
+# exits with status 1 when a budget is exceeded or a forbidden module was imported
+
+import argparse
+import os
+import subprocess
+import sys
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SAMPLE_WORKBOOK = os.path.join(REPO_DIR, 'Sample_1', 'Sample_1.xlsx')
+
+# (name, python arguments, import time budget in ms, modules that must not be imported)
+IMPORT_BUDGETS = [
+    ('import cli', ['-c', 'import cli'], 60,
+     ['numpy', 'pandas', 'openpyxl', 'matplotlib', 'clr', 'tkinter']),
+    ('import import_daemon', ['-c', 'import import_daemon'], 150,
+     ['numpy', 'pandas', 'openpyxl', 'matplotlib', 'clr', 'tkinter']),
+    ('cli --validate-only', ['cli.py', SAMPLE_WORKBOOK, '--validate-only'], 600,
+     ['pandas', 'matplotlib', 'clr', 'tkinter']),
+    ('cli --backend zmx', ['cli.py', SAMPLE_WORKBOOK, '--backend', 'zmx', '--out-dir', '{tmp}'], 600,
+     ['pandas', 'matplotlib', 'clr', 'tkinter']),
+    ]
+
+
+def parse_importtime(stderr):
+    # {module: cumulative us} of every import, and the total of the top-level imports
+    modules = {}
+    total = 0
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        fields = line[len('import time:'):].split('|')
+        cumulative = int(fields[1])
+        name = fields[2].rstrip()
+        modules[name.strip()] = cumulative
+        if not name.startswith('  '):
+            total += cumulative
+    return modules, total
+
+
+def measure(args, repeat, tmp_dir):
+    # best-of-N import time (ms), and the modules that were imported
+    best = float('inf')
+    modules = {}
+    for r in range(0, repeat):
+        cmd = [sys.executable, '-X', 'importtime'] + [a.replace('{tmp}', tmp_dir) for a in args]
+        proc = subprocess.run(cmd, cwd=REPO_DIR, capture_output=True, text=True)
+        modules, total = parse_importtime(proc.stderr)
+        best = min(best, total / 1000)
+    return best, modules
+
+
+def check_import_budgets(repeat=3, verbose=True):
+    # list of budget violations (empty when all cases are within budget)
+    import tempfile
+    violations = []
+    if verbose:
+        print(f"{'case':24s} {'import ms':>10s} {'budget ms':>10s}  heavy modules loaded")
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for name, args, budget, forbidden in IMPORT_BUDGETS:
+            ms, modules = measure(args, repeat, tmp_dir)
+            loaded = [m for m in forbidden if m in modules]
+            if verbose:
+                print(f"{name:24s} {ms:10.1f} {budget:10d}  {', '.join(loaded) or '-'}")
+            if ms > budget:
+                violations.append(f"{name}: {ms:.1f} ms import time, budget {budget} ms")
+            for m in loaded:
+                violations.append(f"{name}: imported {m}")
+    return violations
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Check the import-time budget of the entry points.')
+    parser.add_argument('--repeat', type=int, default=3, help='runs per case (best is reported)')
+    args = parser.parse_args(argv)
+
+    violations = check_import_budgets(args.repeat)
+    for v in violations:
+        print(f"OVER BUDGET: {v}")
+    return 1 if len(violations) > 0 else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,87 @@
+# benchmark: incremental re-import (--update) against a full rebuild
+# imports each workbook into a fake_zosapi system, edits the prescription (a radius, and,
+# on aspheres, a cleared conic and a cleared coefficient), then writes the edit once as a
+# patch of the previous .zmx and once as a full rebuild; checks both give the same file
+#
+# usage (from the repo root):
+#   python benchmarks/bench_incremental_import.py [workbooks...]
+
+import argparse
+import contextlib
+import glob
+import io
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+
+import fake_zosapi
+import incremental_import
+import lens_prescription
+import read_excel_data
+import write_data_to_zemax
+
+
+def sample_workbooks():
+    files = glob.glob(os.path.join(REPO_DIR, '*', '*.xlsx'))
+    return sorted(f for f in files if not os.path.basename(f).startswith('~$'))
+
+
+def edited(lens):
+    # a copy of lens with a few cells edited, as a user would in the workbook
+    lens = lens_prescription.LensPrescription.from_arrays({k: np.copy(v) for k, v in lens.to_arrays().items()})
+    lens.radius[1] = 2*lens.radius[1] if np.isfinite(lens.radius[1]) else 100.0
+    if len(lens.asph_surf) > 0:
+        # clearing ASPH cells must leave 0 behind, as a rebuild does
+        lens.conic[0] = np.nan
+        nonzero = np.flatnonzero(np.nan_to_num(lens.asph_coeffs[0]))
+        lens.asph_coeffs[0, nonzero[0] if len(nonzero) > 0 else 0] = np.nan
+    return lens
+
+
+def read_text(fn):
+    with open(fn, 'r') as f:
+        return f.read()
+
+
+def compare_update(fn, out_dir):
+    # (mode, patch seconds, rebuild seconds, same file)
+    lens = read_excel_data.read_excel_patent_data(fn, as_prescription=True)
+    new_lens = edited(lens)
+    stem = os.path.splitext(os.path.basename(fn))[0]
+    patch_fn = os.path.join(out_dir, stem + '_patched.zmx')
+    rebuild_fn = os.path.join(out_dir, stem + '_rebuilt.zmx')
+    zos = fake_zosapi.FakeZosapiApplication()
+    with contextlib.redirect_stdout(io.StringIO()):
+        incremental_import.update_patent_data_in_zemax(lens, zos, patch_fn)
+        t0 = time.perf_counter()
+        mode = incremental_import.update_patent_data_in_zemax(new_lens, zos, patch_fn)
+        t1 = time.perf_counter()
+        write_data_to_zemax.write_patent_data_to_zemax(new_lens, zos, rebuild_fn)
+        t2 = time.perf_counter()
+    return mode, t1 - t0, t2 - t1, read_text(patch_fn) == read_text(rebuild_fn)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Compare an incremental re-import with a full rebuild.')
+    parser.add_argument('workbooks', nargs='*', help='workbooks to import (default: the sample workbooks)')
+    args = parser.parse_args(argv)
+
+    files = args.workbooks if len(args.workbooks) > 0 else sample_workbooks()
+    n_differ = 0
+    print(f"{'workbook':28s} {'mode':>8s} {'patch ms':>9s} {'rebuild ms':>11s}  same")
+    with tempfile.TemporaryDirectory() as out_dir:
+        for fn in files:
+            mode, t_patch, t_rebuild, same = compare_update(fn, out_dir)
+            n_differ += int(not same)
+            print(f"{os.path.basename(fn):28s} {mode:>8s} {1000*t_patch:9.2f} {1000*t_rebuild:11.2f}  {same}")
+    return 0 if n_differ == 0 else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
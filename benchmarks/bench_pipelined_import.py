@@ -0,0 +1,84 @@
+# benchmark: serial vs pipelined (parse-ahead) batch import
+# runs on Linux without OpticStudio: writes go into fake_zosapi, and each write also
+# waits --write-ms to model the time OpticStudio spends on the system (a sleep, which
+# releases the GIL like a pythonnet call into OpticStudio does)
+#
+# usage (from the repo root):
+#   python benchmarks/bench_pipelined_import.py [--files 40] [--surfaces 200] [--write-ms 50] [--prefetch 1,2,4]
+
+import argparse
+import contextlib
+import io
+import os
+import sys
+import tempfile
+import time
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import batch_import
+import import_backends
+import pipelined_import
+import synthetic_workbook
+
+
+class SlowFakeBackend(import_backends.FakeZosapiBackend):
+    # fake_zosapi writes, plus a fixed wait per workbook
+    name = 'slow-fake'
+
+    def __init__(self, write_s):
+        super().__init__()
+        self.write_s = write_s
+
+    def write(self, lens_data, zos, out_fn):
+        super().write(lens_data, zos, out_fn)
+        time.sleep(self.write_s)
+
+
+def timed(fn):
+    t0 = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        results = fn()
+    return time.perf_counter() - t0, results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Serial vs pipelined batch import throughput.')
+    parser.add_argument('--files', type=int, default=40, help='number of workbooks')
+    parser.add_argument('--surfaces', type=int, default=200, help='surfaces per workbook')
+    parser.add_argument('--write-ms', type=float, default=50.0, help='simulated OpticStudio time per write, in ms')
+    parser.add_argument('--prefetch', default='1,2,4', help='comma separated prefetch depths')
+    parser.add_argument('--processes', action='store_true', help='also time process parsers')
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        files = []
+        for i in range(0, args.files):
+            fn = os.path.join(work_dir, f"synthetic_{i}.xlsx")
+            synthetic_workbook.synthetic_workbook(fn, n_surfaces=args.surfaces, n_aspheres=max(1, args.surfaces//5), seed=i)
+            files.append(fn)
+        backend = SlowFakeBackend(1e-3*args.write_ms)
+        zos = backend.connect()
+
+        cases = [('serial', lambda: batch_import.run_batch(files, zos, backend=backend))]
+        kinds = [pipelined_import.PARSER_THREAD] + ([pipelined_import.PARSER_PROCESS] if args.processes else [])
+        for kind in kinds:
+            for depth in [int(d) for d in args.prefetch.split(',')]:
+                cases.append((f"{kind} prefetch {depth}",
+                              lambda kind=kind, depth=depth: pipelined_import.run_pipelined(files, zos, backend=backend, prefetch=depth,
+                                                                                           parser_kind=kind)))
+
+        print(f"{args.files} workbooks x {args.surfaces} surfaces, {args.write_ms:g} ms simulated write")
+        print(f"{'case':22s} {'total s':>8s} {'files/s':>8s} {'writer wait s':>14s} {'failed':>7s}")
+        for name, fn in cases:
+            total, results = timed(fn)
+            wait = sum(r.get('wait_time', r['read_time']) for r in results)
+            n_failed = sum(1 for r in results if r['status'] != 'ok')
+            print(f"{name:22s} {total:8.2f} {len(results)/total:8.1f} {wait:14.2f} {n_failed:7d}")
+        backend.close(zos)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,75 @@
+# benchmark: streaming workbook parser vs. the original pd.read_excel block slicing
+# checks both readers give identical blocks, then times each on the sample workbooks
+#
+# usage (from the repo root):
+#   python benchmarks/bench_read_excel.py [--repeat N] [workbooks...]
+
+import argparse
+import glob
+import os
+import sys
+import time
+import tracemalloc
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+
+import read_excel_data
+
+
+def sample_workbooks():
+    files = glob.glob(os.path.join(REPO_DIR, '*', '*.xlsx'))
+    return sorted(f for f in files if not os.path.basename(f).startswith('~$'))
+
+
+def same_lens_data(a, b):
+    if list(a.keys()) != list(b.keys()):
+        return False
+    for key in a.keys():
+        if not a[key].equals(b[key]) or list(a[key].columns) != list(b[key].columns):
+            return False
+    return True
+
+
+def time_reader(reader, fn, repeat):
+    # best-of-N wall time, plus peak Python allocations of one call
+    best = float('inf')
+    for r in range(0, repeat):
+        t0 = time.perf_counter()
+        reader(fn)
+        best = min(best, time.perf_counter() - t0)
+    tracemalloc.start()
+    reader(fn)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return best, peak
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark the streaming workbook parser.')
+    parser.add_argument('workbooks', nargs='*', help='workbooks to parse (default: the sample workbooks)')
+    parser.add_argument('--repeat', type=int, default=5, help='timing repeats per workbook (best is reported)')
+    args = parser.parse_args(argv)
+
+    files = args.workbooks if len(args.workbooks) > 0 else sample_workbooks()
+    readers = [
+        ('pandas', read_excel_data.read_excel_patent_data_pandas),
+        ('stream', read_excel_data.read_excel_patent_data),
+        ]
+
+    print(f"{'workbook':28s} {'pandas ms':>10s} {'stream ms':>10s} {'speedup':>8s} {'pandas KiB':>11s} {'stream KiB':>11s}  same")
+    total = {name: 0.0 for name, reader in readers}
+    for fn in files:
+        same = same_lens_data(readers[0][1](fn), readers[1][1](fn))
+        times = {}
+        peaks = {}
+        for name, reader in readers:
+            times[name], peaks[name] = time_reader(reader, fn, args.repeat)
+            total[name] += times[name]
+        print(f"{os.path.basename(fn):28s} {1e3*times['pandas']:10.2f} {1e3*times['stream']:10.2f} "
+              f"{times['pandas']/times['stream']:7.2f}x {peaks['pandas']/1024:11.1f} {peaks['stream']/1024:11.1f}  {same}")
+    print(f"{'total':28s} {1e3*total['pandas']:10.2f} {1e3*total['stream']:10.2f} {total['pandas']/total['stream']:7.2f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,55 @@
+# benchmark: ZOS-API calls issued by each write stage
+# writes each workbook into a fake_zosapi system through zos_call_counter, so it runs
+# without OpticStudio; the counts are the cross-process calls a live import would make
+#
+# usage (from the repo root):
+#   python benchmarks/bench_zosapi_calls.py [--members] [workbooks...]
+
+import argparse
+import contextlib
+import glob
+import io
+import os
+import sys
+import tempfile
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+
+import fake_zosapi
+import read_excel_data
+import write_data_to_zemax
+import zos_call_counter
+
+
+def sample_workbooks():
+    files = glob.glob(os.path.join(REPO_DIR, '*', '*.xlsx'))
+    return sorted(f for f in files if not os.path.basename(f).startswith('~$'))
+
+
+def count_write_calls(fn, out_dir):
+    lens = read_excel_data.read_excel_patent_data(fn, as_prescription=True)
+    zos = fake_zosapi.FakeZosapiApplication()
+    counter = zos_call_counter.CallCounter()
+    out_fn = os.path.join(out_dir, os.path.splitext(os.path.basename(fn))[0] + '.zmx')
+    with contextlib.redirect_stdout(io.StringIO()):
+        write_data_to_zemax.write_patent_data_to_zemax(lens, zos, out_fn, call_counter=counter)
+    return lens, counter
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Count the ZOS-API calls of each write stage.')
+    parser.add_argument('workbooks', nargs='*', help='workbooks to import (default: the sample workbooks)')
+    parser.add_argument('--members', action='store_true', help='break each stage down by API member')
+    args = parser.parse_args(argv)
+
+    files = args.workbooks if len(args.workbooks) > 0 else sample_workbooks()
+    with tempfile.TemporaryDirectory() as out_dir:
+        for fn in files:
+            lens, counter = count_write_calls(fn, out_dir)
+            print(f"\n{os.path.basename(fn)}: {lens}")
+            counter.print_summary(members=args.members)
+
+
+if __name__ == '__main__':
+    main()
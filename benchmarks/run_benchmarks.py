@@ -0,0 +1,165 @@
+# benchmark runner: parse and write throughput over synthetic workbooks of growing size
+# runs on Linux without OpticStudio: writes go into fake_zosapi, every API call is counted
+# and can be given a simulated latency (--latency-us) to model the cross-process round trip
+#
+# reports, per lens size: parse time, ZOS-API write time and call count, .zmx write time,
+# and the log-log scaling exponent of each (1.0 = linear in the number of surfaces).
+# --save writes the results as JSON; --baseline compares against a saved run and exits
+# with status 1 when any timing regressed by more than --tolerance. the import-time
+# budget of the entry points (bench_import_time.py) is checked as well.
+#
+# usage (from the repo root):
+#   python benchmarks/run_benchmarks.py [--sizes 10,50,200,1000] [--latency-us 50] [--save bench.json]
+#   python benchmarks/run_benchmarks.py --baseline bench.json
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import bench_import_time
+import fake_zosapi
+import read_excel_data
+import synthetic_workbook
+import write_data_to_zemax
+import write_zmx_file
+import zos_call_counter
+
+# timings compared against a baseline
+TIMED_COLUMNS = ('parse_s', 'zosapi_write_s', 'zmx_write_s')
+
+
+def best_of(fn, repeat):
+    # best-of-N wall time, and the last result
+    best = float('inf')
+    result = None
+    for r in range(0, repeat):
+        t0 = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - t0)
+    return best, result
+
+
+def bench_size(n_surfaces, args, work_dir):
+    fn = os.path.join(work_dir, f"synthetic_{n_surfaces}.xlsx")
+    n_aspheres = max(1, int(n_surfaces * args.asphere_fraction))
+    synthetic_workbook.synthetic_workbook(fn, n_surfaces=n_surfaces, n_aspheres=n_aspheres, n_terms=args.terms,
+                                          n_configs=args.configs, n_fields=args.fields, seed=n_surfaces)
+
+    parse_s, lens = best_of(lambda: read_excel_data.read_excel_patent_data(fn, as_prescription=True), args.repeat)
+
+    def write_zosapi():
+        counter = zos_call_counter.CallCounter(latency=1e-6*args.latency_us)
+        zos = fake_zosapi.FakeZosapiApplication()
+        with contextlib.redirect_stdout(io.StringIO()):
+            write_data_to_zemax.write_patent_data_to_zemax(lens, zos, fn[:-5] + '_fake.zmx', call_counter=counter)
+        return counter
+    zosapi_write_s, counter = best_of(write_zosapi, args.repeat)
+
+    zmx_write_s, _ = best_of(lambda: write_zmx_file.write_patent_data_to_zmx(lens, fn[:-5] + '.zmx'), args.repeat)
+
+    return {
+        'surfaces': n_surfaces,
+        'aspheres': n_aspheres,
+        'workbook_kib': os.path.getsize(fn) / 1024,
+        'parse_s': parse_s,
+        'zosapi_write_s': zosapi_write_s,
+        'api_calls': counter.total(),
+        'stage_calls': counter.stage_totals(),
+        'zmx_write_s': zmx_write_s,
+        }
+
+
+def scaling_exponent(sizes, values):
+    # slope of log(value) vs log(size); needs at least two sizes
+    if len(sizes) < 2 or min(values) <= 0:
+        return float('nan')
+    return float(np.polyfit(np.log(sizes), np.log(values), 1)[0])
+
+
+def print_results(results, latency_us):
+    print(f"\nsimulated API latency: {latency_us:g} us/call")
+    print(f"{'surfaces':>8s} {'parse ms':>9s} {'surf/s':>9s} {'API write ms':>13s} {'API calls':>10s} {'calls/surf':>10s} "
+          f"{'zmx ms':>8s} {'surf/s':>9s}")
+    for r in results:
+        print(f"{r['surfaces']:8d} {1e3*r['parse_s']:9.2f} {r['surfaces']/r['parse_s']:9.0f} {1e3*r['zosapi_write_s']:13.2f} "
+              f"{r['api_calls']:10d} {r['api_calls']/r['surfaces']:10.2f} {1e3*r['zmx_write_s']:8.2f} "
+              f"{r['surfaces']/r['zmx_write_s']:9.0f}")
+    sizes = [r['surfaces'] for r in results]
+    print(f"{'scaling':>8s} {scaling_exponent(sizes, [r['parse_s'] for r in results]):9.2f} {'':9s} "
+          f"{scaling_exponent(sizes, [r['zosapi_write_s'] for r in results]):13.2f} "
+          f"{scaling_exponent(sizes, [r['api_calls'] for r in results]):10.2f} {'':10s} "
+          f"{scaling_exponent(sizes, [r['zmx_write_s'] for r in results]):8.2f}")
+
+
+def compare_to_baseline(results, baseline, tolerance):
+    # list of regressions: (surfaces, column, baseline value, new value)
+    base = {r['surfaces']: r for r in baseline['results']}
+    regressions = []
+    for r in results:
+        if r['surfaces'] not in base:
+            continue
+        for col in TIMED_COLUMNS + ('api_calls',):
+            old = base[r['surfaces']][col]
+            if r[col] > old * tolerance:
+                regressions.append((r['surfaces'], col, old, r[col]))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Parse/write throughput and scaling on synthetic workbooks.')
+    parser.add_argument('--sizes', default='10,50,200,1000', help='comma separated surface counts')
+    parser.add_argument('--terms', type=int, default=8, help='asphere coefficients per asphere surface')
+    parser.add_argument('--asphere-fraction', type=float, default=0.2, help='share of surfaces that are aspheres')
+    parser.add_argument('--configs', type=int, default=5, help='number of configurations')
+    parser.add_argument('--fields', type=int, default=9, help='number of fields')
+    parser.add_argument('--latency-us', type=float, default=0.0, help='simulated latency of each ZOS-API call, in us')
+    parser.add_argument('--repeat', type=int, default=3, help='timing repeats (best is reported)')
+    parser.add_argument('--save', default=None, help='write the results to this JSON file')
+    parser.add_argument('--baseline', default=None, help='compare against a JSON file written by --save')
+    parser.add_argument('--tolerance', type=float, default=1.25, help='allowed slowdown vs. the baseline (ratio)')
+    parser.add_argument('--skip-import-budget', action='store_true', help='do not check the import-time budget')
+    args = parser.parse_args(argv)
+
+    sizes = [int(s) for s in args.sizes.split(',')]
+    with tempfile.TemporaryDirectory() as work_dir:
+        results = [bench_size(n, args, work_dir) for n in sizes]
+    print_results(results, args.latency_us)
+
+    if args.save is not None:
+        with open(args.save, 'w') as f:
+            json.dump({'args': vars(args), 'results': results}, f, indent=1)
+
+    failed = False
+    if args.baseline is not None:
+        with open(args.baseline, 'r') as f:
+            baseline = json.load(f)
+        regressions = compare_to_baseline(results, baseline, args.tolerance)
+        for n, col, old, new in regressions:
+            print(f"REGRESSION: {n} surfaces, {col}: {old:.4g} -> {new:.4g} ({new/old:.2f}x)")
+        if len(regressions) > 0:
+            failed = True
+        else:
+            print(f"\nno regressions against {args.baseline} (tolerance {args.tolerance:g}x)")
+
+    if not args.skip_import_budget:
+        print()
+        violations = bench_import_time.check_import_budgets()
+        for v in violations:
+            print(f"OVER BUDGET: {v}")
+        failed = failed or (len(violations) > 0)
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
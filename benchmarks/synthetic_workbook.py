@@ -0,0 +1,120 @@
+# synthetic patent data workbooks, in the exact block layout read_excel_patent_data expects
+# (column 0: META/SURF/ASPH/CONF/WAVE, first row of each block is its header, rectangular sheet)
+# sizes are scalable, and the same seed always gives the same lens
+#
+# usage (from the repo root):
+#   python benchmarks/synthetic_workbook.py out.xlsx --surfaces 200 --aspheres 20 --terms 8 --configs 5 --fields 9
+
+import argparse
+
+import numpy as np
+
+# catalog glasses used for the catalog-material surfaces (all in SCHOTT)
+CATALOG_GLASSES = ['N-BK7', 'N-SF6', 'N-LAK34', 'SF2', 'N-SSK8', 'N-BK10', 'N-LAK10', 'N-SK16', 'F2']
+
+
+def synthetic_rows(n_surfaces=20, n_aspheres=2, n_terms=5, n_configs=3, n_fields=3, n_waves=3,
+                   catalog_fraction=0.5, semi_diameters=True, lens_unit='mm', seed=0):
+    # list of sheet rows (tuples, padded to one width); n_surfaces includes the object surface
+    rng = np.random.RandomState(seed)
+    n_surfaces = max(n_surfaces, 3)
+    rows = []
+
+    # META
+    rows.append(('META', 'lens_unit'))
+    rows.append(('META', lens_unit))
+
+    # SURF: object at infinity, then alternating glass/air, stop in the middle
+    stop = n_surfaces // 2
+    rows.append(('SURF', 'surf_num', 'r', 'd', 'nd', 'vd', 'cir'))
+    rows.append(('SURF', 'S0', 'Infinity', 'inf', None, None, None))
+    for s in range(1, n_surfaces):
+        name = f"S{s}_STO" if s == stop else f"S{s}"
+        if s == stop:
+            r = 'Infinity'
+        else:
+            r = round(float(rng.choice([-1, 1]) * rng.uniform(15, 250)), 4)
+        glass = (s % 2 == 1) and (s != stop) and (s < n_surfaces - 1)
+        if s == n_surfaces - 1:
+            d = round(float(rng.uniform(30, 50)), 4)
+        elif glass:
+            d = round(float(rng.uniform(1, 8)), 4)
+        else:
+            d = round(float(rng.uniform(0.1, 25)), 4)
+        nd = vd = None
+        if glass:
+            if rng.uniform() < catalog_fraction:
+                nd = str(rng.choice(CATALOG_GLASSES))
+                vd = 'SCHOTT'
+            else:
+                nd = round(float(rng.uniform(1.45, 1.95)), 8)
+                vd = round(float(rng.uniform(20, 80)), 6)
+        cir = round(float(rng.uniform(5, 20)), 3) if semi_diameters else None
+        rows.append(('SURF', name, r, d, nd, vd, cir))
+
+    # ASPH: even terms a_4, a_6, ... on distinct surfaces (never the object or stop)
+    candidates = [s for s in range(1, n_surfaces) if s != stop]
+    n_aspheres = min(n_aspheres, len(candidates))
+    if n_aspheres > 0:
+        asph_surf = sorted(rng.choice(candidates, n_aspheres, replace=False).tolist())
+        rows.append(tuple(['ASPH', 'surf_num', 'ka'] + [f"a_{4 + 2*i}" for i in range(0, n_terms)]))
+        for s in asph_surf:
+            coeffs = [float(f"{rng.uniform(-1, 1) * 10.0**(-4 - 2.5*i):.4g}") for i in range(0, n_terms)]
+            rows.append(tuple(['ASPH', int(s), round(float(rng.uniform(-2, 1)), 4)] + coeffs))
+
+    # CONF: zoom gaps (d_), fno, and field heights (y_)
+    rows.append(tuple(['CONF', 'name'] + [f"config_{c+1}" for c in range(0, n_configs)]))
+    air_gaps = [s for s in range(2, n_surfaces - 1, 2) if s != stop][:2] + [n_surfaces - 1]
+    for s in air_gaps:
+        rows.append(tuple(['CONF', f"d_{s}"] + [round(float(rng.uniform(1, 40)), 3) for c in range(0, n_configs)]))
+    rows.append(tuple(['CONF', 'fno'] + [round(2.8 + 0.5*c, 2) for c in range(0, n_configs)]))
+    for f in range(0, n_fields):
+        y = round(10.0 * f / max(n_fields - 1, 1), 3)
+        rows.append(tuple(['CONF', f"y_{f+1}"] + [y for c in range(0, n_configs)]))
+
+    # WAVE: spread over the visible, primary wavelength in the middle
+    rows.append(('WAVE', 'wave_num', 'wavelength_nm', 'weight'))
+    wavelengths = np.linspace(450, 650, n_waves) if n_waves > 1 else [587.562]
+    for w in range(0, n_waves):
+        name = f"w{w+1}_c" if w == n_waves // 2 else f"w{w+1}"
+        rows.append(('WAVE', name, round(float(wavelengths[w]), 3), 1))
+
+    width = max(len(r) for r in rows)
+    return [tuple(r) + (None,) * (width - len(r)) for r in rows]
+
+
+def write_workbook(fn, rows):
+    import openpyxl
+    wb = openpyxl.Workbook(write_only=True)
+    ws = wb.create_sheet()
+    for row in rows:
+        ws.append(list(row))
+    wb.save(fn)
+
+
+def synthetic_workbook(fn, **kwargs):
+    # write a synthetic workbook (see synthetic_rows for the size arguments); returns fn
+    write_workbook(fn, synthetic_rows(**kwargs))
+    return fn
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Write a synthetic patent data workbook.')
+    parser.add_argument('out_file', help='workbook to write (.xlsx)')
+    parser.add_argument('--surfaces', type=int, default=20, help='number of SURF rows, including the object')
+    parser.add_argument('--aspheres', type=int, default=2, help='number of asphere surfaces')
+    parser.add_argument('--terms', type=int, default=5, help='asphere coefficients per surface')
+    parser.add_argument('--configs', type=int, default=3, help='number of configurations')
+    parser.add_argument('--fields', type=int, default=3, help='number of fields')
+    parser.add_argument('--waves', type=int, default=3, help='number of wavelengths')
+    parser.add_argument('--catalog-fraction', type=float, default=0.5, help='share of glasses given as catalog names')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args(argv)
+
+    synthetic_workbook(args.out_file, n_surfaces=args.surfaces, n_aspheres=args.aspheres, n_terms=args.terms,
+                       n_configs=args.configs, n_fields=args.fields, n_waves=args.waves,
+                       catalog_fraction=args.catalog_fraction, seed=args.seed)
+
+
+if __name__ == '__main__':
+    main()
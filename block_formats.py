@@ -0,0 +1,281 @@
+# columnar input formats for patent data: CSV, JSON and Parquet next to .xlsx
+# each format holds the same block model as the workbook (read_excel_data.split_blocks),
+# and loads into the identical prescription, without unzipping and parsing Excel XML:
+#   .csv      the sheet layout as it is: column 1 is the block type, the first row of
+#             each block its header (what Excel's "save as CSV" gives)
+#   .json     {"blocks": {"SURF": {"names": [...], "columns": [[...], ...]}, ...}}
+#   .parquet  one row per cell: block, name, row, value (number) or text (string);
+#             row -1 holds the header, so the column order survives (needs pyarrow)
+# convert an xlsx corpus once (python block_formats.py <inputs> --to parquet), and
+# batch imports of that directory pick the converted copy (see preferred_inputs).
+#
+# usage:
+#   blocks = block_formats.read_blocks('lens.parquet')
+#   block_formats.convert_workbook('lens.xlsx', 'parquet')   # -> lens.parquet
+
+import argparse
+import csv
+import json
+import os
+import re
+import sys
+
+import numpy as np
+
+import read_excel_data
+
+XLSX_EXTENSIONS = ('.xlsx',)
+# fastest first: when a directory holds the same lens in several formats, the first
+# one that is up to date is imported
+FAST_EXTENSIONS = ('.parquet', '.json', '.csv')
+INPUT_EXTENSIONS = XLSX_EXTENSIONS + FAST_EXTENSIONS
+
+FORMATS = {'csv': '.csv', 'json': '.json', 'parquet': '.parquet'}
+
+# files the importer writes next to the workbooks, in the same formats: never inputs
+# (e.g. lens_ZemaxImport_LDE.csv, see write_data_to_zemax.lde_export_path)
+OUTPUT_SUFFIXES = ('_LDE',)
+
+JSON_FORMAT_NAME = 'zemax-xlsx-import-blocks'
+JSON_FORMAT_VERSION = 1
+
+# a CSV field that is a plain number (anything else, e.g. "INF", stays a string, as in Excel)
+CSV_NUMBER = re.compile(r'[-+]?(\d+\.?\d*|\.\d+)([eE][-+]?\d+)?$')
+
+
+def is_input_file(fn):
+    stem, ext = os.path.splitext(os.path.basename(fn))
+    return (ext.lower() in INPUT_EXTENSIONS) and not stem.endswith(OUTPUT_SUFFIXES)
+
+
+def _is_missing(value):
+    return (value is None) or (isinstance(value, float) and np.isnan(value))
+
+
+def _blocks_from_columns(items):
+    # split_blocks layout from (key, names, columns) triples; cells are converted the
+    # same way as workbook cells, so the prescription comes out identical
+    blocks = {}
+    for key, names, columns in items:
+        blocks[key] = {'names': list(names),
+                       'cols': list(range(1, len(names) + 1)),
+                       'data': [[read_excel_data.convert_cell(v) for v in column] for column in columns]}
+    return blocks
+
+
+# CSV
+
+def _csv_cell(field):
+    if len(field) < 1:
+        return None
+    if CSV_NUMBER.match(field):
+        return int(field) if field.lstrip('+-').isdigit() else float(field)
+    return field
+
+
+def iter_csv_rows(fn):
+    with open(fn, 'r', newline='', encoding='utf-8-sig') as f:
+        for row in csv.reader(f):
+            yield tuple(_csv_cell(field) for field in row)
+
+
+def read_csv_blocks(fn):
+    return read_excel_data.split_blocks(iter_csv_rows(fn))
+
+
+def _csv_field(value):
+    if _is_missing(value):
+        return ''
+    if isinstance(value, float):
+        # shortest repr that round-trips the float
+        return repr(value)
+    return str(value)
+
+
+def write_csv_blocks(blocks, fn):
+    with open(fn, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        for key, block in blocks.items():
+            writer.writerow([key] + list(block['names']))
+            for row in zip(*block['data']):
+                writer.writerow([key] + [_csv_field(v) for v in row])
+
+
+# JSON
+
+def read_json_blocks(fn):
+    with open(fn, 'r', encoding='utf-8') as f:
+        doc = json.load(f)
+    if doc.get('format') != JSON_FORMAT_NAME:
+        raise ValueError(f"{fn} is not a '{JSON_FORMAT_NAME}' file")
+    return _blocks_from_columns((key, block['names'], block['columns']) for key, block in doc['blocks'].items())
+
+
+def write_json_blocks(blocks, fn):
+    doc = {
+        'format': JSON_FORMAT_NAME,
+        'version': JSON_FORMAT_VERSION,
+        # empty cells are null (JSON has no NaN)
+        'blocks': {key: {'names': list(block['names']),
+                         'columns': [[None if _is_missing(v) else v for v in column] for column in block['data']]}
+                   for key, block in blocks.items()},
+        }
+    with open(fn, 'w', encoding='utf-8') as f:
+        json.dump(doc, f, separators=(',', ':'))
+
+
+# Parquet
+
+def read_parquet_blocks(fn):
+    import pyarrow.parquet as pq
+    table = pq.read_table(fn, columns=['block', 'name', 'row', 'value', 'text'])
+    # one pass over plain lists (numpy's tolist, much faster than arrow's to_pylist for
+    # the dictionary columns); a column's header entry (row -1) comes before its cells,
+    # and gives the column order
+    lists = [table.column(name).to_numpy(zero_copy_only=False).tolist() for name in table.column_names]
+    items = {}
+    columns = {}
+    for key, name, row, value, text in zip(*lists):
+        if row < 0:
+            items.setdefault(key, [])
+            items[key].append(name)
+            columns[(key, name)] = []
+            continue
+        column = columns[(key, name)]
+        if len(column) <= row:
+            column.extend([None]*(row + 1 - len(column)))
+        column[row] = text if text is not None else value
+    # pad every column of a block to the block length
+    blocks = []
+    for key, names in items.items():
+        n_rows = max([len(columns[(key, name)]) for name in names] + [0])
+        blocks.append((key, names, [columns[(key, name)] + [None]*(n_rows - len(columns[(key, name)])) for name in names]))
+    return _blocks_from_columns(blocks)
+
+
+def write_parquet_blocks(blocks, fn):
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    block_col, name_col, row_col, values, texts = [], [], [], [], []
+    for key, block in blocks.items():
+        for name, column in zip(block['names'], block['data']):
+            block_col.append(key)
+            name_col.append(name)
+            row_col.append(-1)
+            values.append(None)
+            texts.append(None)
+            for r, v in enumerate(column):
+                if _is_missing(v):
+                    continue
+                block_col.append(key)
+                name_col.append(name)
+                row_col.append(r)
+                values.append(None if isinstance(v, str) else float(v))
+                texts.append(v if isinstance(v, str) else None)
+    table = pa.table({
+        'block': pa.array(block_col, pa.string()).dictionary_encode(),
+        'name': pa.array(name_col, pa.string()).dictionary_encode(),
+        'row': pa.array(row_col, pa.int32()),
+        'value': pa.array(values, pa.float64()),
+        'text': pa.array(texts, pa.string()),
+        })
+    pq.write_table(table, fn, compression='zstd')
+
+
+READERS = {'.csv': read_csv_blocks, '.json': read_json_blocks, '.parquet': read_parquet_blocks}
+WRITERS = {'.csv': write_csv_blocks, '.json': write_json_blocks, '.parquet': write_parquet_blocks}
+
+
+def read_blocks(fn):
+    # split_blocks output of a CSV/JSON/Parquet file, by extension
+    ext = os.path.splitext(fn)[1].lower()
+    if ext not in READERS:
+        raise ValueError(f"unsupported input format '{ext}' (expected one of {INPUT_EXTENSIONS})")
+    return READERS[ext](fn)
+
+
+def write_blocks(blocks, fn):
+    ext = os.path.splitext(fn)[1].lower()
+    if ext not in WRITERS:
+        raise ValueError(f"unsupported output format '{ext}' (expected one of {FAST_EXTENSIONS})")
+    # write to a temp file, then rename, so a batch never picks up a partial file
+    tmp_fn = f"{fn}.{os.getpid()}.tmp{ext}"
+    WRITERS[ext](blocks, tmp_fn)
+    os.replace(tmp_fn, fn)
+
+
+def converted_path(fn, fmt, out_dir=None):
+    out_fn = os.path.splitext(fn)[0] + FORMATS[fmt]
+    if out_dir is not None:
+        out_fn = os.path.join(out_dir, os.path.basename(out_fn))
+    return out_fn
+
+
+def is_up_to_date(src, dst):
+    return os.path.isfile(dst) and (os.path.getmtime(dst) >= os.path.getmtime(src))
+
+
+def convert_workbook(fn, fmt, out_dir=None, force=False):
+    # write fn (any input format) as fmt; returns the new path, or None when it was already up to date
+    out_fn = converted_path(fn, fmt, out_dir)
+    if (not force) and is_up_to_date(fn, out_fn):
+        return None
+    write_blocks(read_excel_data.read_blocks(fn), out_fn)
+    return out_fn
+
+
+def preferred_inputs(files):
+    # one file per lens: of name.xlsx and its converted copies, the fastest format that
+    # is at least as new as the workbook
+    by_stem = {}
+    for fn in files:
+        by_stem.setdefault(os.path.splitext(fn)[0], []).append(fn)
+    preferred = []
+    for stem, group in by_stem.items():
+        if len(group) < 2:
+            preferred.append(group[0])
+            continue
+        exts = {os.path.splitext(fn)[1].lower(): fn for fn in group}
+        workbook = next((exts[ext] for ext in XLSX_EXTENSIONS if ext in exts), None)
+        choice = None
+        for ext in FAST_EXTENSIONS:
+            if (ext in exts) and ((workbook is None) or is_up_to_date(workbook, exts[ext])):
+                choice = exts[ext]
+                break
+        preferred.append(choice or workbook)
+    return preferred
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Convert patent data workbooks to a fast columnar format.')
+    parser.add_argument('inputs', nargs='+', help='workbook directories, glob patterns, or manifest files (.txt/.lst)')
+    parser.add_argument('--to', default='parquet', choices=sorted(FORMATS.keys()), help='output format (default: parquet)')
+    parser.add_argument('--out-dir', default=None, help='write the converted files here (default: next to each workbook)')
+    parser.add_argument('--force', action='store_true', help='convert even when the output is up to date')
+    args = parser.parse_args(argv)
+
+    import batch_import
+    files = [fn for fn in batch_import.find_workbooks(args.inputs, prefer_converted=False) if fn.lower().endswith(XLSX_EXTENSIONS)]
+    if len(files) < 1:
+        print("ERROR: no workbooks found")
+        return 1
+    if args.out_dir is not None:
+        os.makedirs(args.out_dir, exist_ok=True)
+    n_converted = 0
+    n_failed = 0
+    for fn in files:
+        try:
+            out_fn = convert_workbook(fn, args.to, args.out_dir, args.force)
+        except Exception as e:
+            print(f"ERROR: {fn}: {type(e).__name__}: {e}")
+            n_failed += 1
+            continue
+        if out_fn is not None:
+            print(f"wrote {out_fn}")
+            n_converted += 1
+    print(f"\nconverted {n_converted} of {len(files)} workbooks ({len(files) - n_converted - n_failed} up to date, {n_failed} failed)")
+    return 0 if n_failed == 0 else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
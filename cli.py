@@ -0,0 +1,109 @@
+# command-line import of patent data workbooks (no GUI dialog)
+# each heavy module is imported only by the stage that needs it: parsing loads
+# openpyxl/numpy, the ZOS-API write loads clr, and matplotlib is only loaded for --plot.
+# a --validate-only run never loads clr (or pandas/matplotlib/tkinter).
+#
+# usage:
+#   python cli.py lens.xlsx [more.xlsx ...] [--backend zosapi|zmx|fake] [--out-dir DIR]
+#   python cli.py lens.xlsx --validate-only [--paraxial] [--sag] [--glass-dir DIR]
+#   python cli.py lens.xlsx --display [--plot]
+
+import argparse
+import os
+import sys
+
+
+def read_workbook(fn, infer_catalogs=False, paraxial=False, glass_dir=None, sag=False):
+    # one read of the sheet: the raw blocks are preflight-checked, and only a clean
+    # workbook is built into a prescription. returns (prescription or None, issues)
+    import preflight_validator
+    import read_excel_data
+    blocks = read_excel_data.read_blocks(fn)
+    issues = preflight_validator.validate_blocks(blocks, fn, infer_catalogs, paraxial, glass_dir, sag)
+    if preflight_validator.has_errors(issues):
+        return None, issues
+    return read_excel_data.lens_data_from_blocks(blocks, as_prescription=True), issues
+
+
+def out_file_for(fn, out_dir=None):
+    import batch_import
+    out_file = batch_import.default_out_file(fn)
+    if out_dir is not None:
+        out_file = os.path.join(out_dir, os.path.basename(out_file))
+    return out_file
+
+
+def show_lde(zos, plot=False):
+    # LDE readback of the system just written (pandas, and matplotlib for plot, load here)
+    import write_data_to_zemax
+    lde = write_data_to_zemax.display_lde(zos.TheSystem)
+    if plot:
+        write_data_to_zemax.render_mpl_table(lde, col_width=1.0, font_size=10)
+
+
+def main(argv=None):
+    import import_backends # (light: each backend loads its modules when it connects)
+    parser = argparse.ArgumentParser(description='Import patent data workbooks into Zemax.')
+    parser.add_argument('files', nargs='+', help='workbooks to import (.xlsx, or .parquet/.json/.csv converted by block_formats.py)')
+    parser.add_argument('--backend', default='zosapi', choices=sorted(import_backends.BACKENDS),
+                        help="writer backend: 'zosapi' (default), 'zmx' or 'fake'")
+    parser.add_argument('--out-dir', default=None, help='write the .zmx files here (default: next to each workbook)')
+    parser.add_argument('--validate-only', action='store_true', help='parse and check the workbooks, write nothing')
+    parser.add_argument('--display', action='store_true', help='print the LDE after each import')
+    parser.add_argument('--plot', action='store_true', help='also show the LDE as a matplotlib table')
+    parser.add_argument('--lde-export', default=None, choices=['csv', 'parquet'], help='save the LDE next to each .zmx')
+    parser.add_argument('--paraxial', action='store_true', help='also check the first-order metrics (paraxial_trace), no OpticStudio needed')
+    parser.add_argument('--sag', action='store_true', help='also check the surface sags and edge thicknesses (asphere_sag_check)')
+    parser.add_argument('--glass-dir', default=None, help='with --paraxial/--sag, AGF glass catalog directory for the catalog glass indices')
+    args = parser.parse_args(argv)
+
+    # parse and validate everything first, so a bad workbook fails before OpticStudio starts
+    lenses = []
+    n_invalid = 0
+    for fn in args.files:
+        try:
+            # the zosapi backend infers a blank 'vd' catalog from its glass index
+            lens, issues = read_workbook(fn, infer_catalogs=(args.backend == 'zosapi'), paraxial=args.paraxial, glass_dir=args.glass_dir, sag=args.sag)
+        except Exception as e:
+            print(f"ERROR: {fn}: {type(e).__name__}: {e}")
+            n_invalid += 1
+            continue
+        for issue in issues:
+            print(f"{fn}: {issue}")
+        if lens is None:
+            n_invalid += 1
+            continue
+        print(f"ok: {fn}: {lens}")
+        lenses.append((fn, lens))
+
+    if args.validate_only or (len(lenses) < 1):
+        return 0 if n_invalid == 0 else 1
+
+    backend = import_backends.get_backend(args.backend)
+    backend.lde_export = args.lde_export
+    zos = backend.connect()
+    n_failed = 0
+    for fn, lens in lenses:
+        out_file = out_file_for(fn, args.out_dir)
+        try:
+            backend.write(lens, zos, out_file)
+        except Exception as e:
+            print(f"ERROR: {fn}: {type(e).__name__}: {e}")
+            n_failed += 1
+            continue
+        print(f"wrote {out_file}")
+        if args.display or args.plot:
+            if zos is None:
+                print(f"note: the {backend.name} backend has no LDE to display")
+            else:
+                show_lde(zos, args.plot)
+    backend.close(zos)
+    zos = None
+
+    if n_failed > 0:
+        return 2
+    return 0 if n_invalid == 0 else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,422 @@
+# in-process stand-in for the ZOSAPI objects touched by write_data_to_zemax.py
+# there is no OpticStudio behind it; it only keeps the values that are written,
+# so the import scheduler and writers can be exercised on Linux without a license.
+#
+# usage:
+#   zos = fake_zosapi.FakeZosapiApplication()
+#   write_data_to_zemax.write_patent_data_to_zemax(lens_data, zos, 'out.zmx')
+
+import copy
+import os
+import types
+
+import numpy as np
+
+
+class _Enum(object):
+    # minimal .NET enum stand-in; members compare by name
+    def __init__(self, enum_name, member):
+        self.enum_name = enum_name
+        self.member = member
+
+    def ToString(self):
+        return self.member
+
+    def __eq__(self, other):
+        return isinstance(other, _Enum) and (other.enum_name == self.enum_name) and (other.member == self.member)
+
+    def __hash__(self):
+        return hash((self.enum_name, self.member))
+
+    def __repr__(self):
+        return f"{self.enum_name}.{self.member}"
+
+
+def _make_enum(enum_name, members):
+    return types.SimpleNamespace(**{m: _Enum(enum_name, m) for m in members})
+
+
+def _make_zosapi_namespace():
+    # only the enums used by the writers
+    ZOSAPI = types.SimpleNamespace()
+    ZOSAPI.SystemData = types.SimpleNamespace(
+        ZemaxSystemUnits=_make_enum('ZemaxSystemUnits', ['Millimeters', 'Centimeters', 'Inches', 'Meters']),
+        RayAimingMethod=_make_enum('RayAimingMethod', ['Off', 'Paraxial', 'Real']),
+        ZemaxApertureType=_make_enum('ZemaxApertureType', ['EntrancePupilDiameter', 'ImageSpaceFNum', 'ObjectSpaceNA', 'FloatByStopSize', 'ParaxialWorkingFNum', 'ObjectConeAngle']),
+        FieldType=_make_enum('FieldType', ['Angle', 'ObjectHeight', 'ParaxialImageHeight', 'RealImageHeight', 'TheodoliteAngle']),
+        )
+    ZOSAPI.Editors = types.SimpleNamespace(
+        LDE=types.SimpleNamespace(SurfaceType=_make_enum('SurfaceType', ['Standard', 'EvenAspheric', 'OddAsphere', 'ExtendedOddAsphere'])),
+        SolveType=_make_enum('SolveType', ['Fixed', 'Variable', 'MaterialModel', 'Pickup']),
+        MCE=types.SimpleNamespace(MultiConfigOperandType=_make_enum('MultiConfigOperandType', [
+            'OFF', 'APER', 'YFIE', 'XFIE', 'THIC', 'CRVT', 'GLSS', 'WAVE', 'WLWT', 'PRAM', 'CONN', 'SDIA'])),
+        )
+    ZOSAPI.LicenseStatusType = _make_enum('LicenseStatusType', ['PremiumEdition', 'EnterpriseEdition', 'ProfessionalEdition', 'StandardEdition', 'OpticStudioHPCEdition'])
+    return ZOSAPI
+
+
+ZOSAPI = _make_zosapi_namespace()
+
+# the last system saved to each path in this process, with the text SaveAs wrote there;
+# LoadFile restores it while the file still holds that text (the fake cannot parse real
+# .zmx files), or after a rename to the path it is loaded from (write_data_to_zemax saves
+# through a temp directory). one entry per path, replaced on every save and moved on a
+# rename, so long batches stay bounded
+_saved_systems = {}
+
+
+class _Cell(object):
+    def __init__(self, value=0.0):
+        self.DoubleValue = value
+        self.IntegerValue = 0
+        self.Value = ''
+
+
+class _MaterialModel(object):
+    def __init__(self):
+        self.IndexNd = 1.5
+        self.AbbeVd = 40.0
+        self.dPgF = 0.0
+
+
+class _SolveData(object):
+    def __init__(self):
+        self._S_MaterialModel = _MaterialModel()
+
+
+class _MaterialCell(object):
+    def __init__(self, surface):
+        self._surface = surface
+        self.solve = None
+
+    def CreateSolveType(self, solve_type):
+        return _SolveData()
+
+    def SetSolveData(self, solve_data):
+        self.solve = solve_data
+        self._surface.Material = ''
+
+
+class FakeSurface(object):
+    def __init__(self, lde=None):
+        self._lde = lde
+        self._is_stop = False
+        self.Type = ZOSAPI.Editors.LDE.SurfaceType.Standard
+        self.Comment = ''
+        self.Radius = np.inf
+        self.Thickness = 0.0
+        self.Material = ''
+        self.SemiDiameter = 0.0
+        self.MechanicalSemiDiameter = 0.0
+        self.ChipZone = 0.0
+        self.Conic = 0.0
+        self.MaterialCell = _MaterialCell(self)
+        self._cells = {}
+
+    @property
+    def IsStop(self):
+        return self._is_stop
+
+    @IsStop.setter
+    def IsStop(self, value):
+        # there is only one stop surface in a system
+        if value and (self._lde is not None):
+            for surf in self._lde._surfaces:
+                surf._is_stop = False
+        self._is_stop = bool(value)
+
+    def GetSurfaceTypeSettings(self, surface_type):
+        return surface_type
+
+    def ChangeType(self, settings):
+        self.Type = settings
+        self._cells = {}
+
+    def GetCellAt(self, index):
+        if index not in self._cells:
+            self._cells[index] = _Cell()
+        return self._cells[index]
+
+
+class FakeLDE(object):
+    def __init__(self):
+        # a new system has OBJ, STO and IMA
+        self._surfaces = [FakeSurface(self), FakeSurface(self), FakeSurface(self)]
+        self._surfaces[1].IsStop = True
+
+    @property
+    def NumberOfSurfaces(self):
+        return len(self._surfaces)
+
+    def GetSurfaceAt(self, index):
+        return self._surfaces[int(index)]
+
+    def InsertNewSurfaceAt(self, index):
+        surface = FakeSurface(self)
+        self._surfaces.insert(int(index), surface)
+        return surface
+
+
+class _Operand(object):
+    def __init__(self, mce):
+        self._mce = mce
+        self.Type = ZOSAPI.Editors.MCE.MultiConfigOperandType.OFF
+        self.Param1 = 0
+        self.Param2 = 0
+        self.Param3 = 0
+        self._cells = {}
+
+    def ChangeType(self, operand_type):
+        self.Type = operand_type
+
+    def GetOperandCell(self, config):
+        config = int(config)
+        if (config < 1) or (config > self._mce.NumberOfConfigurations):
+            raise IndexError(f"configuration {config} out of range")
+        if config not in self._cells:
+            self._cells[config] = _Cell()
+        return self._cells[config]
+
+
+class FakeMCE(object):
+    def __init__(self):
+        self.NumberOfConfigurations = 1
+        # a new system has one (OFF) operand row
+        self._operands = [_Operand(self)]
+
+    @property
+    def NumberOfOperands(self):
+        return len(self._operands)
+
+    def AddConfiguration(self, with_pickups):
+        self.NumberOfConfigurations += 1
+        return True
+
+    def AddOperand(self):
+        op = _Operand(self)
+        self._operands.append(op)
+        return op
+
+    def GetOperandAt(self, index):
+        return self._operands[int(index) - 1]
+
+
+class _Wavelength(object):
+    def __init__(self, wavelength=0.55, weight=1.0):
+        self.Wavelength = wavelength
+        self.Weight = weight
+        self.IsPrimary = False
+        self._owner = None
+
+    def MakePrimary(self):
+        for w in self._owner._waves:
+            w.IsPrimary = False
+        self.IsPrimary = True
+
+
+class FakeWavelengths(object):
+    def __init__(self):
+        self._waves = []
+        self.AddWavelength(0.55, 1.0).MakePrimary()
+
+    @property
+    def NumberOfWavelengths(self):
+        return len(self._waves)
+
+    def GetWavelength(self, index):
+        return self._waves[int(index) - 1]
+
+    def AddWavelength(self, wavelength, weight):
+        w = _Wavelength(wavelength, weight)
+        w._owner = self
+        self._waves.append(w)
+        return w
+
+
+class _Field(object):
+    def __init__(self, x=0.0, y=0.0, weight=1.0):
+        self.X = x
+        self.Y = y
+        self.Weight = weight
+
+
+class FakeFields(object):
+    def __init__(self):
+        self._fields = [_Field()]
+        self.FieldType = ZOSAPI.SystemData.FieldType.Angle
+
+    @property
+    def NumberOfFields(self):
+        return len(self._fields)
+
+    def SetFieldType(self, field_type):
+        self.FieldType = field_type
+
+    def GetField(self, index):
+        return self._fields[int(index) - 1]
+
+    def AddField(self, x, y, weight):
+        f = _Field(x, y, weight)
+        self._fields.append(f)
+        return f
+
+
+class _AllMaterials(object):
+    # used when no material table is given: every name is accepted
+    def __contains__(self, name):
+        return True
+
+
+class FakeMaterialCatalogs(object):
+    def __init__(self, materials=None):
+        # materials: optional dict {catalog: [material names]}
+        self._materials = materials
+        if materials is None:
+            self._available = ['SCHOTT', 'OHARA', 'HOYA', 'CDGM', 'SUMITA', 'HIKARI', 'NIKON', 'CORNING', 'INFRARED', 'MISC']
+        else:
+            self._available = list(materials.keys())
+        self._in_use = ['SCHOTT']
+
+    def GetAvailableCatalogs(self):
+        return list(self._available)
+
+    def GetCatalogsInUse(self):
+        return list(self._in_use)
+
+    def AddCatalog(self, catalog):
+        if catalog not in self._in_use:
+            self._in_use.append(catalog)
+        return True
+
+    def RemoveCatalog(self, catalog):
+        if catalog in self._in_use:
+            self._in_use.remove(catalog)
+        return True
+
+    def GetMaterialsInCatalog(self, catalog):
+        if self._materials is None:
+            return _AllMaterials()
+        return list(self._materials.get(catalog, []))
+
+
+class FakeSystemData(object):
+    def __init__(self, materials=None):
+        self.Units = types.SimpleNamespace(LensUnits=ZOSAPI.SystemData.ZemaxSystemUnits.Millimeters)
+        self.RayAiming = types.SimpleNamespace(RayAiming=ZOSAPI.SystemData.RayAimingMethod.Off)
+        self.Aperture = types.SimpleNamespace(ApertureType=ZOSAPI.SystemData.ZemaxApertureType.EntrancePupilDiameter, ApertureValue=0.0)
+        self.Wavelengths = FakeWavelengths()
+        self.Fields = FakeFields()
+        self.MaterialCatalogs = FakeMaterialCatalogs(materials)
+
+
+class FakeOpticalSystem(object):
+    def __init__(self, materials=None):
+        self._materials = materials
+        self.SystemFile = ''
+        self.New(False)
+
+    def New(self, saveIfNeeded):
+        self.LDE = FakeLDE()
+        self.MCE = FakeMCE()
+        self.SystemData = FakeSystemData(self._materials)
+        self.SystemFile = ''
+
+    def LoadFile(self, filepath, saveIfNeeded):
+        # restores a system saved by this process; other files load as a new system
+        if not os.path.isfile(filepath):
+            return False
+        last_fn = self.SystemFile
+        self.New(False)
+        with open(filepath, 'r', errors='replace') as fid:
+            text = fid.read()
+        saved = _saved_systems.get(os.path.abspath(filepath))
+        if ((saved is None) or (saved[0] != text)) and (last_fn != '') and not os.path.exists(last_fn):
+            # the file this system was last saved to, since renamed to filepath
+            last = _saved_systems.get(os.path.abspath(last_fn))
+            if (last is not None) and (last[0] == text):
+                saved = _saved_systems[os.path.abspath(filepath)] = _saved_systems.pop(os.path.abspath(last_fn))
+        if (saved is not None) and (saved[0] == text):
+            self.LDE, self.MCE, self.SystemData = copy.deepcopy(saved[1])
+        self.SystemFile = filepath
+        return True
+
+    def Close(self, save):
+        self.New(False)
+
+    def Save(self):
+        self.SaveAs(self.SystemFile)
+
+    def SaveAs(self, filepath):
+        # write a plain text summary of the system, so batches produce real files
+        lines = ['FAKE ZOSAPI SYSTEM']
+        lines.append(f"UNIT {self.SystemData.Units.LensUnits.ToString()}")
+        for s in range(0, self.LDE.NumberOfSurfaces):
+            surf = self.LDE.GetSurfaceAt(s)
+            lines.append(f"SURF {s} {surf.Type.ToString()} '{surf.Comment}' R={surf.Radius} T={surf.Thickness} "
+                         f"M='{surf.Material}' SD={surf.SemiDiameter} K={surf.Conic} STOP={int(surf.IsStop)}")
+            # cells that were set (a read-only GetCellAt leaves 0 behind)
+            cells = [f"{c}={cell.IntegerValue or cell.DoubleValue}" for c, cell in sorted(surf._cells.items())
+                     if (cell.IntegerValue != 0) or (cell.DoubleValue != 0)]
+            if len(cells) > 0:
+                lines.append(f"  CELLS {' '.join(cells)}")
+        for w in range(1, self.SystemData.Wavelengths.NumberOfWavelengths + 1):
+            wave = self.SystemData.Wavelengths.GetWavelength(w)
+            lines.append(f"WAVE {w} {wave.Wavelength} {wave.Weight} PRIMARY={int(wave.IsPrimary)}")
+        for f in range(1, self.SystemData.Fields.NumberOfFields + 1):
+            field = self.SystemData.Fields.GetField(f)
+            lines.append(f"FIELD {f} {field.X} {field.Y} {field.Weight}")
+        lines.append(f"MCE {self.MCE.NumberOfConfigurations} configs, {self.MCE.NumberOfOperands} operands")
+        for i in range(1, self.MCE.NumberOfOperands + 1):
+            op = self.MCE.GetOperandAt(i)
+            cells = [op._cells[c].Value or op._cells[c].DoubleValue if c in op._cells else '-'
+                     for c in range(1, self.MCE.NumberOfConfigurations + 1)]
+            lines.append(f"MCOP {i} {op.Type.ToString()} {op.Param1} {op.Param2} {' '.join(str(v) for v in cells)}")
+        text = '\n'.join(lines) + '\n'
+        with open(filepath, 'w') as fid:
+            fid.write(text)
+        _saved_systems[os.path.abspath(filepath)] = (text, copy.deepcopy((self.LDE, self.MCE, self.SystemData)))
+        self.SystemFile = filepath
+        return True
+
+
+class FakeApplication(object):
+    def __init__(self, materials=None):
+        self.PrimarySystem = FakeOpticalSystem(materials)
+        self.GlassDir = ''
+        self.IsValidLicenseForAPI = True
+        self.LicenseStatus = ZOSAPI.LicenseStatusType.PremiumEdition
+        self.SamplesDir = ''
+
+    def CloseApplication(self):
+        pass
+
+
+class FakeZosapiApplication(object):
+    # mirrors the interface of initialize_zemax_connection.ZosapiApplication
+    class SystemNotPresentException(Exception):
+        pass
+
+    def __init__(self, path=None, materials=None):
+        self.ZOSAPI = ZOSAPI
+        self.TheConnection = None
+        self.TheApplication = FakeApplication(materials)
+        self.TheSystem = self.TheApplication.PrimarySystem
+
+    def __del__(self):
+        self.TheApplication = None
+
+    def OpenFile(self, filepath, saveIfNeeded):
+        if self.TheSystem is None:
+            raise FakeZosapiApplication.SystemNotPresentException("Unable to acquire Primary system")
+        self.TheSystem.LoadFile(filepath, saveIfNeeded)
+
+    def CloseFile(self, save):
+        if self.TheSystem is None:
+            raise FakeZosapiApplication.SystemNotPresentException("Unable to acquire Primary system")
+        self.TheSystem.Close(save)
+
+    def SamplesDir(self):
+        return self.TheApplication.SamplesDir
+
+    def ExampleConstants(self):
+        return "Premium"
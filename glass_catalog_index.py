@@ -0,0 +1,186 @@
+# persistent material -> catalog index for glass validation and catalog selection
+# built once per OpticStudio installation by parsing the AGF glass catalogs offline
+# (or, when no AGF files can be read, from MaterialCatalogs through ZOS-API),
+# saved as JSON, and rebuilt automatically when any AGF file is added, removed or modified.
+#
+# usage:
+#   index = glass_catalog_index.load_glass_index(zos.TheApplication.GlassDir)
+#   index.has_material('SCHOTT', 'N-BK7')        # dict lookups, no API round trips
+#   index.infer_catalog('N-BK7')                 # -> 'SCHOTT' (for a blank 'vd' column)
+#   index.resolve_catalogs(lens)                 # fill in blank catalogs of a LensPrescription
+
+import json
+import os
+
+import numpy as np
+
+from lens_prescription import MATERIAL_CATALOG
+
+INDEX_VERSION = 1
+DEFAULT_INDEX_FILE = os.path.join(os.path.expanduser('~'), '.zemax_xlsx_import', 'glass_catalog_index.json')
+
+# catalogs searched first when a glass name is found in several catalogs
+PREFERRED_CATALOGS = ['SCHOTT', 'OHARA', 'HOYA', 'CDGM', 'SUMITA', 'HIKARI', 'NIKON']
+
+
+class GlassCatalogIndex(object):
+
+    def __init__(self, catalogs=None, nd=None, source='', agf_mtimes=None):
+        # catalogs: {catalog: [material names]}, nd: {catalog: {material: nd}}
+        self.catalogs = {c: set(names) for c, names in (catalogs or {}).items()}
+        self.nd = nd or {}
+        self.source = source
+        self.agf_mtimes = agf_mtimes or {}
+        self._build_material_lookup()
+
+    def _build_material_lookup(self):
+        # material name -> catalogs that contain it, preferred catalogs first
+        order = [c for c in PREFERRED_CATALOGS if c in self.catalogs]
+        order += sorted(c for c in self.catalogs if c not in PREFERRED_CATALOGS)
+        self.material_catalogs = {}
+        for c in order:
+            for name in self.catalogs[c]:
+                self.material_catalogs.setdefault(name, []).append(c)
+
+    def has_catalog(self, catalog):
+        return catalog in self.catalogs
+
+    def has_material(self, catalog, material):
+        return material in self.catalogs.get(catalog, ())
+
+    def infer_catalog(self, material, catalogs_in_use=()):
+        # catalog for a glass name; catalogs already in use win, then PREFERRED_CATALOGS
+        found = self.material_catalogs.get(material, [])
+        for c in catalogs_in_use:
+            if c in found:
+                return c
+        return found[0] if len(found) > 0 else ''
+
+    def index_of_refraction(self, material, catalog=''):
+        # catalog nd of a glass (nan if unknown)
+        if len(catalog) < 1:
+            catalog = self.infer_catalog(material)
+        return self.nd.get(catalog, {}).get(material, np.nan)
+
+    def resolve_catalogs(self, Prescription):
+        # fill in blank catalogs of catalog-glass surfaces, in place
+        # returns the surfaces whose glass could not be found in any catalog
+        surfaces = np.flatnonzero(Prescription.material_kind == MATERIAL_CATALOG).tolist()
+        named = [str(Prescription.catalog[s]) for s in surfaces if len(Prescription.catalog[s]) > 0]
+        catalog = Prescription.catalog.tolist()
+        unresolved = []
+        for s in surfaces:
+            if len(catalog[s]) > 0:
+                continue
+            c = self.infer_catalog(str(Prescription.glass[s]), named)
+            if len(c) < 1:
+                unresolved.append(s)
+                continue
+            catalog[s] = c
+            named.append(c)
+        Prescription.catalog = np.array(catalog, dtype=str)
+        return unresolved
+
+    def to_json(self):
+        return {
+            'version': INDEX_VERSION,
+            'source': self.source,
+            'agf_mtimes': self.agf_mtimes,
+            'catalogs': {c: sorted(names) for c, names in self.catalogs.items()},
+            'nd': self.nd,
+            }
+
+    @classmethod
+    def from_json(cls, data):
+        return cls(data['catalogs'], data.get('nd', {}), data.get('source', ''), data.get('agf_mtimes', {}))
+
+
+def agf_files(glass_dir):
+    # one listing matched on the lower-cased name: globbing *.agf and *.AGF lists every file
+    # twice on a case-insensitive file system (Windows), and misses e.g. SCHOTT.Agf elsewhere
+    if not os.path.isdir(glass_dir):
+        return []
+    return sorted(os.path.join(glass_dir, fn) for fn in os.listdir(glass_dir) if fn.lower().endswith('.agf'))
+
+
+def agf_mtimes(glass_dir):
+    # {file name: mtime} of every AGF file; any difference means the index is stale
+    return {os.path.basename(fn): os.path.getmtime(fn) for fn in agf_files(glass_dir)}
+
+
+def _read_agf_text(fn):
+    # AGF files are either UTF-16 (with BOM) or plain 8-bit text
+    with open(fn, 'rb') as f:
+        raw = f.read()
+    if raw[:2] in (b'\xff\xfe', b'\xfe\xff'):
+        return raw.decode('utf-16')
+    return raw.decode('latin-1')
+
+
+def parse_agf(fn):
+    # {material: nd} of one catalog; 'NM <name> <formula> <MIL#> <Nd> <Vd> ...' lines
+    materials = {}
+    for line in _read_agf_text(fn).splitlines():
+        if not line.startswith('NM '):
+            continue
+        fields = line.split()
+        if len(fields) < 2:
+            continue
+        try:
+            nd = float(fields[4])
+        except (IndexError, ValueError):
+            nd = float('nan')
+        materials[fields[1]] = nd
+    return materials
+
+
+def build_index_from_agf(glass_dir):
+    catalogs = {}
+    nd = {}
+    for fn in agf_files(glass_dir):
+        catalog = os.path.splitext(os.path.basename(fn))[0].upper()
+        materials = parse_agf(fn)
+        catalogs[catalog] = list(materials.keys())
+        nd[catalog] = materials
+    return GlassCatalogIndex(catalogs, nd, glass_dir, agf_mtimes(glass_dir))
+
+
+def build_index_from_api(TheSystem, glass_dir=''):
+    # one GetMaterialsInCatalog call per catalog, once per installation
+    material_catalogs = TheSystem.SystemData.MaterialCatalogs
+    catalogs = {}
+    for c in material_catalogs.GetAvailableCatalogs():
+        catalogs[str(c)] = [str(m) for m in material_catalogs.GetMaterialsInCatalog(c)]
+    mtimes = agf_mtimes(glass_dir) if glass_dir else {}
+    return GlassCatalogIndex(catalogs, {}, glass_dir, mtimes)
+
+
+def save_glass_index(index, index_fn=DEFAULT_INDEX_FILE):
+    os.makedirs(os.path.dirname(os.path.abspath(index_fn)), exist_ok=True)
+    tmp_fn = f"{index_fn}.{os.getpid()}.tmp"
+    with open(tmp_fn, 'w') as f:
+        json.dump(index.to_json(), f)
+    os.replace(tmp_fn, index_fn)
+
+
+def load_glass_index(glass_dir, index_fn=DEFAULT_INDEX_FILE, TheSystem=None, rebuild=False):
+    # load the saved index, rebuilding it when the AGF files changed (or rebuild=True)
+    glass_dir = str(glass_dir) if glass_dir else ''
+    if not rebuild:
+        try:
+            with open(index_fn, 'r') as f:
+                data = json.load(f)
+            if (data.get('version') == INDEX_VERSION) and (data.get('source') == glass_dir) \
+                    and (data.get('agf_mtimes') == (agf_mtimes(glass_dir) if glass_dir else {})):
+                return GlassCatalogIndex.from_json(data)
+        except (OSError, ValueError, KeyError):
+            pass
+
+    if glass_dir and len(agf_files(glass_dir)) > 0:
+        index = build_index_from_agf(glass_dir)
+    elif TheSystem is not None:
+        index = build_index_from_api(TheSystem, glass_dir)
+    else:
+        raise FileNotFoundError(f"no AGF glass catalogs found in '{glass_dir}'")
+    save_glass_index(index, index_fn)
+    return index
@@ -0,0 +1,119 @@
+# pluggable connection/writer backends for the import runners
+# a backend opens a connection, writes one lens into it, and closes it again
+#
+#   'zosapi' : live OpticStudio through ZOS-API (requires Windows and a license)
+#   'fake'   : fake_zosapi, no OpticStudio behind it (for load tests on Linux)
+#   'zmx'    : write_zmx_file, writes the .zmx text directly (no OpticStudio, no license)
+#
+# backends are looked up by name, so they can be passed to worker processes
+
+
+class ImportBackend(object):
+    # base backend: subclasses override connect() and write()
+    name = ''
+    # glass_catalog_index.GlassCatalogIndex used by the writers (None: validate through the API)
+    glass_index = None
+    # 'csv'/'parquet' to save the LDE readback next to each output (None: no readback)
+    lde_export = None
+
+    def connect(self):
+        raise NotImplementedError
+
+    def writer_version(self):
+        # version of what write() produces (see import_manifest)
+        import write_data_to_zemax
+        return write_data_to_zemax.WRITER_VERSION
+
+    def write(self, lens_data, zos, out_fn):
+        import write_data_to_zemax
+        write_data_to_zemax.write_patent_data_to_zemax(lens_data, zos, out_fn, self.glass_index, lde_export=self.lde_export)
+
+    def update(self, lens_data, zos, out_fn):
+        # patch the previous import when possible; returns 'patched', 'unchanged' or 'rebuilt'
+        import incremental_import
+        return incremental_import.update_patent_data_in_zemax(lens_data, zos, out_fn, self.glass_index, self.lde_export,
+                                                              self.writer_version())
+
+    def close(self, zos):
+        # dropping the last reference closes OpticStudio (see ZosapiApplication.__del__)
+        del zos
+
+
+class ZosapiBackend(ImportBackend):
+    name = 'zosapi'
+
+    def __init__(self, path=None, use_glass_index=True):
+        self.path = path
+        self.use_glass_index = use_glass_index
+
+    def connect(self):
+        # imported here so other backends never load clr/winreg
+        import initialize_zemax_connection
+        zos = initialize_zemax_connection.ZosapiApplication(self.path)
+        if self.use_glass_index and (self.glass_index is None):
+            # built once per installation, then reloaded from disk until the AGF files change
+            import glass_catalog_index
+            try:
+                self.glass_index = glass_catalog_index.load_glass_index(zos.TheApplication.GlassDir, TheSystem=zos.TheSystem)
+            except Exception as e:
+                print(f"warning: no glass catalog index ({e}); validating glasses through the API")
+        return zos
+
+
+class FakeZosapiBackend(ImportBackend):
+    name = 'fake'
+
+    def __init__(self, materials=None):
+        self.materials = materials
+
+    def connect(self):
+        import fake_zosapi
+        return fake_zosapi.FakeZosapiApplication(materials=self.materials)
+
+
+class ZmxFileBackend(ImportBackend):
+    name = 'zmx'
+
+    def __init__(self, glass_dir=None):
+        # glass_dir (optional): AGF directory, used to fill in blank glass catalogs
+        self.glass_dir = glass_dir
+
+    def connect(self):
+        # nothing to connect to
+        if self.glass_dir and (self.glass_index is None):
+            import glass_catalog_index
+            self.glass_index = glass_catalog_index.load_glass_index(self.glass_dir)
+        return None
+
+    def writer_version(self):
+        import write_zmx_file
+        return write_zmx_file.WRITER_VERSION
+
+    def write(self, lens_data, zos, out_fn):
+        import write_zmx_file
+        write_zmx_file.write_patent_data_to_zmx(lens_data, out_fn, self.glass_index)
+
+    def update(self, lens_data, zos, out_fn):
+        # a full rewrite is already cheaper than diffing
+        self.write(lens_data, zos, out_fn)
+        return 'rebuilt'
+
+    def close(self, zos):
+        pass
+
+
+BACKENDS = {
+    'zosapi': ZosapiBackend,
+    'fake': FakeZosapiBackend,
+    'zmx': ZmxFileBackend,
+    }
+
+
+def register_backend(name, backend_class):
+    BACKENDS[name] = backend_class
+
+
+def get_backend(name, **kwargs):
+    if name not in BACKENDS:
+        raise ValueError(f"unknown import backend '{name}'; expected one of {sorted(BACKENDS.keys())}")
+    return BACKENDS[name](**kwargs)
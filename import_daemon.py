@@ -0,0 +1,500 @@
+# resident import service: keeps warm OpticStudio sessions, so a conversion costs
+# about as much as the writes alone instead of a full ZosapiApplication start-up
+#
+# each session is a worker process holding one connection (one license seat; the
+# standalone ZOS-API allows one application per process). jobs arrive over a localhost
+# socket as JSON lines, wait in an asyncio queue for an idle session, and their status
+# is streamed back to the client. after every job the session is health-checked and
+# recycled (restarted) when it died, reached --max-jobs, or grew past --max-rss-mb.
+#
+# protocol (one JSON object per line, both ways):
+#   {"op": "import", "file": "C:/lenses/a.xlsx", "out_file": null, "update": false}
+#       -> {"job": 1, "status": "queued", ...}, {"job": 1, "status": "running", "session": 0},
+#          {"job": 1, "status": "ok"/"failed", "out_file": ..., "error": ..., "total_time": ...}
+#   {"op": "status"}    -> sessions, queue length, jobs done
+#   {"op": "ping"}      -> {"status": "pong"}
+#   {"op": "shutdown"}  -> {"status": "shutting down"}
+#
+# usage:
+#   python import_daemon.py serve --backend zosapi --sessions 2
+#   python import_daemon.py submit lens1.xlsx lens2.xlsx [--update]
+#   python import_daemon.py status | stop
+
+import argparse
+import asyncio
+import itertools
+import json
+import multiprocessing as mp
+import os
+import queue
+import socket
+import sys
+import time
+
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = 47211
+
+# seconds between checks on session health while waiting for results
+POLL_INTERVAL = 0.5
+
+# final job states
+JOB_DONE_STATES = ('ok', 'failed')
+
+
+def process_rss():
+    # resident memory of this process in bytes (None when it cannot be measured)
+    try:
+        import psutil
+        return psutil.Process().memory_info().rss
+    except ImportError:
+        pass
+    if sys.platform == 'win32':
+        return _working_set_size()
+    try:
+        import resource
+    except ImportError:
+        return None
+    # peak rather than current, but enough to spot a leak; bytes on macOS, kB elsewhere
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return max_rss if sys.platform == 'darwin' else max_rss*1024
+
+
+def _working_set_size():
+    # current working set of this process on Windows (no resource module there)
+    import ctypes
+    from ctypes import wintypes
+
+    class PROCESS_MEMORY_COUNTERS(ctypes.Structure):
+        _fields_ = [('cb', wintypes.DWORD), ('PageFaultCount', wintypes.DWORD)] + \
+                   [(name, ctypes.c_size_t) for name in ('PeakWorkingSetSize', 'WorkingSetSize', 'QuotaPeakPagedPoolUsage',
+                                                         'QuotaPagedPoolUsage', 'QuotaPeakNonPagedPoolUsage',
+                                                         'QuotaNonPagedPoolUsage', 'PagefileUsage', 'PeakPagefileUsage')]
+
+    counters = PROCESS_MEMORY_COUNTERS()
+    counters.cb = ctypes.sizeof(counters)
+    GetCurrentProcess = ctypes.windll.kernel32.GetCurrentProcess
+    GetCurrentProcess.restype = wintypes.HANDLE
+    GetProcessMemoryInfo = ctypes.windll.psapi.GetProcessMemoryInfo
+    GetProcessMemoryInfo.argtypes = [wintypes.HANDLE, ctypes.POINTER(PROCESS_MEMORY_COUNTERS), wintypes.DWORD]
+    if not GetProcessMemoryInfo(GetCurrentProcess(), ctypes.byref(counters), counters.cb):
+        return None
+    return counters.WorkingSetSize
+
+
+def _session_main(session_id, backend_name, task_queue, result_queue, cache_dir=None, cache_max_bytes=None, lde_export=None):
+    # runs in the session process: connect once, then import jobs until a None job arrives
+    import batch_import
+    import import_backends
+    cache = None
+    if cache_dir is not None:
+        import parse_cache
+        cache = parse_cache.ParseCache(cache_dir, cache_max_bytes or parse_cache.DEFAULT_MAX_BYTES)
+    t0 = time.perf_counter()
+    try:
+        backend = import_backends.get_backend(backend_name)
+        backend.lde_export = lde_export
+        zos = backend.connect()
+    except Exception as e:
+        result_queue.put(('connect_failed', session_id, f"{type(e).__name__}: {e}"))
+        return
+    result_queue.put(('ready', session_id, (time.perf_counter() - t0, process_rss())))
+
+    while True:
+        job = task_queue.get()
+        if job is None:
+            break
+        result = batch_import.import_workbook(job['file'], zos, job['out_file'], backend=backend, cache=cache,
+                                              update=job['update'])
+        result_queue.put(('done', session_id, (job['job'], result, process_rss())))
+
+    backend.close(zos)
+    zos = None
+
+
+class Job(object):
+    __slots__ = ('id', 'file', 'out_file', 'update', 'writer', 'status', 'session', 'result', 't_submit')
+
+    def __init__(self, job_id, file, out_file, update, writer):
+        self.id = job_id
+        self.file = file
+        self.out_file = out_file
+        self.update = update
+        self.writer = writer  # client stream the status goes to
+        self.status = 'queued'
+        self.session = None
+        self.result = None
+        self.t_submit = time.perf_counter()
+
+    def task(self):
+        return {'job': self.id, 'file': self.file, 'out_file': self.out_file, 'update': self.update}
+
+
+class Session(object):
+    # one warm connection, in its own process
+
+    def __init__(self, session_id, process, task_queue):
+        self.id = session_id
+        self.process = process
+        self.task_queue = task_queue
+        self.state = 'starting'  # starting, idle, busy, stopping, dead
+        self.job = None
+        self.jobs_done = 0
+        self.rss = None
+        self.connect_time = None
+
+    def info(self):
+        return {'session': self.id, 'pid': self.process.pid, 'state': self.state, 'jobs_done': self.jobs_done,
+                'rss_mb': None if self.rss is None else self.rss / 2**20, 'connect_time': self.connect_time}
+
+
+class ImportDaemon(object):
+
+    def __init__(self, backend_name='zosapi', n_sessions=1, host=DEFAULT_HOST, port=DEFAULT_PORT, max_jobs=500,
+                 max_rss_bytes=None, cache_dir=None, cache_max_bytes=None, lde_export=None, max_restarts=None):
+        import import_backends
+        import_backends.get_backend(backend_name) # fail early on an unknown backend name
+        self.backend_name = backend_name
+        self.n_sessions = n_sessions
+        self.host = host
+        self.port = port
+        self.max_jobs = max_jobs
+        self.max_rss_bytes = max_rss_bytes
+        self.cache_dir = cache_dir
+        self.cache_max_bytes = cache_max_bytes
+        self.lde_export = lde_export
+        self.max_restarts = n_sessions*10 if max_restarts is None else max_restarts
+        self.restarts = 0
+        self.recycles = 0
+        self.jobs_done = 0
+
+        # spawn (not fork): pythonnet/.NET state must never be shared between processes
+        self._ctx = mp.get_context('spawn')
+        self._result_queue = self._ctx.Queue()
+        self._sessions = {}
+        self._session_ids = itertools.count()
+        self._job_ids = itertools.count(1)
+        self._jobs = {}
+        self._pending = None      # asyncio.Queue of Job
+        self._idle = None         # asyncio.Queue of Session
+        self._waiting = None      # Job taken off the queue by _dispatch, waiting for an idle session
+        self._no_session = ''     # why no session is left running ('' while there is one)
+        self._stopping = None
+
+    # --- sessions
+
+    def _start_session(self):
+        session_id = next(self._session_ids)
+        task_queue = self._ctx.Queue()
+        p = self._ctx.Process(target=_session_main, args=(session_id, self.backend_name, task_queue, self._result_queue,
+                                                          self.cache_dir, self.cache_max_bytes, self.lde_export), daemon=True)
+        p.start()
+        self._sessions[session_id] = Session(session_id, p, task_queue)
+        return session_id
+
+    def _stop_session(self, session):
+        session.state = 'stopping'
+        session.task_queue.put(None)
+        self._sessions.pop(session.id, None)
+
+    def _replace_session(self, session, reason, crashed=False):
+        # recycling a healthy session is routine; only crashes count against max_restarts
+        self._log(f"session {session.id}: {reason}, starting a new one")
+        if session.process.is_alive():
+            self._stop_session(session)
+        else:
+            session.state = 'dead'
+            self._sessions.pop(session.id, None)
+        if crashed:
+            if self.restarts >= self.max_restarts:
+                self._log("ERROR: too many session restarts, not starting more")
+                if len(self._sessions) < 1:
+                    self._fail_pending("too many session restarts")
+                return
+            self.restarts += 1
+        self._start_session()
+
+    def _needs_recycle(self, session):
+        if session.jobs_done >= self.max_jobs:
+            return f"recycled after {session.jobs_done} jobs"
+        if (self.max_rss_bytes is not None) and (session.rss is not None) and (session.rss > self.max_rss_bytes):
+            return f"recycled at {session.rss/2**20:.0f} MiB"
+        return ''
+
+    # --- results from the session processes
+
+    def _handle_message(self, msg):
+        kind, session_id, payload = msg
+        session = self._sessions.get(session_id)
+        if session is None:
+            return
+        if kind == 'ready':
+            session.connect_time, session.rss = payload
+            session.state = 'idle'
+            self._log(f"session {session_id} ready ({session.connect_time:.1f} s to connect)")
+            self._idle.put_nowait(session)
+        elif kind == 'connect_failed':
+            self._log(f"session {session_id}: connect failed: {payload}")
+            self._sessions.pop(session_id, None)
+            session.state = 'dead'
+            if len(self._sessions) < 1:
+                self._fail_pending(f"no session could connect: {payload}")
+        elif kind == 'done':
+            job_id, result, session.rss = payload
+            session.jobs_done += 1
+            session.job = None
+            self.jobs_done += 1
+            self._finish_job(self._jobs.pop(job_id, None), result)
+            reason = self._needs_recycle(session)
+            if reason:
+                self.recycles += 1
+                self._replace_session(session, reason)
+            else:
+                session.state = 'idle'
+                self._idle.put_nowait(session)
+
+    def _check_sessions(self):
+        # a session process that died takes its job with it
+        for session in list(self._sessions.values()):
+            if session.process.is_alive() or session.state == 'stopping':
+                continue
+            job = self._jobs.pop(session.job, None) if session.job is not None else None
+            if job is not None:
+                self._finish_job(job, {'file': job.file, 'out_file': job.out_file, 'status': 'failed',
+                                       'error': f"session {session.id} died (exit code {session.process.exitcode})",
+                                       'total_time': time.perf_counter() - job.t_submit})
+            self._replace_session(session, f"died (exit code {session.process.exitcode})", crashed=True)
+
+    async def _pump_results(self):
+        loop = asyncio.get_running_loop()
+
+        def get():
+            try:
+                return self._result_queue.get(timeout=POLL_INTERVAL)
+            except queue.Empty:
+                return None
+
+        while not self._stopping.is_set():
+            msg = await loop.run_in_executor(None, get)
+            if msg is not None:
+                self._handle_message(msg)
+            self._check_sessions()
+
+    # --- jobs
+
+    async def _dispatch(self):
+        # hand each queued job to the next idle session
+        while True:
+            job = await self._pending.get()
+            self._waiting = job
+            while True:
+                session = await self._idle.get()
+                if (session.id in self._sessions) and (session.state == 'idle'):
+                    break
+            self._waiting = None
+            if job.id not in self._jobs:
+                # failed while it waited (see _fail_pending); the session is still free
+                self._idle.put_nowait(session)
+                continue
+            session.state = 'busy'
+            session.job = job.id
+            job.status = 'running'
+            job.session = session.id
+            self._send(job.writer, {'job': job.id, 'status': 'running', 'session': session.id, 'file': job.file})
+            session.task_queue.put(job.task())
+
+    def _submit(self, msg, writer):
+        import batch_import
+        job = Job(next(self._job_ids), os.path.abspath(msg['file']), None, bool(msg.get('update', False)), writer)
+        job.out_file = msg.get('out_file') or batch_import.default_out_file(job.file)
+        if len(self._sessions) < 1:
+            # nothing left to run it: answer now instead of queueing it forever
+            self._finish_job(job, {'status': 'failed', 'error': f"no session is running: {self._no_session}"})
+            return job
+        self._jobs[job.id] = job
+        self._pending.put_nowait(job)
+        self._send(writer, {'job': job.id, 'status': 'queued', 'file': job.file, 'out_file': job.out_file,
+                            'queue_length': self._pending.qsize()})
+        return job
+
+    def _finish_job(self, job, result):
+        if job is None:
+            return
+        job.status = result['status']
+        job.result = result
+        self._send(job.writer, {'job': job.id, 'status': result['status'], 'file': job.file,
+                                'out_file': result.get('out_file', job.out_file), 'error': result.get('error', ''),
+                                'mode': result.get('mode'), 'read_time': result.get('read_time'),
+                                'write_time': result.get('write_time'), 'total_time': time.perf_counter() - job.t_submit})
+
+    def _fail_pending(self, reason):
+        # no session is left: fail the queued jobs, and the one _dispatch holds
+        self._no_session = reason
+        jobs = [self._waiting] if self._waiting is not None else []
+        self._waiting = None
+        while not self._pending.empty():
+            jobs.append(self._pending.get_nowait())
+        for job in jobs:
+            self._jobs.pop(job.id, None)
+            self._finish_job(job, {'status': 'failed', 'error': reason})
+
+    # --- clients
+
+    def _send(self, writer, obj):
+        if (writer is None) or writer.is_closing():
+            return
+        writer.write((json.dumps(obj) + '\n').encode())
+
+    def status(self):
+        return {'status': 'running', 'backend': self.backend_name, 'sessions': [s.info() for s in self._sessions.values()],
+                'queue_length': self._pending.qsize(), 'jobs_done': self.jobs_done, 'restarts': self.restarts,
+                'recycles': self.recycles}
+
+    async def _handle_client(self, reader, writer):
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                try:
+                    msg = json.loads(line)
+                    op = msg.get('op')
+                except (ValueError, AttributeError):
+                    self._send(writer, {'status': 'error', 'error': 'expected one JSON object per line'})
+                    continue
+                if op == 'import':
+                    if 'file' not in msg:
+                        self._send(writer, {'status': 'error', 'error': "import needs a 'file'"})
+                    else:
+                        self._submit(msg, writer)
+                elif op == 'status':
+                    self._send(writer, self.status())
+                elif op == 'ping':
+                    self._send(writer, {'status': 'pong'})
+                elif op == 'shutdown':
+                    self._send(writer, {'status': 'shutting down'})
+                    self._stopping.set()
+                else:
+                    self._send(writer, {'status': 'error', 'error': f"unknown op '{op}'"})
+                await writer.drain()
+        except (ConnectionError, asyncio.CancelledError):
+            # client went away, or the daemon is shutting down
+            pass
+        finally:
+            # jobs of a client that went away still run; their status is dropped
+            writer.close()
+
+    def _log(self, msg):
+        print(f"[{time.strftime('%H:%M:%S')}] {msg}", flush=True)
+
+    async def serve(self):
+        self._pending = asyncio.Queue()
+        self._idle = asyncio.Queue()
+        self._stopping = asyncio.Event()
+        for s in range(0, self.n_sessions):
+            self._start_session()
+        server = await asyncio.start_server(self._handle_client, self.host, self.port)
+        self._log(f"import daemon ({self.backend_name}, {self.n_sessions} sessions) listening on {self.host}:{self.port}")
+        tasks = [asyncio.create_task(self._pump_results()), asyncio.create_task(self._dispatch())]
+        async with server:
+            await self._stopping.wait()
+        for task in tasks:
+            task.cancel()
+        self.shutdown()
+
+    def shutdown(self, timeout=30):
+        self._log("shutting down")
+        sessions = list(self._sessions.values())
+        for session in sessions:
+            self._stop_session(session)
+        for session in sessions:
+            session.process.join(timeout)
+
+
+# --- client side (plain sockets: no asyncio/pandas/clr to import, so it starts fast)
+
+def request(messages, host=DEFAULT_HOST, port=DEFAULT_PORT, on_message=None, timeout=None):
+    # send messages to the daemon; returns the replies, reading until every import job is
+    # done (or until one reply per non-import message); on_message is called as they arrive
+    with socket.create_connection((host, port), timeout=timeout) as sock:
+        sock.sendall(''.join(json.dumps(m) + '\n' for m in messages).encode())
+        f = sock.makefile('r')
+        # every message gets exactly one final reply (imports also stream 'queued'/'running')
+        replies = []
+        n_final = 0
+        while n_final < len(messages):
+            line = f.readline()
+            if not line:
+                break
+            reply = json.loads(line)
+            replies.append(reply)
+            if on_message is not None:
+                on_message(reply)
+            if ('job' not in reply) or (reply['status'] in JOB_DONE_STATES):
+                n_final += 1
+        return replies
+
+
+def submit(files, host=DEFAULT_HOST, port=DEFAULT_PORT, update=False, verbose=True):
+    # import files through a running daemon; returns the final status of each job
+    messages = [{'op': 'import', 'file': os.path.abspath(fn), 'update': update} for fn in files]
+
+    def show(reply):
+        if verbose and ('job' in reply):
+            extra = f" {reply['total_time']:.2f} s  {reply['out_file']}" if reply['status'] in JOB_DONE_STATES else ''
+            print(f"job {reply['job']}: {reply['status']:8s} {os.path.basename(reply['file'])}{extra}")
+            if reply['status'] == 'failed':
+                print(f"    {reply['error']}")
+
+    replies = request(messages, host, port, on_message=show)
+    return [r for r in replies if ('job' in r) and (r['status'] in JOB_DONE_STATES)]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Resident Zemax import service with warm OpticStudio sessions.')
+    parser.add_argument('--host', default=DEFAULT_HOST)
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT)
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    serve = commands.add_parser('serve', help='run the daemon')
+    serve.add_argument('--backend', default='zosapi', help='writer backend (default: zosapi)')
+    serve.add_argument('--sessions', type=int, default=1, help='number of warm sessions (one license seat each)')
+    serve.add_argument('--max-jobs', type=int, default=500, help='recycle a session after this many jobs')
+    serve.add_argument('--max-rss-mb', type=float, default=None, help='recycle a session that grows past this size')
+    serve.add_argument('--cache-dir', default=None, help='reuse parsed workbooks from this cache directory')
+    serve.add_argument('--cache-max-mb', type=float, default=256, help='size cap of the parse cache, in MiB (default: 256)')
+    serve.add_argument('--lde-export', default=None, choices=['csv', 'parquet'], help='save the LDE next to each .zmx')
+
+    submit_cmd = commands.add_parser('submit', help='import workbooks through a running daemon')
+    submit_cmd.add_argument('files', nargs='+')
+    submit_cmd.add_argument('--update', action='store_true', help='patch the previous import instead of rebuilding it')
+
+    commands.add_parser('status', help='show the sessions of a running daemon')
+    commands.add_parser('stop', help='shut down a running daemon')
+    args = parser.parse_args(argv)
+
+    if args.command == 'serve':
+        max_rss = None if args.max_rss_mb is None else int(args.max_rss_mb*2**20)
+        if (max_rss is not None) and (process_rss() is None):
+            print("warning: cannot measure session memory on this system (install psutil); --max-rss-mb is ignored")
+        daemon = ImportDaemon(args.backend, args.sessions, args.host, args.port, args.max_jobs, max_rss,
+                              args.cache_dir, int(args.cache_max_mb*2**20), args.lde_export)
+        try:
+            asyncio.run(daemon.serve())
+        except KeyboardInterrupt:
+            daemon.shutdown()
+        return 0
+
+    try:
+        if args.command == 'submit':
+            results = submit(args.files, args.host, args.port, args.update)
+            return 0 if all(r['status'] == 'ok' for r in results) and len(results) == len(args.files) else 2
+        op = 'status' if args.command == 'status' else 'shutdown'
+        print(json.dumps(request([{'op': op}], args.host, args.port)[0], indent=1))
+        return 0
+    except ConnectionRefusedError:
+        print(f"ERROR: no import daemon listening on {args.host}:{args.port}")
+        return 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
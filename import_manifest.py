@@ -0,0 +1,189 @@
+# resumable corpus imports: a manifest of how each workbook was last imported
+# one JSON line per import (input content hash, parser and writer versions, backend,
+# output and status), appended and flushed as each workbook finishes, so a batch that
+# dies half-way (license drop, OpticStudio crash) keeps everything it already did.
+# on load the last line of each input wins; a line torn by a crash is ignored.
+#
+# a workbook is up to date, and skipped on a rerun, when its last import succeeded with
+# the same content, parser version, writer version and backend, and its output is still
+# the file that import wrote. failed, changed and new workbooks are imported again.
+#
+# usage:
+#   manifest = import_manifest.ImportManifest('corpus_manifest.jsonl')
+#   todo, skipped = manifest.plan(files, backend)      # skipped: up to date
+#   manifest.record(result, backend)                   # after each import
+#   manifest.close()                                   # rewrites it, one line per input
+
+import json
+import os
+import time
+
+import parse_cache
+import read_excel_data
+
+MANIFEST_VERSION = 1
+
+# rewrite the manifest on load when it holds this many lines per input
+COMPACT_RATIO = 4
+
+
+def _stat_key(fn):
+    # (size, mtime_ns): an unchanged stat means the recorded hash still holds
+    st = os.stat(fn)
+    return [st.st_size, st.st_mtime_ns]
+
+
+class ImportManifest(object):
+    # one writer per manifest file (the batch runners record results in the main process)
+
+    def __init__(self, path):
+        self.path = path
+        self.entries = {}    # abspath of the input -> last entry
+        self._digests = {}   # abspath of the input -> (sha256, stat) seen in this run
+        self._fid = None
+        self._torn = False   # the file ends in a partial line
+        n_lines = self._load()
+        if n_lines > COMPACT_RATIO*max(1, len(self.entries)):
+            self.compact()
+
+    def _load(self):
+        if not os.path.isfile(self.path):
+            return 0
+        n_lines = 0
+        with open(self.path, 'r', encoding='utf-8') as f:
+            for line in f:
+                n_lines += 1
+                self._torn = not line.endswith('\n')
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    # torn last line of a crashed batch
+                    continue
+                if entry.get('manifest_version') != MANIFEST_VERSION:
+                    continue
+                self.entries[entry['file']] = entry
+        return n_lines
+
+    def digest(self, fn):
+        # (sha256, stat) of the input; reuses the recorded hash while the file's stat is
+        # unchanged. taken once per run, so a record matches what plan() compared
+        fn = os.path.abspath(fn)
+        if fn in self._digests:
+            return self._digests[fn]
+        entry = self.entries.get(fn)
+        stat = _stat_key(fn)
+        if (entry is not None) and (entry.get('input_stat') == stat):
+            digest = entry['sha256']
+        else:
+            digest = parse_cache.file_digest(fn)
+        self._digests[fn] = (digest, stat)
+        return digest, stat
+
+    def is_current(self, fn, out_fn, backend):
+        # True when fn's last import is still valid (see the header)
+        fn = os.path.abspath(fn)
+        entry = self.entries.get(fn)
+        if (entry is None) or (entry['status'] != 'ok'):
+            return False
+        if ((entry['parser_version'] != read_excel_data.PARSER_VERSION) or (entry['backend'] != backend.name)
+                or (entry['writer_version'] != backend.writer_version())):
+            return False
+        if (entry['out_file'] != os.path.abspath(out_fn)) or (not os.path.isfile(out_fn)):
+            return False
+        if entry['output_stat'] != _stat_key(out_fn):
+            return False
+        try:
+            return self.digest(fn)[0] == entry['sha256']
+        except OSError:
+            return False
+
+    def plan(self, files, backend, out_files=None, force=False):
+        # (files to import, result dicts of the up-to-date ones); force imports everything
+        import batch_import
+        if out_files is None:
+            out_files = [batch_import.default_out_file(fn) for fn in files]
+        todo = []
+        skipped = []
+        for fn, out_fn in zip(files, out_files):
+            if (not force) and self.is_current(fn, out_fn, backend):
+                skipped.append(skipped_result(fn, out_fn))
+            else:
+                todo.append(fn)
+        return todo, skipped
+
+    def record(self, result, backend):
+        # append the entry of one finished import (any status); flushed to disk right away
+        fn = os.path.abspath(result['file'])
+        out_fn = os.path.abspath(result['out_file'])
+        entry = {
+            'manifest_version': MANIFEST_VERSION,
+            'file': fn,
+            'sha256': None,
+            'input_stat': None,
+            'parser_version': read_excel_data.PARSER_VERSION,
+            'writer_version': backend.writer_version(),
+            'backend': backend.name,
+            'out_file': out_fn,
+            'output_stat': None,
+            'status': result['status'],
+            'error': result.get('error', ''),
+            'time': time.time(),
+            }
+        try:
+            entry['sha256'], entry['input_stat'] = self.digest(fn)
+        except OSError:
+            pass
+        if (result['status'] == 'ok') and os.path.isfile(out_fn):
+            entry['output_stat'] = _stat_key(out_fn)
+        elif result['status'] == 'ok':
+            # nothing on disk to be current against
+            entry['status'] = 'failed'
+            entry['error'] = 'output file missing after import'
+        self.entries[fn] = entry
+        if self._fid is None:
+            self._fid = open(self.path, 'a', encoding='utf-8')
+            if self._torn:
+                # end the torn line, so it does not swallow this entry
+                self._fid.write('\n')
+                self._torn = False
+        self._fid.write(json.dumps(entry) + '\n')
+        self._fid.flush()
+        os.fsync(self._fid.fileno())
+
+    def compact(self):
+        # rewrite the manifest with one line per input, through a temp file and a rename
+        if self._fid is not None:
+            self._fid.close()
+            self._fid = None
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            for entry in self.entries.values():
+                f.write(json.dumps(entry) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+        self._torn = False
+
+    def close(self):
+        if len(self.entries) > 0:
+            self.compact()
+
+    def counts(self):
+        # {status: number of inputs}
+        counts = {}
+        for entry in self.entries.values():
+            counts[entry['status']] = counts.get(entry['status'], 0) + 1
+        return counts
+
+
+def skipped_result(excel_file, out_file):
+    # result dict of a workbook whose output is already up to date (it is not imported)
+    return {
+        'file': excel_file,
+        'out_file': out_file,
+        'status': 'skipped',
+        'error': '',
+        'read_time': 0.0,
+        'write_time': 0.0,
+        'total_time': 0.0,
+        }
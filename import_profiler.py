@@ -0,0 +1,222 @@
+# per-stage instrumentation of the import
+# records wall time and ZOS-API calls (through zos_call_counter) of each parse/write
+# stage, and the total of each workbook; python allocations (tracemalloc) on request
+#
+# enabled by the ZEMAX_IMPORT_PROFILE environment variable (or batch_import --profile):
+#   ZEMAX_IMPORT_PROFILE=summary          # per-stage summary table at the end of the run
+#   ZEMAX_IMPORT_PROFILE=jsonl            # one JSON line per stage on stdout, as it finishes
+#   ZEMAX_IMPORT_PROFILE=profile.jsonl    # ... appended to this file
+#   ZEMAX_IMPORT_PROFILE=summary+alloc    # any of the above, plus net/peak allocations per stage
+#   ZEMAX_IMPORT_CPROFILE_DIR=prof/       # also dump a cProfile file per stage and workbook
+# when off, stage() returns a shared no-op context manager
+#
+# +alloc traces allocations only while a stage runs, but that still slows pure-python
+# stages (parsing) several times more than the ZOS-API stages, which wait on OpticStudio:
+# compare the wall times of a run without it. tracemalloc's peak is process-wide, so a
+# stage that overlaps another (parser threads, nested stages) records no bytes (None).
+#
+# usage:
+#   profiler = import_profiler.get_profiler()
+#   with profiler.workbook('lens.xlsx'):
+#       with profiler.stage('set_surface_data', call_counter):
+#           ...
+#   profiler.report()
+
+import collections
+import contextlib
+import json
+import os
+import sys
+import threading
+import time
+
+PROFILE_ENV = 'ZEMAX_IMPORT_PROFILE'
+ALLOC_SUFFIX = '+alloc'
+CPROFILE_ENV = 'ZEMAX_IMPORT_CPROFILE_DIR'
+
+_NULL_CONTEXT = contextlib.nullcontext()
+
+
+class StageProfiler(object):
+
+    def __init__(self, mode='', cprofile_dir=None):
+        # mode: '' (off), 'summary' (or '1'), 'jsonl', or a .jsonl file name, each with an
+        # optional '+alloc' to also trace allocations
+        self.alloc = mode.lower().endswith(ALLOC_SUFFIX)
+        if self.alloc:
+            mode = mode[:-len(ALLOC_SUFFIX)] or 'summary'
+        if mode.lower() in ('1', 'true', 'on'):
+            mode = 'summary'
+        self.mode = mode
+        self.enabled = len(mode) > 0
+        self.cprofile_dir = cprofile_dir
+        self.records = []
+        # per thread, so parser threads (pipelined_import) label their own stages
+        self._local = threading.local()
+        self._cprofile_active = False
+        # allocation tracing: the stages running now (each a [overlapped] flag), and
+        # whether this profiler started tracemalloc (and so stops it again)
+        self._alloc_lock = threading.Lock()
+        self._alloc_stages = []
+        self._started_tracing = False
+        if cprofile_dir:
+            os.makedirs(cprofile_dir, exist_ok=True)
+
+    @property
+    def workbook_name(self):
+        return getattr(self._local, 'workbook_name', '')
+
+    @workbook_name.setter
+    def workbook_name(self, name):
+        self._local.workbook_name = name
+
+    def stage(self, name, call_counter=None):
+        # context manager recording one stage (call_counter: zos_call_counter.CallCounter, optional)
+        if not self.enabled:
+            if call_counter is not None:
+                return call_counter.stage(name)
+            return _NULL_CONTEXT
+        return self._profile_stage(name, call_counter)
+
+    def workbook(self, fn):
+        # context manager around all stages of one workbook
+        if not self.enabled:
+            return _NULL_CONTEXT
+        return self._profile_workbook(fn)
+
+    @contextlib.contextmanager
+    def _profile_workbook(self, fn):
+        previous = self.workbook_name
+        self.workbook_name = os.path.basename(fn)
+        t0 = time.perf_counter()
+        try:
+            yield self
+        finally:
+            self._add_record('total', time.perf_counter() - t0, 0, None, None)
+            self.workbook_name = previous
+
+    def _start_alloc(self):
+        # returns this stage's [overlapped] flag, and its starting traced memory
+        import tracemalloc
+        with self._alloc_lock:
+            stage = [len(self._alloc_stages) > 0]
+            for other in self._alloc_stages:
+                other[0] = True
+            self._alloc_stages.append(stage)
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+                self._started_tracing = True
+            tracemalloc.reset_peak()
+            return stage, tracemalloc.get_traced_memory()[0]
+
+    def _stop_alloc(self, stage, mem0):
+        # (net bytes, peak bytes) of the stage, None when it overlapped another
+        import tracemalloc
+        with self._alloc_lock:
+            mem1, peak = tracemalloc.get_traced_memory()
+            self._alloc_stages.remove(stage)
+            if (len(self._alloc_stages) < 1) and self._started_tracing:
+                tracemalloc.stop()
+                self._started_tracing = False
+        if stage[0]:
+            return None, None
+        return mem1 - mem0, peak - mem0
+
+    @contextlib.contextmanager
+    def _profile_stage(self, name, call_counter):
+        alloc = self._start_alloc() if self.alloc else None
+        calls0 = sum(call_counter.counts[name].values()) if call_counter is not None else 0
+
+        profile = None
+        if self.cprofile_dir and not self._cprofile_active:
+            import cProfile
+            profile = cProfile.Profile()
+            self._cprofile_active = True
+            profile.enable()
+
+        counter_stage = call_counter.stage(name) if call_counter is not None else _NULL_CONTEXT
+        t0 = time.perf_counter()
+        try:
+            with counter_stage:
+                yield self
+        finally:
+            wall = time.perf_counter() - t0
+            if profile is not None:
+                profile.disable()
+                self._cprofile_active = False
+                stem = os.path.splitext(self.workbook_name)[0] or 'run'
+                profile.dump_stats(os.path.join(self.cprofile_dir, f"{stem}.{name}.{os.getpid()}.prof"))
+            net_bytes, peak_bytes = self._stop_alloc(*alloc) if alloc is not None else (None, None)
+            calls = sum(call_counter.counts[name].values()) - calls0 if call_counter is not None else 0
+            self._add_record(name, wall, calls, net_bytes, peak_bytes)
+
+    def _add_record(self, stage, wall, api_calls, net_bytes, peak_bytes):
+        record = {
+            'workbook': self.workbook_name,
+            'stage': stage,
+            'wall_s': wall,
+            'api_calls': api_calls,
+            'net_bytes': net_bytes,
+            'peak_bytes': peak_bytes,
+            'pid': os.getpid(),
+            }
+        self.records.append(record)
+        if self.mode == 'jsonl':
+            print(json.dumps(record), flush=True)
+        elif self.mode.endswith('.jsonl'):
+            # one short append per record, so several worker processes can share the file
+            with open(self.mode, 'a') as f:
+                f.write(json.dumps(record) + '\n')
+
+    def summary(self):
+        # {stage: {'n', 'wall_s', 'api_calls', 'peak_bytes'}}, in the order the stages first ran
+        # (peak_bytes: None when no record of the stage has one)
+        stages = collections.OrderedDict()
+        for r in self.records:
+            s = stages.setdefault(r['stage'], {'n': 0, 'wall_s': 0.0, 'api_calls': 0, 'peak_bytes': None})
+            s['n'] += 1
+            s['wall_s'] += r['wall_s']
+            s['api_calls'] += r['api_calls']
+            if r['peak_bytes'] is not None:
+                s['peak_bytes'] = max(s['peak_bytes'] or 0, r['peak_bytes'])
+        return stages
+
+    def print_summary(self, file=None):
+        file = file or sys.stdout
+        stages = self.summary()
+        total = sum(s['wall_s'] for name, s in stages.items() if name != 'total')
+        print(f"\n{'stage':24s} {'n':>5s} {'total s':>9s} {'mean ms':>9s} {'share':>6s} {'API calls':>10s} {'peak KiB':>9s}", file=file)
+        for name, s in stages.items():
+            share = f"{100*s['wall_s']/total:5.1f}%" if (name != 'total') and (total > 0) else ''
+            peak = f"{s['peak_bytes']/1024:9.1f}" if s['peak_bytes'] is not None else '-'
+            print(f"{name:24s} {s['n']:5d} {s['wall_s']:9.3f} {1e3*s['wall_s']/s['n']:9.2f} {share:>6s} "
+                  f"{s['api_calls']:10d} {peak:>9s}", file=file)
+
+    def report(self):
+        # end of run output (jsonl records were already written as they came)
+        if self.enabled and (self.mode == 'summary') and (len(self.records) > 0):
+            self.print_summary()
+
+
+_profiler = None
+
+
+def get_profiler():
+    # process-wide profiler, configured from the environment on first use
+    global _profiler
+    if _profiler is None:
+        _profiler = StageProfiler(os.environ.get(PROFILE_ENV, ''), os.environ.get(CPROFILE_ENV) or None)
+    return _profiler
+
+
+def configure(mode='', cprofile_dir=None):
+    # (re)configure the profiler; the settings also go into the environment,
+    # so worker processes started afterwards profile the same way
+    global _profiler
+    os.environ[PROFILE_ENV] = mode
+    if cprofile_dir:
+        os.environ[CPROFILE_ENV] = cprofile_dir
+    else:
+        os.environ.pop(CPROFILE_ENV, None)
+    _profiler = StageProfiler(mode, cprofile_dir)
+    return _profiler
@@ -0,0 +1,241 @@
+# incremental re-import: patch an existing *_ZemaxImport.zmx instead of rebuilding it
+# the prescription of every import is recorded next to the output file; on the next
+# import the new prescription is diffed against that record, the previous .zmx is
+# opened through ZosapiApplication.OpenFile, and only the changed cells are written.
+#
+# changes that alter the structure of the system (surface count, stop, asphere
+# surfaces/terms, glass catalogs, CONF operands or configs, wavelength count, units,
+# or removing a material/semi-diameter) fall back to a full rebuild, and so does an
+# output written by another writer version (the record keeps the WRITER_VERSION).
+#
+# usage:
+#   mode = incremental_import.update_patent_data_in_zemax(lens, zos, out_fn)   # 'patched', 'unchanged' or 'rebuilt'
+
+import os
+
+import numpy as np
+
+import lde_write_plan
+import lens_prescription
+import mce_engine
+import write_data_to_zemax
+from lens_prescription import MATERIAL_NONE, MATERIAL_MODEL, MATERIAL_CATALOG
+
+RECORD_EXTENSION = '.prescription.npz'
+
+
+def record_path(out_fn):
+    # the last imported prescription is kept next to the output
+    return out_fn + RECORD_EXTENSION
+
+
+def save_import_record(Prescription, out_fn, writer_version=write_data_to_zemax.WRITER_VERSION):
+    path = record_path(out_fn)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'wb') as f:
+        np.savez(f, writer_version=np.array(writer_version), **Prescription.to_arrays())
+    os.replace(tmp_path, path)
+
+
+def drop_import_record(out_fn):
+    # before out_fn is written: a write that never finishes leaves no record, so the next
+    # update rebuilds instead of patching a torn file
+    try:
+        os.remove(record_path(out_fn))
+    except FileNotFoundError:
+        pass
+
+
+def load_import_record(out_fn):
+    # returns (the recorded prescription, the version of the writer that wrote out_fn),
+    # or (None, None); records from before the version was kept have version None
+    try:
+        with np.load(record_path(out_fn), allow_pickle=False) as arrays:
+            writer_version = int(arrays['writer_version']) if 'writer_version' in arrays.files else None
+            return lens_prescription.LensPrescription.from_arrays(arrays), writer_version
+    except (OSError, KeyError, ValueError):
+        return None, None
+
+
+def _changed(a, b):
+    # element-wise "differs", with nan == nan
+    a = np.asarray(a)
+    b = np.asarray(b)
+    if a.dtype.kind == 'f':
+        return ~((a == b) | (np.isnan(a) & np.isnan(b)))
+    return a != b
+
+
+def _used_catalogs(Prescription):
+    catalog = Prescription.catalog[Prescription.material_kind == MATERIAL_CATALOG]
+    return set(catalog.tolist())
+
+
+def mce_operand_rows(table):
+    # (operand type, Param1, Param2, CONF row) of a mce_engine.MceTable, in the order set_mce_data adds them
+    return list(zip(table.op_types(), table.api_param1(), table.param2.tolist(), table.rows.tolist()))
+
+
+def structure_mismatch(old, new):
+    # reason a patch is not possible, or '' when the new prescription can be patched in
+    if old.meta.lens_unit.lower() != new.meta.lens_unit.lower():
+        return 'lens units changed'
+    if old.n_surfaces != new.n_surfaces:
+        return 'number of surfaces changed'
+    if old.stop_surface != new.stop_surface:
+        return 'stop surface changed'
+    if not (np.array_equal(old.asph_surf, new.asph_surf) and np.array_equal(old.coeff_index, new.coeff_index)):
+        return 'asphere surfaces or terms changed'
+    if _used_catalogs(old) != _used_catalogs(new):
+        return 'glass catalogs changed'
+    if np.any((new.material_kind == MATERIAL_NONE) & (old.material_kind != MATERIAL_NONE)):
+        return 'material removed'
+    if np.any(np.isnan(new.semi_diameter) & ~np.isnan(old.semi_diameter)):
+        return 'semi-diameter removed'
+    if (not np.array_equal(old.conf_names, new.conf_names)) or (old.n_configs != new.n_configs):
+        return 'CONF operands or configurations changed'
+    if len(old.wave_names) != len(new.wave_names):
+        return 'number of wavelengths changed'
+    return ''
+
+
+def diff_prescriptions(old, new):
+    # indices of everything that changed between two structurally equal prescriptions
+    diff = {
+        'comment': np.flatnonzero(_changed(old.surf_names, new.surf_names)),
+        'radius': np.flatnonzero(_changed(old.radius, new.radius)),
+        'thickness': np.flatnonzero(_changed(old.thickness, new.thickness)),
+        'material': np.flatnonzero(_changed(old.material_kind, new.material_kind) | _changed(old.glass, new.glass)
+                                   | _changed(old.nd, new.nd) | _changed(old.vd, new.vd)),
+        'semi_diameter': np.flatnonzero(_changed(old.semi_diameter, new.semi_diameter)),
+        'conic': np.flatnonzero(_changed(old.conic, new.conic)),
+        'asph_coeffs': np.argwhere(_changed(old.asph_coeffs, new.asph_coeffs)),
+        'wavelength': np.flatnonzero(_changed(old.wavelength_nm, new.wavelength_nm) | _changed(old.wave_weight, new.wave_weight)),
+        'primary_wave': old.primary_wave != new.primary_wave,
+        'conf': np.argwhere(_changed(old.conf_values, new.conf_values) | _changed(old.conf_text, new.conf_text)),
+        }
+    return diff
+
+
+def count_changes(diff):
+    # number of changed cells
+    return sum(len(v) if isinstance(v, np.ndarray) else int(bool(v)) for v in diff.values())
+
+
+def apply_surface_changes(TheSystem, Prescription, diff, ZOSAPI):
+    # LDE: only the changed cells of the changed surfaces
+    for s in diff['comment'].tolist():
+        TheSystem.LDE.GetSurfaceAt(s).Comment = str(Prescription.surf_names[s])
+    for s in diff['radius'].tolist():
+        TheSystem.LDE.GetSurfaceAt(s).Radius = float(Prescription.radius[s])
+    for s in diff['thickness'].tolist():
+        TheSystem.LDE.GetSurfaceAt(s).Thickness = float(Prescription.thickness[s])
+    for s in diff['material'].tolist():
+        this_surf = TheSystem.LDE.GetSurfaceAt(s)
+        if Prescription.material_kind[s] == MATERIAL_CATALOG:
+            this_surf.Material = str(Prescription.glass[s])
+        elif Prescription.material_kind[s] == MATERIAL_MODEL:
+            material_solve = this_surf.MaterialCell.CreateSolveType(ZOSAPI.Editors.SolveType.MaterialModel)._S_MaterialModel
+            material_solve.IndexNd = float(Prescription.nd[s])
+            material_solve.AbbeVd = float(Prescription.vd[s])
+            this_surf.MaterialCell.SetSolveData(material_solve)
+    for s in diff['semi_diameter'].tolist():
+        this_surf = TheSystem.LDE.GetSurfaceAt(s)
+        this_surf.SemiDiameter = float(Prescription.semi_diameter[s])
+        this_surf.MechanicalSemiDiameter = float(Prescription.semi_diameter[s])
+
+    # aspheres: conic, and the changed coefficient cells (cell 25+N holds the r^N term);
+    # a cleared cell (nan) is written as 0, the value a full rebuild leaves in it (lde_write_plan)
+    asph_surf = Prescription.asph_surf.tolist()
+    conic = np.nan_to_num(Prescription.conic, nan=0.0)
+    asph_coeffs = np.nan_to_num(Prescription.asph_coeffs, nan=0.0)
+    for a in diff['conic'].tolist():
+        TheSystem.LDE.GetSurfaceAt(asph_surf[a]).Conic = float(conic[a])
+    for a, i in diff['asph_coeffs'].tolist():
+        ThisSurf = TheSystem.LDE.GetSurfaceAt(asph_surf[a])
+        ThisSurf.GetCellAt(lde_write_plan.NORM_RADIUS_CELL + int(Prescription.coeff_index[i])).DoubleValue = float(asph_coeffs[a, i])
+
+
+def apply_wavelength_changes(TheSystem, Prescription, diff):
+    for w in diff['wavelength'].tolist():
+        this_wave = TheSystem.SystemData.Wavelengths.GetWavelength(w+1)
+        this_wave.Wavelength = 0.001*float(Prescription.wavelength_nm[w])
+        this_wave.Weight = float(Prescription.wave_weight[w])
+    if diff['primary_wave'] and (Prescription.primary_wave >= 0):
+        TheSystem.SystemData.Wavelengths.GetWavelength(Prescription.primary_wave+1).MakePrimary()
+
+
+def apply_conf_changes(TheSystem, Prescription, diff):
+    # CONF: config_1 drives the system aperture and fields; every changed cell also
+    # goes into its MCE operand (when there are multi-configs)
+    if len(diff['conf']) < 1:
+        return
+    changed_rows = set(diff['conf'][:, 0].tolist())
+    conf_values = Prescription.conf_values
+
+    fno_row = int(mce_engine.conf_rows(Prescription, 'fno')[0])
+    if fno_row in changed_rows:
+        TheSystem.SystemData.Aperture.ApertureValue = float(conf_values[fno_row, 0])
+    for f, row in enumerate(mce_engine.conf_rows(Prescription, 'y').tolist()):
+        if row in changed_rows:
+            TheSystem.SystemData.Fields.GetField(f+1).Y = float(conf_values[row, 0])
+
+    if Prescription.n_configs <= 1:
+        return
+    # find each operand once, by type and parameters
+    operands = {}
+    for i in range(1, TheSystem.MCE.NumberOfOperands + 1):
+        op = TheSystem.MCE.GetOperandAt(i)
+        operands[(op.Type.ToString(), int(op.Param1), int(op.Param2))] = op
+    table = mce_engine.compile_mce_table(Prescription)
+    row_operand = {}
+    for i, (op_type, param1, param2, row) in enumerate(mce_operand_rows(table)):
+        row_operand[row] = (i, operands[(op_type, param1, param2)])
+    for row, c in diff['conf'].tolist():
+        if row not in row_operand:
+            continue
+        i, op = row_operand[row]
+        mce_engine.set_operand_cell(op, table, i, c)
+
+
+def update_patent_data_in_zemax(PatentData, zos, out_fn, glass_index=None, lde_export=None,
+                                writer_version=write_data_to_zemax.WRITER_VERSION):
+    # patch the previous import of this lens when possible, otherwise rebuild it
+    # returns 'patched', 'unchanged' or 'rebuilt'
+    # lde_export (optional): 'csv' or 'parquet', as in write_data_to_zemax.write_patent_data_to_zemax
+    # writer_version: version of the writer now in use; an output from another version is rebuilt
+    Prescription = lens_prescription.as_prescription(PatentData)
+    if glass_index is not None:
+        # resolve blank catalogs first, so they compare equal to the recorded import
+        glass_index.resolve_catalogs(Prescription)
+    old, old_writer_version = load_import_record(out_fn)
+    reason = 'no previous import'
+    if old is not None:
+        if not os.path.isfile(out_fn):
+            reason = 'previous output missing'
+        elif old_writer_version != writer_version:
+            reason = 'writer version changed'
+        else:
+            reason = structure_mismatch(old, Prescription)
+    if reason:
+        drop_import_record(out_fn)
+        write_data_to_zemax.write_patent_data_to_zemax(Prescription, zos, out_fn, glass_index, lde_export=lde_export)
+        save_import_record(Prescription, out_fn, writer_version)
+        return 'rebuilt'
+
+    diff = diff_prescriptions(old, Prescription)
+    if count_changes(diff) < 1:
+        return 'unchanged'
+
+    ZOSAPI = zos.ZOSAPI
+    zos.OpenFile(out_fn, False)
+    TheSystem = zos.TheSystem
+    apply_surface_changes(TheSystem, Prescription, diff, ZOSAPI)
+    apply_wavelength_changes(TheSystem, Prescription, diff)
+    apply_conf_changes(TheSystem, Prescription, diff)
+    if lde_export is not None:
+        write_data_to_zemax.display_lde(TheSystem, write_data_to_zemax.lde_export_path(out_fn, lde_export), show=False)
+    drop_import_record(out_fn)
+    write_data_to_zemax.save_system(TheSystem, out_fn)
+    save_import_record(Prescription, out_fn, writer_version)
+    return 'patched'
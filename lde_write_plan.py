@@ -0,0 +1,138 @@
+# LDE write plan
+# the prescription is first compiled into one entry per surface holding every write that
+# surface needs (type change, properties, material, cells), leaving out values a freshly
+# inserted surface already has; executing the plan then fetches each surface handle once.
+#
+# usage:
+#   plan = lde_write_plan.compile_lde_plan(lens)
+#   lde_write_plan.execute_lde_plan(TheSystem, plan, ZOSAPI)
+
+import numpy as np
+
+from lens_prescription import MATERIAL_MODEL, MATERIAL_CATALOG
+
+# values of a new surface in a new system; writes of these are skipped
+# (surface 0, the object, is always written in full)
+SURFACE_DEFAULTS = {
+    'Comment': '',
+    'Radius': np.inf,
+    'Thickness': 0.0,
+    'Conic': 0.0,
+    }
+
+# Extended Odd Asphere cells: 24 is par(13), the max # of asphere terms,
+# 25 is par(14), the normalization radius, and 25+N holds the r^N coefficient
+MAX_TERM_CELL = 24
+NORM_RADIUS_CELL = 25
+
+
+class SurfaceWrites(object):
+    __slots__ = (
+        'surface',      # LDE surface number
+        'change_type',  # True to change to an Extended Odd Asphere
+        'properties',   # [(property name, value)]
+        'material',     # None, (MATERIAL_CATALOG, name) or (MATERIAL_MODEL, nd, vd)
+        'cells',        # [(cell index, 'IntegerValue'/'DoubleValue', value)]
+        )
+
+    def __init__(self, surface):
+        self.surface = surface
+        self.change_type = False
+        self.properties = []
+        self.material = None
+        self.cells = []
+
+    def is_empty(self):
+        return (not self.change_type) and (len(self.properties) < 1) and (self.material is None) and (len(self.cells) < 1)
+
+    def n_writes(self):
+        return int(self.change_type) + len(self.properties) + int(self.material is not None) + len(self.cells)
+
+    def __repr__(self):
+        return f"SurfaceWrites(surface={self.surface}, {self.n_writes()} writes)"
+
+
+def _is_default(name, value, surface):
+    if surface == 0:
+        return False
+    return value == SURFACE_DEFAULTS[name]
+
+
+def compile_lde_plan(Prescription):
+    # list of SurfaceWrites, in surface order, for the surfaces that need any writes
+    # (convert to python scalars up front; numpy scalars are not .NET values)
+    surf_names = Prescription.surf_names.tolist()
+    radius = Prescription.radius.tolist()
+    thickness = Prescription.thickness.tolist()
+    material_kind = Prescription.material_kind.tolist()
+    semi_diameter = Prescription.semi_diameter.tolist()
+
+    plan = [SurfaceWrites(s) for s in range(0, Prescription.n_surfaces)]
+    for s, writes in enumerate(plan):
+        for name, value in (('Comment', surf_names[s]), ('Radius', radius[s]), ('Thickness', thickness[s])):
+            if not _is_default(name, value, s):
+                writes.properties.append((name, value))
+        if material_kind[s] == MATERIAL_CATALOG:
+            writes.material = (MATERIAL_CATALOG, str(Prescription.glass[s]))
+        elif material_kind[s] == MATERIAL_MODEL:
+            writes.material = (MATERIAL_MODEL, float(Prescription.nd[s]), float(Prescription.vd[s]))
+        if not np.isnan(semi_diameter[s]):
+            writes.properties.append(('SemiDiameter', semi_diameter[s]))
+            writes.properties.append(('MechanicalSemiDiameter', semi_diameter[s]))
+
+    # note: we only allow extended asphere for now
+    coeff_indices = Prescription.coeff_index.tolist()
+    max_coeff_index = max(coeff_indices) if len(coeff_indices) > 0 else 0
+    # blank ASPH cells (nan) are 0, like the cells of a new asphere
+    conic = np.nan_to_num(Prescription.conic, nan=0.0).tolist()
+    asph_coeffs = Prescription.asph_coeffs.tolist()
+    for a, surf_num in enumerate(Prescription.asph_surf.tolist()):
+        writes = plan[surf_num]
+        writes.change_type = True
+        if not _is_default('Conic', conic[a], surf_num):
+            writes.properties.append(('Conic', conic[a]))
+        writes.cells.append((MAX_TERM_CELL, 'IntegerValue', max_coeff_index))
+        writes.cells.append((NORM_RADIUS_CELL, 'DoubleValue', 1.0))
+        for i in range(0, len(coeff_indices)):
+            # coefficients of a new asphere are 0 (blank cells are nan)
+            value = asph_coeffs[a][i]
+            if (value != 0.0) and not np.isnan(value):
+                writes.cells.append((NORM_RADIUS_CELL + coeff_indices[i], 'DoubleValue', value))
+
+    return [writes for writes in plan if not writes.is_empty()]
+
+
+def execute_lde_plan(TheSystem, plan, ZOSAPI):
+    LDE = TheSystem.LDE
+    asphere_settings = None
+    for writes in plan:
+        this_surf = LDE.GetSurfaceAt(writes.surface)
+
+        # change the surface type first: it resets the surface parameters
+        if writes.change_type:
+            if asphere_settings is None:
+                asphere_settings = this_surf.GetSurfaceTypeSettings(ZOSAPI.Editors.LDE.SurfaceType.ExtendedOddAsphere)
+            this_surf.ChangeType(asphere_settings)
+
+        for name, value in writes.properties:
+            setattr(this_surf, name, value)
+
+        if writes.material is not None:
+            if writes.material[0] == MATERIAL_CATALOG:
+                # set material name (we already added the glass catalogs to System Explorer)
+                this_surf.Material = writes.material[1]
+            else:
+                # set material solve by Nd/Vd
+                material_cell = this_surf.MaterialCell
+                material_solve = material_cell.CreateSolveType(ZOSAPI.Editors.SolveType.MaterialModel)._S_MaterialModel
+                material_solve.IndexNd = writes.material[1]
+                material_solve.AbbeVd = writes.material[2]
+                material_cell.SetSolveData(material_solve)
+
+        for cell_index, attr, value in writes.cells:
+            setattr(this_surf.GetCellAt(cell_index), attr, value)
+
+
+def plan_size(plan):
+    # (surfaces touched, total writes)
+    return len(plan), sum(writes.n_writes() for writes in plan)
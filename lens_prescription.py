@@ -0,0 +1,202 @@
+# compact, array-backed lens prescription
+# holds the same information as the dict of block dataframes from read_excel_data,
+# but as typed numpy arrays, so the writers never do per-cell pandas lookups
+#
+# usage:
+#   lens = read_excel_data.read_excel_patent_data('lens.xlsx', as_prescription=True)
+#   lens.radius[3], lens.thickness[3]          # float64, "INF" strings are already inf
+#   lens.material_kind[3] == MATERIAL_CATALOG  # then lens.glass[3], lens.catalog[3]
+#   lens.asph_coeffs[i, j]                     # coefficient on r^coeff_index[j] of surface asph_surf[i]
+
+import numpy as np
+
+# material kind codes (SURF 'nd' column)
+MATERIAL_NONE = 0      # no material (air)
+MATERIAL_MODEL = 1     # model glass, from numeric nd/vd
+MATERIAL_CATALOG = 2   # catalog glass: nd is the glass name, vd the catalog name
+
+
+class PrescriptionMeta(object):
+    # META block values
+    __slots__ = ('lens_unit',)
+
+    def __init__(self, lens_unit='mm'):
+        self.lens_unit = lens_unit
+
+    def __repr__(self):
+        return f"PrescriptionMeta(lens_unit={self.lens_unit!r})"
+
+
+class LensPrescription(object):
+    __slots__ = (
+        'meta',
+        # SURF: one entry per surface row (object surface first, image surface not included)
+        'surf_names',      # str
+        'radius',          # float64, inf for flat
+        'thickness',       # float64, inf for infinite
+        'material_kind',   # int8, MATERIAL_* codes
+        'nd',              # float64, nan unless MATERIAL_MODEL
+        'vd',              # float64, nan unless MATERIAL_MODEL
+        'glass',           # str, '' unless MATERIAL_CATALOG
+        'catalog',         # str, '' unless MATERIAL_CATALOG
+        'semi_diameter',   # float64, nan when not given
+        'stop_surface',    # int, -1 when no '_STO' surface was found
+        # ASPH
+        'asph_surf',       # int32 surface numbers
+        'conic',           # float64
+        'coeff_index',     # int32 power of r for each coefficient column
+        'asph_coeffs',     # float64 (asphere surfaces x coefficients)
+        # CONF
+        'conf_names',      # str operand names (e.g. 'fno', 'y_2', 'd_8')
+        'conf_values',     # float64 (operands x configs), "INF" strings are inf
+        'conf_text',       # str (operands x configs), the string cells (e.g. GLSS glass names), '' elsewhere
+        # WAVE
+        'wave_names',      # str
+        'wavelength_nm',   # float64
+        'wave_weight',     # float64
+        'primary_wave',    # int index into the wave arrays, -1 when no '_c' wavelength was found
+        )
+
+    @property
+    def n_surfaces(self):
+        return len(self.surf_names)
+
+    @property
+    def n_configs(self):
+        return self.conf_values.shape[1]
+
+    @property
+    def has_asphere(self):
+        return len(self.asph_surf) > 0
+
+    def nbytes(self):
+        # memory held by the arrays
+        return sum(getattr(self, name).nbytes for name in self.__slots__ if isinstance(getattr(self, name), np.ndarray))
+
+    def __repr__(self):
+        return (f"LensPrescription({self.n_surfaces} surfaces, {len(self.asph_surf)} aspheres, "
+                f"{len(self.conf_names)} CONF operands x {self.n_configs} configs, {len(self.wave_names)} wavelengths)")
+
+    def to_arrays(self):
+        # flat dict of arrays (e.g. for np.savez); no pickled objects needed
+        arrays = {name: getattr(self, name) for name in self.__slots__ if isinstance(getattr(self, name), np.ndarray)}
+        arrays['meta_lens_unit'] = np.array(self.meta.lens_unit, dtype=str)
+        arrays['stop_surface'] = np.array(self.stop_surface)
+        arrays['primary_wave'] = np.array(self.primary_wave)
+        return arrays
+
+    @classmethod
+    def from_arrays(cls, arrays):
+        # inverse of to_arrays
+        lens = cls()
+        for name in cls.__slots__:
+            if name in ('meta', 'stop_surface', 'primary_wave'):
+                continue
+            setattr(lens, name, np.asarray(arrays[name]))
+        lens.meta = PrescriptionMeta(str(arrays['meta_lens_unit']))
+        lens.stop_surface = int(arrays['stop_surface'])
+        lens.primary_wave = int(arrays['primary_wave'])
+        return lens
+
+    @classmethod
+    def from_lens_data(cls, lens_data):
+        # build from the dict of block dataframes returned by read_excel_data
+        # (or the read_excel_data.BlockTable column lists)
+        lens = cls()
+
+        # META
+        lens_unit = 'mm'
+        if ('META' in lens_data.keys()) and ('lens_unit' in lens_data['META'].keys()) and (len(lens_data['META']) > 0):
+            lens_unit = str(lens_data['META']['lens_unit'][0])
+        lens.meta = PrescriptionMeta(lens_unit)
+
+        # SURF
+        surf_data = lens_data['SURF']
+        n_surf = len(surf_data)
+        lens.surf_names = _str_array(surf_data['surf_num'])
+        lens.radius = _float_array(surf_data['r'])
+        lens.thickness = _float_array(surf_data['d'])
+        lens.semi_diameter = _float_array(surf_data['cir'], string_value=np.nan) if 'cir' in surf_data.keys() else np.full(n_surf, np.nan)
+        lens.material_kind = np.zeros(n_surf, dtype=np.int8)
+        lens.nd = np.full(n_surf, np.nan)
+        lens.vd = np.full(n_surf, np.nan)
+        glass = [''] * n_surf
+        catalog = [''] * n_surf
+        nd_col = list(surf_data['nd']) if 'nd' in surf_data.keys() else [np.nan] * n_surf
+        vd_col = list(surf_data['vd']) if 'vd' in surf_data.keys() else [np.nan] * n_surf
+        for s in range(0, n_surf):
+            nd = nd_col[s]
+            vd = vd_col[s]
+            if isinstance(nd, str):
+                lens.material_kind[s] = MATERIAL_CATALOG
+                glass[s] = nd
+                catalog[s] = vd if isinstance(vd, str) else ''
+            elif not _is_missing(nd):
+                lens.material_kind[s] = MATERIAL_MODEL
+                lens.nd[s] = float(nd)
+                lens.vd[s] = np.nan if (isinstance(vd, str) or _is_missing(vd)) else float(vd)
+        lens.glass = np.array(glass, dtype=str)
+        lens.catalog = np.array(catalog, dtype=str)
+        stop_rows = np.flatnonzero(np.char.find(np.char.lower(lens.surf_names), '_sto') >= 0)
+        lens.stop_surface = int(stop_rows[0]) if len(stop_rows) > 0 else -1
+
+        # ASPH
+        if 'ASPH' in lens_data.keys():
+            asphere_data = lens_data['ASPH']
+            keys = list(asphere_data.keys())
+            lens.asph_surf = np.array([int(v) for v in asphere_data['surf_num']], dtype=np.int32)
+            lens.conic = _float_array(asphere_data['ka'])
+            lens.coeff_index = np.array([int(str(k).split("_")[1]) for k in keys[2:]], dtype=np.int32) # parse out coefficient index
+            lens.asph_coeffs = np.array([_float_array(asphere_data[k]) for k in keys[2:]], dtype=np.float64).reshape(len(keys) - 2, len(asphere_data)).T.copy()
+        else:
+            lens.asph_surf = np.zeros(0, dtype=np.int32)
+            lens.conic = np.zeros(0)
+            lens.coeff_index = np.zeros(0, dtype=np.int32)
+            lens.asph_coeffs = np.zeros((0, 0))
+
+        # CONF
+        if 'CONF' in lens_data.keys():
+            conf_data = lens_data['CONF']
+            keys = list(conf_data.keys())
+            lens.conf_names = _str_array(conf_data['name'])
+            lens.conf_values = np.array([_float_array(conf_data[k]) for k in keys[1:]], dtype=np.float64).reshape(len(keys) - 1, len(conf_data)).T.copy()
+            lens.conf_text = np.array([_text_array(conf_data[k]) for k in keys[1:]], dtype=str).reshape(len(keys) - 1, len(conf_data)).T.copy()
+        else:
+            lens.conf_names = np.zeros(0, dtype=str)
+            lens.conf_values = np.zeros((0, 1))
+            lens.conf_text = np.zeros((0, 1), dtype=str)
+
+        # WAVE
+        wave_data = lens_data['WAVE']
+        lens.wave_names = _str_array(wave_data['wave_num'])
+        lens.wavelength_nm = _float_array(wave_data['wavelength_nm'])
+        lens.wave_weight = _float_array(wave_data['weight'])
+        pwave_rows = np.flatnonzero(np.char.find(np.char.lower(lens.wave_names), '_c') >= 0)
+        lens.primary_wave = int(pwave_rows[0]) if len(pwave_rows) > 0 else -1
+
+        return lens
+
+
+def as_prescription(data):
+    # accept either a LensPrescription or the dict of block dataframes
+    if isinstance(data, LensPrescription):
+        return data
+    return LensPrescription.from_lens_data(data)
+
+
+def _is_missing(value):
+    return (value is None) or (isinstance(value, float) and np.isnan(value))
+
+
+def _str_array(column):
+    return np.array(['' if _is_missing(v) else str(v) for v in column], dtype=str)
+
+
+def _text_array(column):
+    # the string cells of a column ('' for numbers and empty cells)
+    return np.array([v if isinstance(v, str) else '' for v in column], dtype=str)
+
+
+def _float_array(column, string_value=np.inf):
+    # allow string (i.e. "INF") for radius/thickness
+    return np.array([string_value if isinstance(v, str) else (np.nan if v is None else float(v)) for v in column], dtype=np.float64)
@@ -24,14 +24,14 @@ import write_data_to_zemax
 # Query user for excel data
 root = tkinter.Tk()
 root.withdraw() #use to hide tkinter window
-excel_file = askopenfilename(initialdir=os.getcwd(), filetypes=[("excel files", "*.xlsx")], title='Please select an excel file')
+excel_file = askopenfilename(initialdir=os.getcwd(), filetypes=[("patent data", "*.xlsx *.parquet *.json *.csv"), ("excel files", "*.xlsx")], title='Please select an excel file')
 if (len(excel_file) < 1) or (excel_file is None):
     #print(f"You chose {excel_file}")
     print("ERROR: please choose a valid excel file")
     os._exit(0)
 
 # set the outfile name based on the selected file
-out_file = excel_file[0:-5] + '_ZemaxImport.zmx'
+out_file = os.path.splitext(excel_file)[0] + '_ZemaxImport.zmx'
 
 # read the excel file into a dict of dataframes
 lens_data = read_excel_data.read_excel_patent_data(excel_file)
@@ -40,7 +40,7 @@ lens_data = read_excel_data.read_excel_patent_data(excel_file)
 zos = initialize_zemax_connection.ZosapiApplication()
 
 # load the data into a zemax optical system and save
-write_data_to_zemax.write_patent_data_to_zemax(lens_data, zos, out_file)
+write_data_to_zemax.write_patent_data_to_zemax(lens_data, zos, out_file, display=True)
 
 # clean up ZOS connection
 del zos
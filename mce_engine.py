@@ -0,0 +1,259 @@
+# multi-configuration editor (MCE) engine
+# the CONF block is compiled once into an MceTable: one MCE operand per recognized CONF
+# row, and a dense (operands x configs) value matrix with each operand's conversion
+# (e.g. radius -> curvature) already applied. the writers then create every config and
+# operand up front, and fill the cells in one pass; nothing is looked up per cell.
+#
+# CONF operand names are <key>, <key>_N or <key>_N_M (case-insensitive); the MCE type
+# name works as a key too (e.g. thic_8 is the same as d_8):
+#   fno        APER  system f/#
+#   y_N        YFIE  y height of field N
+#   x_N        XFIE  x height of field N
+#   d_N        THIC  thickness of surface N ("INF" is written as 1e10)
+#   c_N        CRVT  curvature of surface N
+#   r_N        CRVT  radius of surface N (written as the curvature 1/r, "INF" is flat)
+#   glass_N    GLSS  glass of surface N (a string cell, e.g. N-BK7)
+#   sdia_N     SDIA  semi-diameter of surface N
+#   pram_N_M   PRAM  parameter M of surface N
+#   wave_N     WAVE  wavelength N, in nm like the WAVE block (written in um)
+#   wlwt_N     WLWT  weight of wavelength N
+# a new operand is one more McOperandSpec row in MCE_OPERANDS.
+#
+# usage:
+#   table = mce_engine.compile_mce_table(lens)
+#   mce_engine.write_mce_table(TheSystem, table, ZOSAPI)
+
+import re
+
+import numpy as np
+
+# thickness used by OpticStudio for an infinite MCE thickness
+MCE_INFINITY = 1e10
+
+# what the operand's number(s) refer to (for range checks, see preflight_validator)
+TARGET_SYSTEM = 'system'
+TARGET_FIELD = 'field'
+TARGET_SURFACE = 'surface'
+TARGET_WAVE = 'wave'
+
+OPERAND_NAME = re.compile(r'([a-z]+)(?:_(\d+))?(?:_(\d+))?$')
+
+
+def _thickness(values):
+    # allow string (i.e. "INF") for thickness
+    return np.where(np.isinf(values), MCE_INFINITY, values)
+
+
+def _curvature(values):
+    # flat ("INF") radius is zero curvature
+    with np.errstate(divide='ignore'):
+        return np.where(np.isinf(values), 0.0, 1.0/values)
+
+
+def _nm_to_um(values):
+    return 0.001*values
+
+
+class McOperandSpec(object):
+    # one MCE operand type, and how a CONF row maps onto it
+    __slots__ = (
+        'key',          # CONF name prefix (e.g. 'd' for d_N)
+        'op_type',      # MultiConfigOperandType member name
+        'target',       # TARGET_* of Param1
+        'n_params',     # numbers in the CONF name: 0 (fno), 1 (d_N) or 2 (pram_N_M)
+        'api_offset',   # added to Param1 for ZOS-API (drop-down lists are 0-based)
+        'is_string',    # string cells (GLSS) instead of numbers
+        'transform',    # vectorized conversion of the CONF values, or None
+        )
+
+    def __init__(self, key, op_type, target, n_params=1, api_offset=0, is_string=False, transform=None):
+        self.key = key
+        self.op_type = op_type
+        self.target = target
+        self.n_params = n_params
+        self.api_offset = api_offset
+        self.is_string = is_string
+        self.transform = transform
+
+    def __repr__(self):
+        return f"McOperandSpec({self.key!r}, {self.op_type!r})"
+
+
+# in the order the operands are added to the MCE
+MCE_OPERANDS = [
+    McOperandSpec('fno', 'APER', TARGET_SYSTEM, n_params=0),
+    # Zemax is expecting the index of the field drop-down list (so field#1 is entered as '0', etc.)
+    McOperandSpec('y', 'YFIE', TARGET_FIELD, api_offset=-1),
+    McOperandSpec('x', 'XFIE', TARGET_FIELD, api_offset=-1),
+    McOperandSpec('d', 'THIC', TARGET_SURFACE, transform=_thickness),
+    McOperandSpec('c', 'CRVT', TARGET_SURFACE),
+    McOperandSpec('r', 'CRVT', TARGET_SURFACE, transform=_curvature),
+    McOperandSpec('glass', 'GLSS', TARGET_SURFACE, is_string=True),
+    McOperandSpec('sdia', 'SDIA', TARGET_SURFACE),
+    McOperandSpec('pram', 'PRAM', TARGET_SURFACE, n_params=2),
+    # wavelength drop-down, as for the fields
+    McOperandSpec('wave', 'WAVE', TARGET_WAVE, api_offset=-1, transform=_nm_to_um),
+    McOperandSpec('wlwt', 'WLWT', TARGET_WAVE, api_offset=-1),
+    ]
+
+# by CONF key, and by MCE type name (the first spec of each type)
+OPERAND_KEYS = {}
+for _spec in MCE_OPERANDS:
+    OPERAND_KEYS[_spec.key] = _spec
+    OPERAND_KEYS.setdefault(_spec.op_type.lower(), _spec)
+
+
+def parse_operand_name(name):
+    # (spec, param1, param2) of a CONF operand name, or None when it is not an MCE operand
+    match = OPERAND_NAME.match(str(name).strip().lower())
+    if match is None:
+        return None
+    spec = OPERAND_KEYS.get(match.group(1))
+    params = [int(p) for p in match.group(2, 3) if p is not None]
+    if (spec is None) or (len(params) != spec.n_params):
+        return None
+    params += [0]*(2 - len(params))
+    return spec, params[0], params[1]
+
+
+def conf_rows(Prescription, key):
+    # indices of the CONF rows that are operand key (e.g. 'fno', 'y'), in CONF order
+    rows = []
+    for row, name in enumerate(Prescription.conf_names.tolist()):
+        parsed = parse_operand_name(name)
+        if (parsed is not None) and (parsed[0].key == key):
+            rows.append(row)
+    return np.array(rows, dtype=np.intp)
+
+
+class MceTable(object):
+    # the compiled CONF block: operand i comes from CONF row rows[i]
+    __slots__ = (
+        'specs',      # McOperandSpec of each operand
+        'param1',     # int32 field/surface/wavelength number, as in the CONF name
+        'param2',     # int32 (PRAM parameter number), else 0
+        'rows',       # int32 CONF row of each operand
+        'values',     # float64 (operands x configs), converted; nan for string operands and empty cells
+        'text',       # str (operands x configs), the cells of string operands
+        'skipped',    # CONF names that are not MCE operands, or repeat an earlier one
+        )
+
+    @property
+    def n_operands(self):
+        return len(self.specs)
+
+    @property
+    def n_configs(self):
+        return self.values.shape[1]
+
+    def op_types(self):
+        return [spec.op_type for spec in self.specs]
+
+    def api_param1(self):
+        # Param1 as ZOS-API expects it
+        return [int(p) + spec.api_offset for spec, p in zip(self.specs, self.param1.tolist())]
+
+    def __repr__(self):
+        return f"MceTable({self.n_operands} operands x {self.n_configs} configs)"
+
+
+def compile_mce_table(Prescription):
+    # one operand per recognized CONF row, grouped in MCE_OPERANDS order (then CONF order)
+    conf_names = Prescription.conf_names.tolist()
+    order = {spec.key: i for i, spec in enumerate(MCE_OPERANDS)}
+    operands = []
+    seen = set()
+    skipped = []
+    for row, name in enumerate(conf_names):
+        parsed = parse_operand_name(name)
+        if parsed is None:
+            skipped.append(name)
+            continue
+        spec, param1, param2 = parsed
+        # a repeated operand would only overwrite the first one
+        if (spec.op_type, param1, param2) in seen:
+            skipped.append(name)
+            continue
+        seen.add((spec.op_type, param1, param2))
+        operands.append((order[spec.key], row, spec, param1, param2))
+    operands.sort(key=lambda op: (op[0], op[1]))
+
+    table = MceTable()
+    table.specs = [op[2] for op in operands]
+    table.rows = np.array([op[1] for op in operands], dtype=np.int32)
+    table.param1 = np.array([op[3] for op in operands], dtype=np.int32)
+    table.param2 = np.array([op[4] for op in operands], dtype=np.int32)
+    table.skipped = skipped
+    n_configs = Prescription.n_configs
+    table.values = Prescription.conf_values[table.rows].reshape(len(operands), n_configs).copy()
+    table.text = Prescription.conf_text[table.rows].reshape(len(operands), n_configs)
+    # one vectorized conversion per operand type in the table
+    present = set(table.specs)
+    for spec in MCE_OPERANDS:
+        if spec not in present:
+            continue
+        mask = np.array([s is spec for s in table.specs], dtype=bool)
+        if spec.is_string:
+            table.values[mask] = np.nan
+        elif spec.transform is not None:
+            table.values[mask] = spec.transform(table.values[mask])
+    return table
+
+
+def operand_rows(table, key):
+    # CONF rows of the operands with this key, in table order
+    return [int(row) for spec, row in zip(table.specs, table.rows.tolist()) if spec.key == key]
+
+
+def set_operand_cell(op, table, i, config):
+    # write cell (operand i, 0-based config) into the ZOS-API operand op; returns False
+    # for an empty cell, which is left alone
+    if table.specs[i].is_string:
+        text = str(table.text[i, config])
+        if len(text) < 1:
+            return False
+        op.GetOperandCell(config + 1).Value = text
+        return True
+    value = float(table.values[i, config])
+    if np.isnan(value):
+        return False
+    op.GetOperandCell(config + 1).DoubleValue = value
+    return True
+
+
+def write_mce_table(TheSystem, table, ZOSAPI):
+    # create every config and operand of a new system, then fill all the cells
+    # (only when there are multi-configs)
+    n_configs = table.n_configs
+    if (n_configs <= 1) or (table.n_operands < 1):
+        return
+    MCE = TheSystem.MCE
+    for c in range(1, n_configs):
+        MCE.AddConfiguration(False)
+
+    op_type_enum = ZOSAPI.Editors.MCE.MultiConfigOperandType
+    param1 = table.api_param1()
+    param2 = table.param2.tolist()
+    operands = []
+    for i, spec in enumerate(table.specs):
+        # a new system has one blank (OFF) operand row: it becomes the first operand
+        op = MCE.GetOperandAt(1) if i == 0 else MCE.AddOperand()
+        op.ChangeType(getattr(op_type_enum, spec.op_type))
+        if param1[i] != 0:
+            op.Param1 = param1[i]
+        if param2[i] != 0:
+            op.Param2 = param2[i]
+        operands.append(op)
+
+    # fill pass: plain python rows, so each cell is one GetOperandCell and one write
+    values = table.values.tolist()
+    for i, op in enumerate(operands):
+        if table.specs[i].is_string:
+            for c in range(0, n_configs):
+                set_operand_cell(op, table, i, c)
+            continue
+        row = values[i]
+        for c in range(0, n_configs):
+            value = row[c]
+            if value == value:  # not nan
+                op.GetOperandCell(c + 1).DoubleValue = value
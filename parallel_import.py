@@ -0,0 +1,238 @@
+# parallel import of patent data workbooks across a pool of OpticStudio instances
+# each worker process owns its own connection (one API license seat each). the parent
+# hands each worker one workbook at a time, over a pipe of its own, and the next one when
+# its result comes back, so it always knows which workbook a worker holds.
+#
+# a worker that crashes (e.g. OpticStudio dies) shows up as end-of-file on its pipe; it is
+# restarted, the workbook it held is reported as failed, and the rest of the batch carries
+# on. (workers share no queue: a worker killed mid-send would leave a shared queue's lock
+# held, and every other worker blocked on it.)
+#
+# usage:
+#   results = parallel_import.run_parallel(files, backend_name='zosapi', pool_size=4)
+#   results = parallel_import.run_parallel(files, backend_name='fake', pool_size=8)  # load test on Linux
+
+import collections
+import multiprocessing as mp
+import multiprocessing.connection
+import time
+
+import batch_import
+import import_backends
+import import_profiler
+
+# seconds between wake-ups while waiting for results
+POLL_INTERVAL = 0.5
+
+
+def _worker_main(worker_id, backend_name, conn, cache_dir=None, cache_max_bytes=None, update=False, lde_export=None):
+    # runs in the worker process: connect once, then import until a None task arrives
+    # (conn is this worker's own pipe to the parent; sends are synchronous, so no
+    # message is left half-written in a background thread when the worker dies)
+    cache = None
+    if cache_dir is not None:
+        import parse_cache
+        cache = parse_cache.ParseCache(cache_dir, cache_max_bytes or parse_cache.DEFAULT_MAX_BYTES)
+    try:
+        backend = import_backends.get_backend(backend_name)
+        backend.lde_export = lde_export
+        zos = backend.connect()
+    except Exception as e:
+        conn.send(('connect_failed', f"{type(e).__name__}: {e}"))
+        return
+    conn.send(('ready', None))
+
+    while True:
+        task = conn.recv()
+        if task is None:
+            break
+        index, excel_file, out_file = task
+        result = batch_import.import_workbook(excel_file, zos, out_file, backend=backend, cache=cache, update=update)
+        result['worker'] = worker_id
+        conn.send(('done', (index, result)))
+
+    backend.close(zos)
+    zos = None
+    import_profiler.get_profiler().report()
+
+
+class ImportPool(object):
+    # a fixed-size pool of worker processes, each holding one connection
+
+    def __init__(self, backend_name='zosapi', pool_size=2, max_restarts=None, verbose=True, cache_dir=None, cache_max_bytes=None,
+                 update=False, lde_export=None):
+        if pool_size < 1:
+            raise ValueError("pool_size must be at least 1")
+        import_backends.get_backend(backend_name) # fail early on an unknown backend name
+        self.backend_name = backend_name
+        self.pool_size = pool_size
+        self.max_restarts = pool_size*2 if max_restarts is None else max_restarts
+        self.verbose = verbose
+        self.cache_dir = cache_dir
+        self.cache_max_bytes = cache_max_bytes
+        self.update = update
+        self.lde_export = lde_export
+        self.restarts = 0
+
+        # spawn (not fork): pythonnet/.NET state must never be shared between processes
+        self._ctx = mp.get_context('spawn')
+        self._workers = {}
+        self._conns = {}      # worker_id -> the parent's end of the worker's pipe
+        self._in_flight = {}  # worker_id -> index of the task handed to it, recorded before it is sent
+        self._pending = collections.deque()
+        self._next_worker_id = 0
+        self._on_result = None
+
+    def _start_worker(self):
+        worker_id = self._next_worker_id
+        self._next_worker_id += 1
+        conn, child_conn = self._ctx.Pipe()
+        p = self._ctx.Process(target=_worker_main, args=(worker_id, self.backend_name, child_conn, self.cache_dir,
+                                                                self.cache_max_bytes, self.update, self.lde_export),
+                             daemon=True)
+        p.start()
+        child_conn.close() # (so the worker's exit closes the pipe)
+        self._workers[worker_id] = p
+        self._conns[worker_id] = conn
+        return worker_id
+
+    def _assign(self, worker_id):
+        # hand the next workbook (if any) to an idle worker
+        if (len(self._pending) < 1) or (worker_id not in self._workers):
+            return
+        task = self._pending.popleft()
+        self._in_flight[worker_id] = task[0]
+        try:
+            self._conns[worker_id].send(task)
+        except OSError:
+            pass # (it just died: its pipe reads end-of-file next, and the task is failed then)
+
+    def _log(self, msg):
+        if self.verbose:
+            print(msg)
+
+    def _set_result(self, results, index, result):
+        results[index] = result
+        if self._on_result is not None:
+            self._on_result(result)
+
+    def run(self, files, out_files=None, on_result=None):
+        # import all files; returns one result dict per file, in input order
+        # on_result (optional): called in this process with each result as soon as it is done
+        self._on_result = on_result
+        if out_files is None:
+            out_files = [batch_import.default_out_file(fn) for fn in files]
+        tasks = list(zip(range(len(files)), files, out_files))
+        results = [None]*len(tasks)
+        n_done = 0
+
+        self._pending = collections.deque(tasks)
+        for w in range(0, min(self.pool_size, len(tasks))):
+            self._start_worker()
+
+        while n_done < len(tasks):
+            if len(self._workers) < 1:
+                n_done += self._fail_remaining(tasks, results, "no import workers left")
+                break
+            worker_ids = {conn: worker_id for worker_id, conn in self._conns.items()}
+            for conn in mp.connection.wait(list(worker_ids), timeout=POLL_INTERVAL):
+                worker_id = worker_ids[conn]
+                try:
+                    kind, payload = conn.recv()
+                except (EOFError, OSError):
+                    n_done += self._worker_exited(worker_id, tasks, results)
+                    continue
+
+                if kind == 'ready':
+                    self._log(f"worker {worker_id} connected")
+                    self._assign(worker_id)
+                elif kind == 'connect_failed':
+                    # (its pipe closes next, and it is restarted then)
+                    self._log(f"worker {worker_id} failed to connect: {payload}")
+                elif kind == 'done':
+                    index, result = payload
+                    self._in_flight.pop(worker_id, None)
+                    self._set_result(results, index, result)
+                    n_done += 1
+                    if self.verbose:
+                        batch_import.print_result(result, n_done - 1, len(tasks))
+                    self._assign(worker_id)
+
+        self.shutdown()
+        return results
+
+    def _restart_worker(self):
+        if self.restarts >= self.max_restarts:
+            self._log("error: worker restart limit reached")
+            return None
+        self.restarts += 1
+        return self._start_worker()
+
+    def _worker_exited(self, worker_id, tasks, results):
+        # a worker's pipe closed: fail the task it was handed (if any) and restart it
+        # (every message it sent before exiting has been read by now)
+        p = self._workers.pop(worker_id)
+        self._conns.pop(worker_id).close()
+        p.join()
+        n_failed = 0
+        index = self._in_flight.pop(worker_id, None)
+        if index is not None:
+            _, excel_file, out_file = tasks[index]
+            self._set_result(results, index, {
+                'file': excel_file,
+                'out_file': out_file,
+                'status': 'failed',
+                'error': f"worker {worker_id} crashed (exit code {p.exitcode})",
+                'read_time': 0.0,
+                'write_time': 0.0,
+                'total_time': 0.0,
+                'worker': worker_id,
+                })
+            n_failed += 1
+            if self.verbose:
+                batch_import.print_result(results[index], index, len(tasks))
+        self._log(f"worker {worker_id} exited (exit code {p.exitcode}); restarting")
+        self._restart_worker()
+        return n_failed
+
+    def _fail_remaining(self, tasks, results, reason):
+        n_failed = 0
+        for index, excel_file, out_file in tasks:
+            if results[index] is None:
+                self._set_result(results, index, {
+                    'file': excel_file,
+                    'out_file': out_file,
+                    'status': 'failed',
+                    'error': reason,
+                    'read_time': 0.0,
+                    'write_time': 0.0,
+                    'total_time': 0.0,
+                    })
+                n_failed += 1
+        return n_failed
+
+    def shutdown(self, timeout=30):
+        # ask each worker to close its connection, then reap the processes
+        for conn in self._conns.values():
+            try:
+                conn.send(None)
+            except OSError:
+                pass # (already gone)
+        t_end = time.monotonic() + timeout
+        for worker_id, p in list(self._workers.items()):
+            p.join(max(0.0, t_end - time.monotonic()))
+            if p.is_alive():
+                p.terminate()
+                p.join()
+        for conn in self._conns.values():
+            conn.close()
+        self._workers = {}
+        self._conns = {}
+        self._in_flight = {}
+        self._pending = collections.deque()
+
+
+def run_parallel(files, backend_name='zosapi', pool_size=2, out_files=None, max_restarts=None, verbose=True,
+                 cache_dir=None, cache_max_bytes=None, update=False, lde_export=None, on_result=None):
+    pool = ImportPool(backend_name, pool_size, max_restarts, verbose, cache_dir, cache_max_bytes, update, lde_export)
+    return pool.run(files, out_files, on_result)
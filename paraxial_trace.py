@@ -0,0 +1,471 @@
+# paraxial (first-order) ray trace of a prescription, in NumPy, without OpticStudio
+# a y-nu trace of two basis rays through every surface, vectorized over all the
+# configurations (CONF thickness, curvature, glass and semi-diameter operands applied)
+# and, with trace_batch, over a whole corpus of lenses at once. any other paraxial ray
+# is a combination of the two, so the marginal ray, the chief ray and every field come
+# out of the same trace.
+#
+# first-order metrics per configuration: EFL, BFL, the paraxial image distance and the
+# focus error of the image plane, the entrance pupil (position, and diameter from the
+# image space f/#, as set_system_data sets the aperture), the working f/#, and the
+# paraxial field angle (or object height) of each y_N field (real image heights).
+# check_targets turns the implausible ones into preflight_validator.PreflightIssue
+# warnings, so a mis-typed prescription is caught before any OpticStudio time is spent.
+#
+# indices are at the d line: nd for model glass, and for catalog glass the glass index
+# table (glass_catalog_index.GlassCatalogIndex, or a {glass: nd} dict); a glass that is
+# not in the table makes the metrics of its configurations nan. 'MIRROR' reflects.
+#
+# usage:
+#   metrics = paraxial_trace.paraxial_metrics(lens, glass_index)
+#   metrics.efl, metrics.focus_error, metrics.field_angle_deg      # one entry per config
+#   issues = paraxial_trace.check_targets(metrics, fn)
+#   all_metrics = paraxial_trace.trace_batch(lenses, glass_index)   # one trace for a corpus
+#
+#   python paraxial_trace.py <dir | glob | manifest.txt> [...] [--glass-dir DIR] [--jsonl FILE]
+
+import argparse
+import json
+import sys
+
+import numpy as np
+
+import mce_engine
+from lens_prescription import MATERIAL_MODEL, MATERIAL_CATALOG
+
+# an object distance this large is at infinity (OpticStudio's 1e10)
+OBJECT_INFINITY = 0.5*mce_engine.MCE_INFINITY
+
+MIRROR = 'MIRROR'
+
+# check_targets limits (outside them is a warning: probably a typo or a unit mix-up)
+# image plane distance from the paraxial focus, as a fraction of the EFL
+FOCUS_TOLERANCE = 0.02
+# paraxial field angle of an infinite-conjugate field: an f-theta fisheye at 90 degrees
+# is 57.5 degrees paraxially
+MAX_FIELD_ANGLE_DEG = 65.0
+# paraxial marginal + chief ray height over a given semi-diameter (real rays differ)
+APERTURE_TOLERANCE = 0.5
+
+
+class ParaxialSystem(object):
+    # the first-order model of one lens: (configs x surfaces) arrays, CONF operands applied
+    __slots__ = (
+        'curvature',       # float64, 0 for flat
+        'thickness',       # float64, inf for infinite
+        'index',           # float64 index after each surface (d line), negative after a mirror
+        'semi_diameter',   # float64, nan when not given
+        'stop_surface',    # int, -1 when there is no stop
+        'fno',             # float64 (configs), image space f/#
+        'field_y',         # float64 (configs x fields), real image heights
+        'field_rows',      # CONF row of each field
+        'fno_row',         # CONF row of the f/#, -1 when there is none
+        'image_row',       # CONF row of the last surface's thickness operand, -1 when there is none
+        'unknown_glass',   # {surface: glass name} of glasses without an index
+        )
+
+    @property
+    def n_configs(self):
+        return self.curvature.shape[0]
+
+    @property
+    def n_surfaces(self):
+        return self.curvature.shape[1]
+
+    def __repr__(self):
+        return f"ParaxialSystem({self.n_surfaces} surfaces x {self.n_configs} configs, {self.field_y.shape[1]} fields)"
+
+
+class ParaxialMetrics(object):
+    # first-order metrics of one lens; one entry (row) per configuration
+    __slots__ = (
+        'system',
+        'efl',                       # effective focal length (in air)
+        'bfl',                       # last surface to the infinite-conjugate focus
+        'image_distance',            # last surface to the image plane (the last 'd')
+        'paraxial_image_distance',   # last surface to the paraxial image of the object
+        'focus_error',               # image_distance - paraxial_image_distance
+        'object_at_infinity',        # bool
+        'enp_position',              # entrance pupil, from surface 1
+        'epd',                       # entrance pupil diameter, EFL/fno
+        'working_fno',               # 1/(2 n'u') of the marginal ray
+        'magnification',             # paraxial, nan for an object at infinity
+        'field_angle_deg',           # (configs x fields) paraxial field angle, nan for a finite object
+        'object_height',             # (configs x fields) nan for an object at infinity
+        'marginal_height',           # (configs x surfaces) marginal ray height
+        'chief_height',              # (configs x surfaces) chief ray height of the largest field
+        )
+
+    def to_dict(self, config=0):
+        # plain values of one configuration (e.g. for JSON), None for nan
+        row = {name: getattr(self, name)[config] for name in self.__slots__
+               if name not in ('system', 'marginal_height', 'chief_height')}
+        row['fno'] = self.system.fno[config]
+        row['field_y'] = self.system.field_y[config]
+        return {name: _plain(value) for name, value in row.items()}
+
+    def __repr__(self):
+        return f"ParaxialMetrics(efl={np.round(self.efl, 4).tolist()}, focus_error={np.round(self.focus_error, 4).tolist()})"
+
+
+def _plain(value):
+    # json-safe python value of a numpy scalar or array
+    value = np.asarray(value).tolist()
+    if isinstance(value, list):
+        return [None if (isinstance(v, float) and not np.isfinite(v)) else v for v in value]
+    return None if (isinstance(value, float) and not np.isfinite(value)) else value
+
+
+def _glass_nd(glass_index, glass, catalog=''):
+    # d-line index of a catalog glass (nan when unknown)
+    if glass_index is None:
+        return np.nan
+    if isinstance(glass_index, dict):
+        return float(glass_index.get(glass, np.nan))
+    return float(glass_index.index_of_refraction(glass, catalog))
+
+
+def _curvature(radius):
+    # OpticStudio writes a flat surface as radius 0 (or infinity)
+    with np.errstate(divide='ignore'):
+        return np.where(np.isinf(radius) | (radius == 0), 0.0, 1.0/radius)
+
+
+def build_system(Prescription, glass_index=None):
+    # ParaxialSystem of a prescription, with every configuration's CONF values applied
+    n_surf = Prescription.n_surfaces
+    n_configs = Prescription.n_configs
+    curvature = np.tile(_curvature(Prescription.radius), (n_configs, 1))
+    thickness = np.tile(Prescription.thickness, (n_configs, 1))
+    semi_diameter = np.tile(Prescription.semi_diameter, (n_configs, 1))
+
+    # index magnitude after each surface; mirrors are filled in below
+    nd = np.ones(n_surf)
+    model = Prescription.material_kind == MATERIAL_MODEL
+    nd[model] = Prescription.nd[model]
+    mirror = np.zeros((n_configs, n_surf), dtype=bool)
+    unknown_glass = {}
+    glass_cache = {}
+    for s in np.flatnonzero(Prescription.material_kind == MATERIAL_CATALOG).tolist():
+        glass = str(Prescription.glass[s])
+        if glass.upper() == MIRROR:
+            mirror[:, s] = True
+            continue
+        key = (glass, str(Prescription.catalog[s]))
+        if key not in glass_cache:
+            glass_cache[key] = _glass_nd(glass_index, *key)
+        nd[s] = glass_cache[key]
+        if np.isnan(nd[s]):
+            unknown_glass[s] = glass
+    index = np.tile(nd, (n_configs, 1))
+
+    table = mce_engine.compile_mce_table(Prescription)
+    fno = np.full(n_configs, np.nan)
+    fno_row = -1
+    image_row = -1
+    fields = []
+    for i, spec in enumerate(table.specs):
+        p1 = int(table.param1[i])
+        values = table.values[i]
+        set_cells = ~np.isnan(values)   # an empty cell keeps the SURF value
+        if spec.op_type == 'APER':
+            fno, fno_row = values.copy(), int(table.rows[i])
+        elif spec.op_type == 'YFIE':
+            fields.append((p1, int(table.rows[i]), values))
+        elif not (0 <= p1 < n_surf):
+            continue
+        elif spec.op_type == 'THIC':
+            thickness[set_cells, p1] = np.where(values >= mce_engine.MCE_INFINITY, np.inf, values)[set_cells]
+            if p1 == n_surf - 1:
+                image_row = int(table.rows[i])
+        elif spec.op_type == 'CRVT':
+            curvature[set_cells, p1] = values[set_cells]
+        elif spec.op_type == 'SDIA':
+            semi_diameter[set_cells, p1] = values[set_cells]
+        elif spec.op_type == 'GLSS':
+            for c, glass in enumerate(table.text[i].tolist()):
+                if len(glass) < 1:
+                    continue
+                mirror[c, p1] = glass.upper() == MIRROR
+                if not mirror[c, p1]:
+                    index[c, p1] = _glass_nd(glass_index, glass)
+                    if np.isnan(index[c, p1]):
+                        unknown_glass[p1] = glass
+
+    # a mirror keeps the index magnitude, and flips its sign (as do the thicknesses after it)
+    if mirror.any():
+        for s in np.flatnonzero(mirror.any(axis=0)).tolist():
+            index[mirror[:, s], s] = index[mirror[:, s], s - 1] if s > 0 else 1.0
+        index *= np.where(np.cumsum(mirror, axis=1) % 2 == 1, -1.0, 1.0)
+
+    fields.sort(key=lambda field: field[0])
+    system = ParaxialSystem()
+    system.curvature = curvature
+    system.thickness = thickness
+    system.index = index
+    system.semi_diameter = semi_diameter
+    system.stop_surface = Prescription.stop_surface
+    system.fno = fno
+    system.field_y = np.array([field[2] for field in fields]).T.reshape(n_configs, len(fields))
+    system.field_rows = [field[1] for field in fields]
+    system.fno_row = fno_row
+    system.image_row = image_row
+    system.unknown_glass = unknown_glass
+    return system
+
+
+def trace_basis_rays(curvature, thickness, index):
+    # y (at) and nu = n*u (after) each surface of the basis rays A (y=1, nu=0) and
+    # B (y=0, nu=1), which start at surface 1 in object space: (2 rays, rows, surfaces)
+    # one step per surface, on all the rows (configs, or lenses x configs) at once
+    n_rows, n_surf = curvature.shape
+    power = np.zeros((n_rows, n_surf))
+    power[:, 1:] = (index[:, 1:] - index[:, :-1])*curvature[:, 1:]
+    with np.errstate(invalid='ignore', divide='ignore'):
+        reduced_thickness = thickness/index
+    y = np.zeros((2, n_rows, n_surf))
+    nu = np.zeros((2, n_rows, n_surf))
+    y_s = np.repeat([[1.0], [0.0]], n_rows, axis=1)
+    nu_s = np.repeat([[0.0], [1.0]], n_rows, axis=1)
+    with np.errstate(invalid='ignore', over='ignore'):
+        for s in range(1, n_surf):
+            if s > 1:
+                y_s = y_s + reduced_thickness[:, s - 1]*nu_s
+            nu_s = nu_s - y_s*power[:, s]
+            y[:, :, s] = y_s
+            nu[:, :, s] = nu_s
+    return y, nu
+
+
+def _metrics(curvature, thickness, index, stop, last, fno, field_y):
+    # ParaxialMetrics arrays of stacked rows (last: the last surface of each row)
+    n_rows = curvature.shape[0]
+    rows = np.arange(n_rows)
+    y, nu = trace_basis_rays(curvature, thickness, index)
+    with np.errstate(invalid='ignore', divide='ignore', over='ignore'):
+        y_last, nu_last = y[:, rows, last], nu[:, rows, last]
+        n_image = index[rows, last]
+        image_distance = thickness[rows, last]
+        n_object = index[:, 0]
+        object_distance = thickness[:, 0]
+        at_infinity = ~(np.abs(object_distance) < OBJECT_INFINITY)
+
+        efl = -1.0/nu_last[0]
+        bfl = -y_last[0]*n_image/nu_last[0]
+
+        # chief ray K = a*A + B crosses the axis at the stop (reduced angle 1 in object space)
+        has_stop = (stop >= 1) & (stop <= last)
+        stop_y = y[:, rows, np.clip(stop, 1, curvature.shape[1] - 1)]
+        a = np.where(has_stop, -stop_y[1]/stop_y[0], np.nan)
+        enp_position = -a*n_object
+
+        # marginal ray M = m_a*A + m_b*B through the edge of the entrance pupil
+        epd = np.abs(efl)/fno
+        finite_object = np.where(at_infinity, 0.0, object_distance)
+        w = np.where(at_infinity, 0.0, 0.5*epd*n_object/(finite_object + enp_position))
+        m_a = np.where(at_infinity, 0.5*epd, finite_object*w/n_object)
+        marginal_height = m_a[:, None]*y[0] + w[:, None]*y[1]
+        marginal_nu = m_a*nu_last[0] + w*nu_last[1]
+        marginal_y = m_a*y_last[0] + w*y_last[1]
+        paraxial_image_distance = -marginal_y*n_image/marginal_nu
+        working_fno = 1.0/(2.0*np.abs(marginal_nu))
+        magnification = np.where(at_infinity, np.nan, w/marginal_nu)
+
+        # each field's chief ray is K scaled to reach its image height on the image plane
+        chief_image_y = (a*y_last[0] + y_last[1]) + image_distance*(a*nu_last[0] + nu_last[1])/n_image
+        field_nu = field_y/chief_image_y[:, None]
+        field_angle_deg = np.where(at_infinity[:, None], np.degrees(np.arctan(field_nu/n_object[:, None])), np.nan)
+        object_height = np.where(at_infinity[:, None], np.nan,
+                                 -field_nu*(finite_object + enp_position)[:, None]/n_object[:, None])
+        max_field_nu = np.max(np.abs(np.where(np.isnan(field_nu), 0.0, field_nu)), axis=1, initial=0.0)
+        chief_height = (a[:, None]*y[0] + y[1])*max_field_nu[:, None]
+
+    return {
+        'efl': efl,
+        'bfl': bfl,
+        'image_distance': image_distance,
+        'paraxial_image_distance': paraxial_image_distance,
+        'focus_error': image_distance - paraxial_image_distance,
+        'object_at_infinity': at_infinity,
+        'enp_position': enp_position,
+        'epd': epd,
+        'working_fno': working_fno,
+        'magnification': magnification,
+        'field_angle_deg': field_angle_deg,
+        'object_height': object_height,
+        'marginal_height': marginal_height,
+        'chief_height': chief_height,
+        }
+
+
+def _pad(array, n_cols, value):
+    # pad the last axis of a (rows x cols) array to n_cols
+    if array.shape[1] >= n_cols:
+        return array
+    return np.hstack([array, np.full((array.shape[0], n_cols - array.shape[1]), value)])
+
+
+def trace_systems(systems):
+    # ParaxialMetrics of each ParaxialSystem, from one trace of all their configurations
+    # shorter lenses are padded with powerless, zero-thickness surfaces after their last one
+    n_surf = max([system.n_surfaces for system in systems] + [2])
+    n_fields = max([system.field_y.shape[1] for system in systems] + [0])
+    curvature = np.vstack([_pad(system.curvature, n_surf, 0.0) for system in systems])
+    thickness = np.vstack([_pad(system.thickness, n_surf, 0.0) for system in systems])
+    index = np.vstack([np.hstack([system.index, np.repeat(system.index[:, -1:], n_surf - system.n_surfaces, axis=1)])
+                       for system in systems])
+    stop = np.concatenate([np.full(system.n_configs, system.stop_surface) for system in systems])
+    last = np.concatenate([np.full(system.n_configs, system.n_surfaces - 1) for system in systems])
+    fno = np.concatenate([system.fno for system in systems])
+    field_y = np.vstack([_pad(system.field_y, n_fields, np.nan) for system in systems])
+    arrays = _metrics(curvature, thickness, index, stop, last, fno, field_y)
+
+    results = []
+    start = 0
+    for system in systems:
+        rows = slice(start, start + system.n_configs)
+        start += system.n_configs
+        metrics = ParaxialMetrics()
+        metrics.system = system
+        for name, values in arrays.items():
+            values = values[rows]
+            if name in ('marginal_height', 'chief_height'):
+                values = values[:, :system.n_surfaces]
+            elif name in ('field_angle_deg', 'object_height'):
+                values = values[:, :system.field_y.shape[1]]
+            setattr(metrics, name, values)
+        results.append(metrics)
+    return results
+
+
+def paraxial_metrics(Prescription, glass_index=None):
+    return trace_systems([build_system(Prescription, glass_index)])[0]
+
+
+def trace_batch(prescriptions, glass_index=None):
+    # ParaxialMetrics of each prescription; the trace itself runs once for all of them
+    return trace_systems([build_system(lens, glass_index) for lens in prescriptions])
+
+
+def check_targets(metrics, fn=''):
+    # PreflightIssue warnings for the first-order metrics that cannot be right
+    import preflight_validator
+    chk = preflight_validator._Checker(fn)
+    system = metrics.system
+    last = system.n_surfaces - 1
+
+    def config(c):
+        return f"config {c + 1}: " if system.n_configs > 1 else ''
+
+    for s, glass in sorted(system.unknown_glass.items()):
+        chk.warning('unknown_index', 'SURF', s + 1, 'nd', f"no index for glass {glass!r} (no paraxial metrics)")
+    for c in range(0, system.n_configs):
+        efl = float(metrics.efl[c])
+        if np.isnan(efl):
+            continue
+        if not np.isfinite(efl) or (abs(efl) > 1e6*np.nansum(np.abs(system.thickness[c, 1:]))):
+            chk.warning('afocal', 'SURF', -1, '', f"{config(c)}the lens has no optical power (afocal)")
+            continue
+        if efl < 0:
+            chk.warning('negative_efl', 'SURF', -1, '', f"{config(c)}the effective focal length is negative ({efl:.6g})")
+        focus_error = float(metrics.focus_error[c])
+        if abs(focus_error) > FOCUS_TOLERANCE*abs(efl):
+            side = 'behind' if focus_error > 0 else 'in front of'
+            block, row, column = ('CONF', system.image_row + 1, '') if system.image_row >= 0 else ('SURF', last + 1, 'd')
+            chk.warning('focus', block, row, column,
+                        f"{config(c)}the image plane is {abs(focus_error):.6g} {side} the paraxial focus "
+                        f"(EFL {efl:.6g}; a thickness may be mis-typed)")
+        n_image = abs(float(system.index[c, last]))
+        if float(metrics.working_fno[c]) < 0.5/n_image:
+            chk.warning('fno', 'CONF', system.fno_row + 1, '',
+                        f"{config(c)}f/{system.fno[c]:.6g} gives an image space NA of {0.5/metrics.working_fno[c]:.3g} "
+                        f"(above the image space index {n_image:.4g})")
+        if metrics.object_at_infinity[c]:
+            for f, row in enumerate(system.field_rows):
+                angle = float(metrics.field_angle_deg[c, f])
+                if abs(angle) > MAX_FIELD_ANGLE_DEG:
+                    chk.warning('field', 'CONF', row + 1, '',
+                                f"{config(c)}image height {system.field_y[c, f]:.6g} needs a paraxial field angle of "
+                                f"{angle:.3g} degrees (EFL {efl:.6g})")
+        clearance = np.abs(metrics.marginal_height[c]) + np.abs(metrics.chief_height[c])
+        over = clearance[1:] > (1.0 + APERTURE_TOLERANCE)*system.semi_diameter[c, 1:]
+        for s in (np.flatnonzero(over) + 1).tolist():
+            chk.warning('aperture', 'SURF', s + 1, 'cir',
+                        f"{config(c)}paraxial rays reach height {clearance[s]:.4g}, the semi-diameter is "
+                        f"{system.semi_diameter[c, s]:.4g} (check the f/# and field targets)")
+    return chk.issues
+
+
+# glass indexes loaded in this process, by glass directory
+_glass_indexes = {}
+
+
+def load_glass_index(glass_dir):
+    # glass_catalog_index for a glass directory (None without one), once per process
+    if not glass_dir:
+        return None
+    if glass_dir not in _glass_indexes:
+        import glass_catalog_index
+        _glass_indexes[glass_dir] = glass_catalog_index.load_glass_index(glass_dir)
+    return _glass_indexes[glass_dir]
+
+
+def print_metrics(fn, metrics):
+    print(fn)
+    print(f"    {'config':>6s} {'EFL':>11s} {'BFL':>11s} {'focus err':>11s} {'EPD':>9s} {'ENP':>10s} {'f/#':>6s} "
+          f"{'work f/#':>8s}  fields")
+    for c in range(0, metrics.system.n_configs):
+        if metrics.object_at_infinity[c]:
+            fields = ' '.join(f"{a:.2f}deg" for a in metrics.field_angle_deg[c].tolist())
+        else:
+            fields = ' '.join(f"h={h:.4g}" for h in metrics.object_height[c].tolist())
+        print(f"    {c + 1:6d} {metrics.efl[c]:11.5g} {metrics.bfl[c]:11.5g} {metrics.focus_error[c]:11.4g} "
+              f"{metrics.epd[c]:9.4g} {metrics.enp_position[c]:10.4g} {metrics.system.fno[c]:6.3g} "
+              f"{metrics.working_fno[c]:8.3g}  {fields}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='First-order (paraxial) metrics of patent data workbooks, without OpticStudio.')
+    parser.add_argument('inputs', nargs='+', help='workbook directories, glob patterns, or manifest files (.txt/.lst)')
+    parser.add_argument('--glass-dir', default=None, help='AGF glass catalog directory, for the catalog glass indices')
+    parser.add_argument('--jsonl', default=None, help='also write the metrics of every configuration to this JSON lines file')
+    parser.add_argument('--quiet', action='store_true', help='only print the warnings')
+    args = parser.parse_args(argv)
+
+    import batch_import
+    import read_excel_data
+    files = batch_import.find_workbooks(args.inputs)
+    if len(files) < 1:
+        print("ERROR: no workbooks found")
+        return 1
+    glass_index = load_glass_index(args.glass_dir)
+    lenses = []
+    for fn in files:
+        try:
+            lenses.append((fn, read_excel_data.read_excel_patent_data(fn, as_prescription=True)))
+        except Exception as e:
+            print(f"ERROR: {fn}: {type(e).__name__}: {e}")
+    results = trace_batch([lens for fn, lens in lenses], glass_index)
+
+    n_warned = 0
+    jsonl = open(args.jsonl, 'w') if args.jsonl is not None else None
+    for (fn, lens), metrics in zip(lenses, results):
+        issues = check_targets(metrics, fn)
+        n_warned += len(issues) > 0
+        if not args.quiet:
+            print_metrics(fn, metrics)
+        elif len(issues) > 0:
+            print(fn)
+        for issue in issues:
+            print(f"    {issue}")
+        if jsonl is not None:
+            for c in range(0, metrics.system.n_configs):
+                jsonl.write(json.dumps(dict(file=fn, config=c + 1, **metrics.to_dict(c))) + '\n')
+    if jsonl is not None:
+        jsonl.close()
+    print(f"\nparaxial: {len(lenses)} lenses traced, {n_warned} with warnings")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,148 @@
+# on-disk cache of parsed workbooks
+# entries are keyed by the workbook's content hash and read_excel_data.PARSER_VERSION,
+# and hold the LensPrescription arrays as an uncompressed .npz (loads in milliseconds).
+# the cache directory is kept under a size cap by evicting the least recently used entries.
+#
+# usage:
+#   cache = parse_cache.ParseCache('.parse_cache', max_bytes=256*2**20)
+#   lens = cache.load('lens.xlsx')       # parses on a miss, reloads on a hit
+#   cache.invalidate('lens.xlsx')        # or cache.invalidate() to clear everything
+#   print(cache.stats())
+
+import hashlib
+import os
+import threading
+
+import numpy as np
+
+import lens_prescription
+import read_excel_data
+
+CACHE_EXTENSION = '.npz'
+DEFAULT_MAX_BYTES = 256*2**20
+
+# read the workbook in chunks when hashing
+HASH_CHUNK_SIZE = 2**20
+
+
+def file_digest(fn):
+    # sha256 of the file contents
+    h = hashlib.sha256()
+    with open(fn, 'rb') as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+class ParseCache(object):
+
+    def __init__(self, cache_dir, max_bytes=DEFAULT_MAX_BYTES, parser_version=None):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.parser_version = read_excel_data.PARSER_VERSION if parser_version is None else parser_version
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        os.makedirs(cache_dir, exist_ok=True)
+        # the cap may have been lowered since the last run
+        self.evict()
+
+    def key(self, fn):
+        return f"{file_digest(fn)}-v{self.parser_version}"
+
+    def path(self, key):
+        return os.path.join(self.cache_dir, key + CACHE_EXTENSION)
+
+    def get(self, key):
+        # returns the cached prescription, or None
+        path = self.path(key)
+        try:
+            with np.load(path, allow_pickle=False) as arrays:
+                lens = lens_prescription.LensPrescription.from_arrays(arrays)
+        except (OSError, KeyError, ValueError):
+            # missing, or written by an incompatible version
+            return None
+        # mark as recently used (the LRU order is the file mtime)
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return lens
+
+    def put(self, key, lens):
+        # write to a temp file, then rename, so readers never see a partial entry
+        path = self.path(key)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            np.savez(f, **lens.to_arrays())
+        os.replace(tmp_path, path)
+        self.evict()
+
+    def load(self, fn):
+        # parsed prescription of fn, from the cache when possible
+        return self.lookup(fn)[0]
+
+    def lookup(self, fn):
+        # (parsed prescription of fn, True when it came from the cache)
+        key = self.key(fn)
+        lens = self.get(key)
+        if lens is not None:
+            self.hits += 1
+            return lens, True
+        self.misses += 1
+        lens = read_excel_data.read_excel_patent_data(fn, as_prescription=True)
+        self.put(key, lens)
+        return lens, False
+
+    def entries(self):
+        # (path, size, mtime) of every cache entry, least recently used first
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            if not name.endswith(CACHE_EXTENSION):
+                continue
+            path = os.path.join(self.cache_dir, name)
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            entries.append((path, st.st_size, st.st_mtime))
+        entries.sort(key=lambda e: e[2])
+        return entries
+
+    def evict(self):
+        # remove least recently used entries until the cache fits in max_bytes
+        entries = self.entries()
+        total = sum(e[1] for e in entries)
+        for path, size, mtime in entries:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+            self.evictions += 1
+
+    def invalidate(self, fn=None):
+        # drop the entry for one workbook (any parser version), or the whole cache
+        if fn is None:
+            targets = [e[0] for e in self.entries()]
+        else:
+            prefix = file_digest(fn) + '-'
+            targets = [e[0] for e in self.entries() if os.path.basename(e[0]).startswith(prefix)]
+        for path in targets:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+        return len(targets)
+
+    def stats(self):
+        entries = self.entries()
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'entries': len(entries),
+            'bytes': sum(e[1] for e in entries),
+            }
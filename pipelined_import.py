@@ -0,0 +1,172 @@
+# pipelined import: parse the next workbooks while the current one is written
+# parser threads (or processes) run ahead of the ZOS-API writer, so OpticStudio is not
+# idle while a workbook is unzipped and parsed, and the CPU is not idle while the
+# writer waits on OpticStudio.
+#
+# at most `prefetch` workbooks are parsed (or being parsed) ahead of the writer: a
+# parser that gets that far ahead waits, so a slow writer never piles up parsed
+# lenses in memory. results come back in input order, and a workbook that fails to
+# parse becomes a 'failed' result in its place; it never stops the batch.
+#
+# parser_kind 'thread' suits the zosapi backend (pythonnet releases the GIL while it
+# waits on OpticStudio); 'process' parses in spawned processes, for when the writer
+# is CPU-bound too (e.g. the zmx backend).
+#
+# usage:
+#   results = pipelined_import.run_pipelined(files, zos, backend, prefetch=4)
+#   for parsed in pipelined_import.prefetch_parsed(files, prefetch=4):   # ParsedWorkbook, in order
+#       ...
+
+import collections
+import concurrent.futures
+import threading
+import time
+import traceback
+
+import batch_import
+
+PARSER_THREAD = 'thread'
+PARSER_PROCESS = 'process'
+
+# spawned parser pools that may be replaced after a parser process dies, per run
+MAX_PARSER_RESTARTS = 2
+
+# parse caches of this process, by (cache_dir, max_bytes)
+_caches = {}
+_caches_lock = threading.Lock()
+
+
+def _get_cache(cache_dir, cache_max_bytes):
+    import parse_cache
+    with _caches_lock:
+        key = (cache_dir, cache_max_bytes)
+        if key not in _caches:
+            _caches[key] = parse_cache.ParseCache(cache_dir, cache_max_bytes or parse_cache.DEFAULT_MAX_BYTES)
+        return _caches[key]
+
+
+def parse_workbook(excel_file, cache_dir=None, cache_max_bytes=None):
+    # runs in a parser thread or process: (prescription, parse time, 'hit'/'miss'/'')
+    t0 = time.perf_counter()
+    if cache_dir is None:
+        import read_excel_data
+        lens = read_excel_data.read_excel_patent_data(excel_file, as_prescription=True)
+        cache_state = ''
+    else:
+        lens, hit = _get_cache(cache_dir, cache_max_bytes).lookup(excel_file)
+        cache_state = 'hit' if hit else 'miss'
+    return lens, time.perf_counter() - t0, cache_state
+
+
+class ParsedWorkbook(object):
+    # one workbook out of the parser stage: lens is None when parsing failed
+    __slots__ = ('index', 'file', 'lens', 'error', 'traceback', 'read_time', 'parse_cache', 'wait_time')
+
+    def __init__(self, index, file):
+        self.index = index
+        self.file = file
+        self.lens = None
+        self.error = ''
+        self.traceback = ''
+        self.read_time = 0.0
+        self.parse_cache = ''
+        self.wait_time = 0.0   # time the consumer waited for this workbook
+
+    def __repr__(self):
+        state = 'failed' if self.lens is None else 'ok'
+        return f"ParsedWorkbook({self.index}, {self.file!r}, {state})"
+
+
+def _make_executor(parser_kind, parsers):
+    if parser_kind == PARSER_THREAD:
+        return concurrent.futures.ThreadPoolExecutor(max_workers=parsers, thread_name_prefix='parser')
+    if parser_kind == PARSER_PROCESS:
+        import multiprocessing as mp
+        # spawn (not fork), as everywhere else in the importer
+        return concurrent.futures.ProcessPoolExecutor(max_workers=parsers, mp_context=mp.get_context('spawn'))
+    raise ValueError(f"unknown parser kind '{parser_kind}' (expected '{PARSER_THREAD}' or '{PARSER_PROCESS}')")
+
+
+def prefetch_parsed(files, prefetch=2, parsers=1, parser_kind=PARSER_THREAD, cache_dir=None, cache_max_bytes=None):
+    # generator of ParsedWorkbook, in input order, with at most `prefetch` workbooks
+    # parsed or in flight ahead of the one the consumer holds
+    if prefetch < 1:
+        raise ValueError("prefetch must be at least 1")
+    executor = _make_executor(parser_kind, max(1, parsers))
+    pending = collections.deque()  # (index, future), in input order
+    next_index = 0
+    restarts = 0
+    try:
+        while (len(pending) > 0) or (next_index < len(files)):
+            # top up the window (the next workbook, and `prefetch` more behind it); the
+            # consumer holding a workbook is the backpressure
+            while (next_index < len(files)) and (len(pending) <= prefetch):
+                pending.append((next_index, executor.submit(parse_workbook, files[next_index], cache_dir, cache_max_bytes)))
+                next_index += 1
+
+            index, future = pending.popleft()
+            parsed = ParsedWorkbook(index, files[index])
+            t0 = time.perf_counter()
+            try:
+                parsed.lens, parsed.read_time, parsed.parse_cache = future.result()
+            except concurrent.futures.BrokenExecutor as e:
+                # a parser process died: this workbook fails, the rest are parsed again in a new pool
+                parsed.error = f"parser process died: {e}"
+                if restarts >= MAX_PARSER_RESTARTS:
+                    raise
+                restarts += 1
+                executor.shutdown(wait=False, cancel_futures=True)
+                executor = _make_executor(parser_kind, max(1, parsers))
+                pending = collections.deque((i, executor.submit(parse_workbook, files[i], cache_dir, cache_max_bytes))
+                                            for i, lost in pending)
+            except Exception as e:
+                parsed.error = f"{type(e).__name__}: {e}"
+                parsed.traceback = ''.join(traceback.format_exception(type(e), e, e.__traceback__))
+            parsed.wait_time = time.perf_counter() - t0
+            yield parsed
+    finally:
+        # the consumer stopped early (or raised): drop the read-ahead
+        for index, future in pending:
+            future.cancel()
+        executor.shutdown(wait=True, cancel_futures=True)
+
+
+def _failed_result(parsed, out_file):
+    return {
+        'file': parsed.file,
+        'out_file': out_file,
+        'status': 'failed',
+        'error': parsed.error,
+        'traceback': parsed.traceback,
+        'read_time': parsed.read_time,
+        'write_time': 0.0,
+        'total_time': parsed.read_time,
+        }
+
+
+def run_pipelined(files, zos, backend=None, update=False, prefetch=2, parsers=1, parser_kind=PARSER_THREAD,
+                  cache_dir=None, cache_max_bytes=None, verbose=True, on_result=None):
+    # import every workbook through one connection, parsing ahead of the writer
+    # returns one result dict per file (as batch_import.run_batch), in input order;
+    # each result also has 'wait_time', the time the writer waited on the parsers
+    # on_result (optional): called with each result as soon as it is done
+    results = []
+    for parsed in prefetch_parsed(files, prefetch, parsers, parser_kind, cache_dir, cache_max_bytes):
+        out_file = batch_import.default_out_file(parsed.file)
+        if parsed.lens is None:
+            result = _failed_result(parsed, out_file)
+        else:
+            result = batch_import.import_workbook(parsed.file, zos, out_file, backend=backend, update=update, lens=parsed.lens)
+            result['read_time'] = parsed.read_time
+            result['total_time'] += parsed.read_time
+            if len(parsed.parse_cache) > 0:
+                result['parse_cache'] = parsed.parse_cache
+        # the lens is not kept: memory stays bounded by the prefetch window
+        parsed.lens = None
+        result['wait_time'] = parsed.wait_time
+        results.append(result)
+        if on_result is not None:
+            on_result(result)
+        if verbose:
+            batch_import.print_result(result, len(results) - 1, len(files))
+    return results
@@ -0,0 +1,483 @@
+# preflight validation of patent data workbooks, with no ZOS-API connection
+# checks every structural rule the writers depend on (a '_STO' surface, a '_c' primary
+# wavelength, a_N asphere headers, nd/vd pairs, CONF operand names, ...) in one pass
+# over the raw block columns, and reports them as PreflightIssue records instead of
+# printing half-way through an OpticStudio session. a corpus of workbooks is scanned
+# in parallel, so only clean files are handed to the (license-bound) writer.
+#
+# usage:
+#   issues = preflight_validator.validate_workbook('lens.xlsx')
+#   results = preflight_validator.scan(files, workers=8)     # {file: [PreflightIssue, ...]}
+#   clean = preflight_validator.clean_files(results)
+#
+#   python preflight_validator.py <dir | glob | manifest.txt> [...] [--workers N] [--jsonl issues.jsonl]
+#   [--paraxial [--glass-dir DIR]]   also warn about implausible first-order metrics (paraxial_trace)
+#   [--sag]                          also warn about impossible surface sags and edges (asphere_sag_check)
+# exits with status 1 when any workbook has errors
+
+import argparse
+import json
+import os
+import re
+import sys
+
+import numpy as np
+
+import mce_engine
+import read_excel_data
+
+SEVERITY_ERROR = 'error'
+SEVERITY_WARNING = 'warning'
+
+# column headers each block needs (the writers index these directly)
+REQUIRED_COLUMNS = {
+    'SURF': ['surf_num', 'r', 'd'],
+    'ASPH': ['surf_num', 'ka'],
+    'CONF': ['name'],
+    'WAVE': ['wave_num', 'wavelength_nm', 'weight'],
+    }
+# blocks every workbook needs (META and ASPH are optional)
+REQUIRED_BLOCKS = ['SURF', 'CONF', 'WAVE']
+
+# strings accepted for an infinite radius/thickness (any other string is a typo)
+INF_STRINGS = ('inf', 'infinity', '+inf', 'infinite')
+
+# META lens_unit values set_system_units knows (anything else falls back to mm)
+LENS_UNITS = ('mm', 'millimeter', 'millimeters', 'cm', 'centimeter', 'centimeters',
+              'm', 'meter', 'meters', 'in', 'inch', 'inches')
+
+ASPHERE_HEADER = re.compile(r'a_(\d+)$')
+# the extended asphere has 240 terms at most
+MAX_ASPHERE_TERM = 240
+# OpticStudio's limit on the number of wavelengths
+MAX_WAVELENGTHS = 24
+
+# a spawned worker costs ~0.5 s to start, about as much as parsing 50 small workbooks
+MIN_FILES_PER_WORKER = 50
+
+# plausible ranges (outside them is a warning: probably a unit or column mix-up)
+ND_RANGE = (1.0, 3.0)
+VD_RANGE = (5.0, 120.0)
+WAVELENGTH_NM_RANGE = (150.0, 20000.0)
+
+
+class PreflightIssue(object):
+    # one problem found in a workbook
+    # row is the 1-based data row within the block (0 for the header row, -1 for the whole block)
+    __slots__ = ('file', 'severity', 'code', 'block', 'row', 'column', 'message')
+
+    def __init__(self, file, severity, code, block, row, column, message):
+        self.file = file
+        self.severity = severity
+        self.code = code
+        self.block = block
+        self.row = row
+        self.column = column
+        self.message = message
+
+    @property
+    def is_error(self):
+        return self.severity == SEVERITY_ERROR
+
+    def to_dict(self):
+        return {name: getattr(self, name) for name in self.__slots__}
+
+    def __str__(self):
+        where = self.block
+        if self.row > 0:
+            where += f" row {self.row}"
+        elif self.row == 0:
+            where += " header"
+        if len(self.column) > 0:
+            where += f" '{self.column}'"
+        return f"{self.severity}: {where}: {self.message} [{self.code}]"
+
+    def __repr__(self):
+        return f"PreflightIssue({self.file!r}, {self.severity!r}, {self.code!r}, {self.block!r}, {self.row}, {self.column!r})"
+
+
+class _Column(object):
+    # one block column, classified once: every check below is a mask operation on these
+    __slots__ = ('values', 'is_str', 'is_missing', 'is_number', 'is_inf_str', 'text')
+
+    def __init__(self, column):
+        n = len(column)
+        self.is_str = np.fromiter((isinstance(v, str) for v in column), dtype=bool, count=n)
+        self.is_number = np.fromiter((isinstance(v, (int, float, np.number)) and not isinstance(v, bool) for v in column),
+                                     dtype=bool, count=n)
+        self.values = np.full(n, np.nan)
+        self.values[self.is_number] = [float(v) for v, is_number in zip(column, self.is_number) if is_number]
+        self.is_missing = np.fromiter((v is None for v in column), dtype=bool, count=n) | (self.is_number & np.isnan(self.values))
+        self.is_number &= ~self.is_missing
+        self.text = np.array([v.strip().lower() if isinstance(v, str) else '' for v in column], dtype=str)
+        self.is_inf_str = np.isin(self.text, INF_STRINGS)
+
+    @property
+    def is_other(self):
+        # neither a number, a string, nor empty (e.g. a date cell)
+        return ~(self.is_number | self.is_str | self.is_missing)
+
+
+class _Checker(object):
+    # collects the issues of one workbook
+
+    def __init__(self, fn, catalog_severity=SEVERITY_ERROR):
+        self.fn = fn
+        self.catalog_severity = catalog_severity
+        self.issues = []
+
+    def add(self, severity, code, block, row, column, message):
+        self.issues.append(PreflightIssue(self.fn, severity, code, str(block), int(row), str(column), message))
+
+    def error(self, code, block, row, column, message):
+        self.add(SEVERITY_ERROR, code, block, row, column, message)
+
+    def warning(self, code, block, row, column, message):
+        self.add(SEVERITY_WARNING, code, block, row, column, message)
+
+    def each(self, severity, code, block, column, mask, message):
+        # one issue per row where mask is set
+        for r in np.flatnonzero(mask).tolist():
+            self.add(severity, code, block, r + 1, column, message)
+
+
+def _columns(block):
+    return {name: data for name, data in zip(block['names'], block['data'])}
+
+
+def _n_rows(block):
+    return len(block['data'][0]) if len(block['data']) > 0 else 0
+
+
+def _check_blocks(chk, blocks):
+    for key in blocks.keys():
+        if key not in read_excel_data.LENS_DATA_KEYS:
+            chk.warning('unknown_block', str(key), -1, '', f"unknown column 1 value '{key}' (ignored)")
+    for key in REQUIRED_BLOCKS:
+        if key not in blocks:
+            chk.error('missing_block', key, -1, '', f"no {key} block in column 1")
+    for key, block in blocks.items():
+        names = block['names']
+        for name in REQUIRED_COLUMNS.get(key, []):
+            if name not in names:
+                chk.error('missing_column', key, 0, name, f"no '{name}' column header")
+        if key in read_excel_data.BLOCK_COLUMN_KEYS:
+            for name in names:
+                if name not in read_excel_data.BLOCK_COLUMN_KEYS[key]:
+                    chk.warning('unknown_column', key, 0, name, f"unknown column header (expected one of {read_excel_data.BLOCK_COLUMN_KEYS[key]})")
+        for name in set(n for n in names if names.count(n) > 1):
+            chk.error('duplicate_column', key, 0, name, "column header appears more than once")
+
+
+def _check_meta(chk, block):
+    cols = _columns(block)
+    if ('lens_unit' in cols) and (_n_rows(block) > 0):
+        unit = cols['lens_unit'][0]
+        if not (isinstance(unit, str) and (unit.lower() in LENS_UNITS)):
+            chk.warning('lens_unit', 'META', 1, 'lens_unit', f"unknown lens unit {unit!r} (millimeters will be used)")
+
+
+def _check_finite_or_inf(chk, block_name, name, col):
+    # radius/thickness: a number, or an "INF" string
+    chk.each(SEVERITY_ERROR, 'missing_value', block_name, name, col.is_missing, "empty cell")
+    chk.each(SEVERITY_ERROR, 'bad_number', block_name, name, (col.is_str & ~col.is_inf_str) | col.is_other,
+             "not a number or 'INF'")
+
+
+def _check_surf(chk, block):
+    # returns the number of surfaces (0 when unusable)
+    cols = _columns(block)
+    n_surf = _n_rows(block)
+    if n_surf < 2:
+        chk.error('too_few_surfaces', 'SURF', -1, '', f"{n_surf} surface rows (the object surface and at least one more are needed)")
+    if 'surf_num' not in cols:
+        return n_surf
+
+    surf_names = np.array(['' if v is None or (isinstance(v, float) and np.isnan(v)) else str(v) for v in cols['surf_num']], dtype=str)
+    stop_rows = np.flatnonzero(np.char.find(np.char.lower(surf_names), '_sto') >= 0)
+    if len(stop_rows) < 1:
+        chk.error('no_stop', 'SURF', -1, 'surf_num', "no stop surface: add a '_STO' substring to one surf_num value")
+    else:
+        if stop_rows[0] == 0:
+            chk.error('stop_on_object', 'SURF', 1, 'surf_num', "the object surface cannot be the stop")
+        for r in stop_rows[1:].tolist():
+            chk.warning('multiple_stop', 'SURF', r + 1, 'surf_num', f"more than one '_STO' surface (row {stop_rows[0] + 1} is used)")
+
+    for name in ('r', 'd'):
+        if name in cols:
+            _check_finite_or_inf(chk, 'SURF', name, _Column(cols[name]))
+
+    nd = _Column(cols['nd']) if 'nd' in cols else None
+    vd = _Column(cols['vd']) if 'vd' in cols else None
+    if nd is not None:
+        has_vd_str = vd.is_str if vd is not None else np.zeros(n_surf, dtype=bool)
+        has_vd_number = vd.is_number if vd is not None else np.zeros(n_surf, dtype=bool)
+        chk.each(chk.catalog_severity, 'no_catalog', 'SURF', 'vd', nd.is_str & ~has_vd_str,
+                 "glass name in 'nd' without a catalog name in 'vd'")
+        chk.each(SEVERITY_ERROR, 'model_glass_vd', 'SURF', 'vd', nd.is_number & ~has_vd_number,
+                 "numeric 'nd' (model glass) needs a numeric Abbe number in 'vd'")
+        chk.each(SEVERITY_ERROR, 'bad_number', 'SURF', 'nd', nd.is_other, "not a number or a glass name")
+        chk.each(SEVERITY_WARNING, 'nd_range', 'SURF', 'nd', nd.is_number & ((nd.values < ND_RANGE[0]) | (nd.values > ND_RANGE[1])),
+                 f"refractive index outside {ND_RANGE[0]:g}..{ND_RANGE[1]:g}")
+        if vd is not None:
+            chk.each(SEVERITY_WARNING, 'vd_without_nd', 'SURF', 'vd', nd.is_missing & ~vd.is_missing, "'vd' given without 'nd' (ignored)")
+            chk.each(SEVERITY_WARNING, 'vd_range', 'SURF', 'vd', nd.is_number & vd.is_number & ((vd.values < VD_RANGE[0]) | (vd.values > VD_RANGE[1])),
+                     f"Abbe number outside {VD_RANGE[0]:g}..{VD_RANGE[1]:g}")
+    elif vd is not None:
+        chk.warning('vd_without_nd', 'SURF', 0, 'vd', "'vd' column without an 'nd' column (ignored)")
+
+    if 'cir' in cols:
+        cir = _Column(cols['cir'])
+        chk.each(SEVERITY_WARNING, 'bad_number', 'SURF', 'cir', cir.is_str | cir.is_other, "semi-diameter is not a number (ignored)")
+        chk.each(SEVERITY_ERROR, 'negative_semi_diameter', 'SURF', 'cir', cir.is_number & (cir.values < 0), "negative semi-diameter")
+    return n_surf
+
+
+def _check_asph(chk, block, n_surf):
+    cols = _columns(block)
+    names = block['names']
+    # header: surf_num, ka, then the a_N coefficient columns
+    if names[:2] != ['surf_num', 'ka']:
+        chk.error('asphere_header', 'ASPH', 0, '', f"the first two column headers must be 'surf_num', 'ka' (found {names[:2]})")
+    terms = []
+    for name in names[2:]:
+        match = ASPHERE_HEADER.match(str(name))
+        if match is None:
+            chk.error('asphere_header', 'ASPH', 0, name, "coefficient header must be a_N (coefficient on r^N)")
+            continue
+        term = int(match.group(1))
+        if (term < 1) or (term > MAX_ASPHERE_TERM):
+            chk.error('asphere_header', 'ASPH', 0, name, f"term N of a_N must be 1..{MAX_ASPHERE_TERM}")
+        elif term in terms:
+            chk.error('asphere_header', 'ASPH', 0, name, "coefficient term appears more than once")
+        terms.append(term)
+
+    if 'surf_num' in cols:
+        surf = _Column(cols['surf_num'])
+        is_int = surf.is_number & (surf.values == np.round(surf.values))
+        chk.each(SEVERITY_ERROR, 'asphere_surface', 'ASPH', 'surf_num', ~is_int, "surface number must be an integer")
+        chk.each(SEVERITY_ERROR, 'asphere_surface', 'ASPH', 'surf_num', is_int & ((surf.values < 1) | (surf.values >= n_surf)),
+                 f"surface number outside 1..{n_surf - 1}")
+        values = surf.values[is_int]
+        unique, counts = np.unique(values, return_counts=True)
+        for v in unique[counts > 1].tolist():
+            chk.error('asphere_surface', 'ASPH', -1, 'surf_num', f"surface {int(v)} is listed more than once")
+    for name in names[1:]:
+        if name in cols:
+            col = _Column(cols[name])
+            # a string coefficient would be read as inf
+            chk.each(SEVERITY_ERROR, 'bad_number', 'ASPH', name, col.is_str | col.is_other, "coefficient is not a number")
+
+
+def _check_conf(chk, block, n_surf, n_waves):
+    cols = _columns(block)
+    n_configs = len(block['names']) - 1
+    if n_configs < 1:
+        chk.error('no_configs', 'CONF', 0, '', "no configuration columns after 'name'")
+        return
+    if 'name' not in cols:
+        return
+    # operand names, through the same registry the MCE writers use
+    conf_names = [str(v).strip().lower() if isinstance(v, str) else '' for v in cols['name']]
+    parsed = [mce_engine.parse_operand_name(name) for name in conf_names]
+    keys = np.array(['' if p is None else p[0].key for p in parsed], dtype=str)
+    targets = np.array(['' if p is None else p[0].target for p in parsed], dtype=str)
+    op_types = ['' if p is None else p[0].op_type for p in parsed]
+    param1 = np.array([-1 if p is None else p[1] for p in parsed])
+    param2 = np.array([-1 if p is None else p[2] for p in parsed])
+    for r in np.flatnonzero(keys == '').tolist():
+        chk.warning('unknown_operand', 'CONF', r + 1, 'name', f"unknown operand {cols['name'][r]!r} (ignored; see mce_engine for the operand names)")
+
+    fno_rows = np.flatnonzero(keys == 'fno')
+    if len(fno_rows) < 1:
+        chk.error('no_fno', 'CONF', -1, 'name', "no 'fno' row (the system aperture)")
+    field_rows = np.flatnonzero(keys == 'y')
+    if len(field_rows) < 1:
+        chk.error('no_fields', 'CONF', -1, 'name', "no field ('y_N') rows")
+    elif not np.array_equal(param1[field_rows], np.arange(1, len(field_rows) + 1)):
+        chk.warning('field_numbering', 'CONF', int(field_rows[0]) + 1, 'name',
+                    "field rows are not y_1, y_2, ... in order (fields are added in row order)")
+    # operand numbers: surfaces 0..n_surf-1, fields and wavelengths from 1
+    limits = {mce_engine.TARGET_SURFACE: (0, n_surf - 1, 'surface'),
+              mce_engine.TARGET_FIELD: (1, len(field_rows), 'field'),
+              mce_engine.TARGET_WAVE: (1, n_waves, 'wavelength')}
+    for target, (low, high, what) in limits.items():
+        rows = np.flatnonzero((targets == target) & ((param1 < low) | (param1 > high)))
+        for r in rows.tolist():
+            chk.error('operand_number', 'CONF', r + 1, 'name', f"{what} {param1[r]} is outside {low}..{high}")
+    seen = {}
+    for r, op_type in enumerate(op_types):
+        if len(op_type) < 1:
+            continue
+        operand = (op_type, int(param1[r]), int(param2[r]))
+        if operand in seen:
+            chk.error('duplicate_operand', 'CONF', r + 1, 'name', f"same {op_type} operand as row {seen[operand] + 1} (this row is ignored)")
+        else:
+            seen[operand] = r
+
+    # values: (operands x configs) masks, one column per config
+    config_cols = [_Column(cols[name]) for name in block['names'][1:] if name in cols]
+    is_missing = np.array([c.is_missing for c in config_cols]).T
+    is_number = np.array([c.is_number for c in config_cols]).T
+    is_str = np.array([c.is_str for c in config_cols]).T
+    is_inf_str = np.array([c.is_inf_str for c in config_cols]).T
+    values = np.array([c.values for c in config_cols]).T
+    used = (keys != '')[:, None]
+    is_string_op = np.array([(p is not None) and p[0].is_string for p in parsed], dtype=bool)[:, None]
+    allows_inf = np.isin(keys, ('d', 'r'))[:, None]
+    for r, c in zip(*np.nonzero(used & is_missing)):
+        chk.error('missing_value', 'CONF', r + 1, block['names'][c + 1], f"no {conf_names[r]} value for this configuration")
+    bad = used & ~is_missing & np.where(is_string_op, ~is_str, ~is_number & ~(allows_inf & is_inf_str))
+    for r, c in zip(*np.nonzero(bad)):
+        expected = 'a name' if is_string_op[r, 0] else 'a number'
+        chk.error('bad_number', 'CONF', r + 1, block['names'][c + 1], f"{conf_names[r]} value is not {expected}")
+    bad_fno = (keys == 'fno')[:, None] & is_number & ~(values > 0)
+    for r, c in zip(*np.nonzero(bad_fno)):
+        chk.error('bad_value', 'CONF', r + 1, block['names'][c + 1], "f/# must be positive")
+
+
+def _check_wave(chk, block):
+    cols = _columns(block)
+    n_waves = _n_rows(block)
+    if n_waves < 1:
+        chk.error('no_wavelengths', 'WAVE', -1, '', "no wavelength rows")
+    elif n_waves > MAX_WAVELENGTHS:
+        chk.error('too_many_wavelengths', 'WAVE', -1, '', f"{n_waves} wavelengths (OpticStudio allows {MAX_WAVELENGTHS})")
+    if 'wave_num' in cols:
+        wave_names = np.array([str(v) if isinstance(v, (str, int)) else '' for v in cols['wave_num']], dtype=str)
+        primary_rows = np.flatnonzero(np.char.find(np.char.lower(wave_names), '_c') >= 0)
+        if len(primary_rows) < 1:
+            chk.error('no_primary_wave', 'WAVE', -1, 'wave_num', "no primary wavelength: add a '_c' substring to one wave_num value")
+        for r in primary_rows[1:].tolist():
+            chk.warning('multiple_primary_wave', 'WAVE', r + 1, 'wave_num', f"more than one '_c' wavelength (row {primary_rows[0] + 1} is used)")
+    if 'wavelength_nm' in cols:
+        wl = _Column(cols['wavelength_nm'])
+        chk.each(SEVERITY_ERROR, 'bad_number', 'WAVE', 'wavelength_nm', ~wl.is_number, "wavelength is not a number")
+        chk.each(SEVERITY_ERROR, 'bad_value', 'WAVE', 'wavelength_nm', wl.is_number & ~(wl.values > 0), "wavelength must be positive")
+        chk.each(SEVERITY_WARNING, 'wavelength_range', 'WAVE', 'wavelength_nm',
+                 wl.is_number & (wl.values > 0) & ((wl.values < WAVELENGTH_NM_RANGE[0]) | (wl.values > WAVELENGTH_NM_RANGE[1])),
+                 f"wavelength outside {WAVELENGTH_NM_RANGE[0]:g}..{WAVELENGTH_NM_RANGE[1]:g} nm (is it in nm?)")
+    if 'weight' in cols:
+        weight = _Column(cols['weight'])
+        chk.each(SEVERITY_ERROR, 'bad_number', 'WAVE', 'weight', ~weight.is_number, "weight is not a number")
+        chk.each(SEVERITY_ERROR, 'bad_value', 'WAVE', 'weight', weight.is_number & (weight.values < 0), "weight must not be negative")
+
+
+def validate_blocks(blocks, fn='', infer_catalogs=False, paraxial=False, glass_dir=None, sag=False):
+    # list of PreflightIssue for the read_excel_data.split_blocks output of one workbook
+    # infer_catalogs: a blank 'vd' catalog is only a warning (the writer has a glass
+    # index to infer it from, see glass_catalog_index)
+    # paraxial: a workbook without errors is also traced (paraxial_trace), with the
+    # catalog glass indices from the AGF files in glass_dir
+    # sag: a workbook without errors also has its surface sags and edges checked
+    # (asphere_sag_check)
+    chk = _Checker(fn, SEVERITY_WARNING if infer_catalogs else SEVERITY_ERROR)
+    _check_blocks(chk, blocks)
+    if 'META' in blocks:
+        _check_meta(chk, blocks['META'])
+    n_surf = _check_surf(chk, blocks['SURF']) if 'SURF' in blocks else 0
+    if 'ASPH' in blocks:
+        _check_asph(chk, blocks['ASPH'], n_surf)
+    if 'CONF' in blocks:
+        n_waves = _n_rows(blocks['WAVE']) if 'WAVE' in blocks else 0
+        _check_conf(chk, blocks['CONF'], n_surf, n_waves)
+    if 'WAVE' in blocks:
+        _check_wave(chk, blocks['WAVE'])
+    if (paraxial or sag) and not has_errors(chk.issues):
+        import paraxial_trace
+        lens = read_excel_data.lens_data_from_blocks(blocks, as_prescription=True)
+        glass_index = paraxial_trace.load_glass_index(glass_dir)
+        if paraxial:
+            metrics = paraxial_trace.paraxial_metrics(lens, glass_index)
+            chk.issues += paraxial_trace.check_targets(metrics, fn)
+        if sag:
+            import asphere_sag_check
+            chk.issues += asphere_sag_check.check_sag(asphere_sag_check.sag_report(lens, glass_index), fn)
+    return chk.issues
+
+
+def validate_workbook(fn, infer_catalogs=False, paraxial=False, glass_dir=None, sag=False):
+    # list of PreflightIssue for one workbook (a workbook that cannot be read is one error)
+    try:
+        blocks = read_excel_data.read_blocks(fn)
+    except Exception as e:
+        return [PreflightIssue(fn, SEVERITY_ERROR, 'unreadable', '', -1, '', f"{type(e).__name__}: {e}")]
+    return validate_blocks(blocks, fn, infer_catalogs, paraxial, glass_dir, sag)
+
+
+def has_errors(issues):
+    return any(issue.is_error for issue in issues)
+
+
+def scan(files, workers=None, infer_catalogs=False, paraxial=False, glass_dir=None, sag=False):
+    # {file: [PreflightIssue, ...]} for every file, in order
+    # workers > 1 spreads the files over a process pool (parsing is CPU-bound); small
+    # batches use fewer workers, so start-up does not cost more than it saves
+    if workers is None:
+        workers = os.cpu_count() or 1
+    workers = max(1, min(workers, len(files) // MIN_FILES_PER_WORKER))
+    if workers == 1:
+        return {fn: validate_workbook(fn, infer_catalogs, paraxial, glass_dir, sag) for fn in files}
+    import concurrent.futures
+    import functools
+    import multiprocessing as mp
+    # several files per task: the per-file work is small next to the task round trip
+    chunksize = max(1, len(files) // (4*workers))
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers, mp_context=mp.get_context('spawn')) as pool:
+        issues = pool.map(functools.partial(validate_workbook, infer_catalogs=infer_catalogs, paraxial=paraxial, glass_dir=glass_dir, sag=sag),
+                          files, chunksize=chunksize)
+        return dict(zip(files, issues))
+
+
+def clean_files(results):
+    # the files without errors (warnings are allowed)
+    return [fn for fn, issues in results.items() if not has_errors(issues)]
+
+
+def print_report(results, warnings=True):
+    n_errors = 0
+    for fn, issues in results.items():
+        shown = [issue for issue in issues if warnings or issue.is_error]
+        if len(shown) < 1:
+            continue
+        print(fn)
+        for issue in shown:
+            print(f"    {issue}")
+        n_errors += has_errors(issues)
+    print(f"\npreflight: {len(results) - n_errors} of {len(results)} workbooks clean ({n_errors} with errors)")
+
+
+def write_jsonl(results, fn):
+    # one issue per line
+    with open(fn, 'w') as f:
+        for issues in results.values():
+            for issue in issues:
+                f.write(json.dumps(issue.to_dict()) + '\n')
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Check patent data workbooks before importing them (no OpticStudio needed).')
+    parser.add_argument('inputs', nargs='+', help='workbook directories, glob patterns, or manifest files (.txt/.lst)')
+    parser.add_argument('--workers', type=int, default=None, help='parallel processes (default: one per CPU)')
+    parser.add_argument('--infer-catalogs', action='store_true', help="a blank 'vd' catalog is a warning, not an error")
+    parser.add_argument('--errors-only', action='store_true', help='do not print warnings')
+    parser.add_argument('--jsonl', default=None, help='also write every issue to this JSON lines file')
+    parser.add_argument('--paraxial', action='store_true', help='also check the first-order metrics (EFL, focus, f/#, fields)')
+    parser.add_argument('--sag', action='store_true', help='also check the surface sags and edge thicknesses (aspheres, conics)')
+    parser.add_argument('--glass-dir', default=None, help='with --paraxial/--sag, AGF glass catalog directory for the catalog glass indices')
+    args = parser.parse_args(argv)
+
+    import batch_import
+    files = batch_import.find_workbooks(args.inputs)
+    if len(files) < 1:
+        print("ERROR: no workbooks found")
+        return 1
+    results = scan(files, args.workers, args.infer_catalogs, args.paraxial, args.glass_dir, args.sag)
+    print_report(results, warnings=not args.errors_only)
+    if args.jsonl is not None:
+        write_jsonl(results, args.jsonl)
+    return 0 if len(clean_files(results)) == len(files) else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,17 +1,291 @@
-import pandas as pd
 import numpy as np
+
+import import_profiler
 # function to support reading data from excel into pandas dataframes
 # organize each data block (META, SURF, ASPH, CONF, WAVE) into a dataframe, and store as dict 
 
+# version of the parsed output; bump it whenever parsing (or the LensPrescription
+# layout) changes, so cached parses from older versions are not reused
+PARSER_VERSION = 3
+
+# cell strings that pd.read_excel treats as missing values
+EXCEL_NA_STRINGS = frozenset(['', '#N/A', '#N/A N/A', '#NA', '-1.#IND', '-1.#QNAN', '-NaN', '-nan',
+                              '1.#IND', '1.#QNAN', '<NA>', 'N/A', 'NA', 'NULL', 'NaN', 'None', 'n/a', 'nan', 'null'])
+
+
+# expected keys: excel sheet column 1 values, and the META/SURF/WAVE column headers
+LENS_DATA_KEYS = ['META', 'SURF', 'ASPH', 'CONF', 'WAVE']
+BLOCK_COLUMN_KEYS = {
+    'META': ['lens_unit'],
+    'SURF': ['surf_num', 'r', 'd', 'nd', 'vd', 'cir'],
+    'WAVE': ['wave_num', 'wavelength_nm', 'weight'],
+    }
+#expected_conf_operand_types = ['d_', 'fno', 'y_'] # excel sheet CONF name value types
+
+
 def check_excel_data_key(expected_keys, keys, str1, str2):
-    # check if the keys are valid
-    for key in keys:
-        if key not in expected_keys:
-            print(f"error: unknown {str1} key '{key}'")
-            print(f"excel {str2} should only contain the following values: \n{expected_keys}")
-            return
-
-def read_excel_patent_data(fn):
+    # check if the keys are valid; returns the unknown keys
+    unknown_keys = [key for key in keys if key not in expected_keys]
+    for key in unknown_keys:
+        print(f"error: unknown {str1} key '{key}'")
+    if len(unknown_keys) > 0:
+        print(f"excel {str2} should only contain the following values: \n{expected_keys}")
+    return unknown_keys
+
+
+def check_lens_data_keys(lens_data):
+    # here is an example of how we could handle errors...
+    # returns {block: unknown keys}, with '' for unknown column 1 values (empty when all keys are valid)
+    unknown = {}
+    bad_keys = check_excel_data_key(LENS_DATA_KEYS, lens_data.keys(), "lens data", "column 1")
+    if len(bad_keys) > 0:
+        unknown[''] = bad_keys
+    for key, str1, str2 in [('META', "meta data", "META data column headers"),
+                            ('SURF', "surface data", "SURF data column headers"),
+                            ('WAVE', "wave data", "WAVE data column headers")]:
+        if key not in lens_data.keys():
+            continue
+        bad_keys = check_excel_data_key(BLOCK_COLUMN_KEYS[key], lens_data[key].keys(), str1, str2)
+        if len(bad_keys) > 0:
+            unknown[key] = bad_keys
+    return unknown
+
+
+def convert_cell(value):
+    # convert an openpyxl cell value the same way pd.read_excel does
+    if value is None:
+        return np.nan
+    if isinstance(value, str):
+        if value in EXCEL_NA_STRINGS:
+            return np.nan
+        return value
+    if isinstance(value, float):
+        # whole numbers come back as int
+        if value.is_integer():
+            return int(value)
+    return value
+
+
+def iter_sheet_rows(fn, sheet=0):
+    # stream the raw cell values of one sheet, row by row (openpyxl read-only mode)
+    import openpyxl
+    wb = openpyxl.load_workbook(fn, read_only=True, data_only=True)
+    try:
+        ws = wb.worksheets[sheet] if isinstance(sheet, int) else wb[sheet]
+        for row in ws.iter_rows(values_only=True):
+            yield row
+    finally:
+        wb.close()
+
+
+def add_block_row(blocks, row):
+    # the first row of each block type (excel column 1) is its header, the rest are data;
+    # each block is kept as a list of columns
+    key = row[0]
+    if key not in blocks:
+        # header row: keep only the named columns (drops the empty/NaN header cols)
+        header = [convert_cell(v) for v in row]
+        cols = [c for c in range(1, len(header)) if not (isinstance(header[c], float) and np.isnan(header[c]))]
+        blocks[key] = {'names': [header[c] for c in cols],
+                       'cols': cols,
+                       'data': [[] for c in cols]}
+        return
+    block = blocks[key]
+    n = len(row)
+    for data, c in zip(block['data'], block['cols']):
+        data.append(convert_cell(row[c]) if c < n else np.nan)
+
+
+def split_blocks(rows):
+    # single pass over the rows, splitting them into blocks
+    blocks = {}
+    for row in rows:
+        if len(row) < 1 or row[0] is None:
+            continue
+        add_block_row(blocks, row)
+    return blocks
+
+
+def split_block_groups(rows):
+    # split_blocks, one lens at a time: a block type that comes back after another block
+    # type starts the next lens (repeated META ... WAVE groups in one sheet). yields each
+    # group's blocks as soon as the next one starts, so only one lens is held at a time
+    blocks = {}
+    last_key = None
+    for row in rows:
+        if len(row) < 1 or row[0] is None:
+            continue
+        key = row[0]
+        if (key in blocks) and (key != last_key):
+            yield blocks
+            blocks = {}
+        add_block_row(blocks, row)
+        last_key = key
+    if len(blocks) > 0:
+        yield blocks
+
+
+class BlockTable(object):
+    # lightweight stand-in for a block dataframe: the column lists, by header name
+    # (all that check_lens_data_keys and LensPrescription.from_lens_data need, without pandas)
+
+    def __init__(self, names, data):
+        self.names = names
+        self.data = data
+
+    def keys(self):
+        return list(self.names)
+
+    def __getitem__(self, name):
+        return self.data[self.names.index(name)]
+
+    def __len__(self):
+        return len(self.data[0]) if len(self.data) > 0 else 0
+
+
+def build_block_tables(blocks):
+    return {key: BlockTable(block['names'], block['data']) for key, block in blocks.items()}
+
+
+def build_lens_data(blocks):
+    # build each block's dataframe directly from its column lists
+    import pandas as pd
+    lens_data = {}
+    for key, block in blocks.items():
+        lens_data[key] = pd.DataFrame({i: pd.Series(data, dtype=object) for i, data in enumerate(block['data'])})
+        lens_data[key].columns = pd.Index(block['names'], dtype=object)
+    return lens_data
+
+
+def read_blocks(fn):
+    # stream the first sheet once, splitting rows into blocks as we go
+    # (.csv/.json/.parquet hold the same blocks, see block_formats)
+    with import_profiler.get_profiler().stage('read_rows'):
+        if not fn.lower().endswith('.xlsx'):
+            import block_formats
+            return block_formats.read_blocks(fn)
+        # reading and splitting are one streaming pass
+        return split_blocks(iter_sheet_rows(fn))
+
+
+def lens_data_from_blocks(blocks, as_prescription=False):
+    # the dict of block dataframes (or a LensPrescription) from split_blocks output
+    profiler = import_profiler.get_profiler()
+    with profiler.stage('build_lens_data'):
+        # the prescription is built from the column lists directly: no pandas import needed
+        lens_data = build_block_tables(blocks) if as_prescription else build_lens_data(blocks)
+
+    # we now have a dict of dataframes, with names taken from excel column 1
+    # example usage:
+    #print(lens_data.keys())
+    #print(lens_data['SURF'].keys())
+    #print(lens_data['SURF']['r'])
+    #print(lens_data['SURF']['r'][5])
+
+    with profiler.stage('check_lens_data_keys'):
+        check_lens_data_keys(lens_data)
+
+    if as_prescription:
+        import lens_prescription
+        with profiler.stage('as_prescription'):
+            return lens_prescription.LensPrescription.from_lens_data(lens_data)
+    return lens_data
+
+
+def read_excel_patent_data(fn, as_prescription=False):
+    # stream the first sheet once, splitting rows into blocks as we go
+    # (same result as read_excel_patent_data_pandas, without the full-sheet copies)
+    # as_prescription=True returns a compact lens_prescription.LensPrescription instead
+    return lens_data_from_blocks(read_blocks(fn), as_prescription)
+
+
+# multi-lens workbooks: one embodiment per sheet, and/or repeated META ... WAVE groups
+# in a sheet. streamed one lens at a time (openpyxl read-only), in a single open of the
+# workbook: each lens is handed over as soon as the next one starts, and nothing here
+# keeps it once the caller moves on, so a 50-embodiment patent holds one lens's blocks.
+# sheets (or groups) holding none of the LENS_DATA_KEYS, e.g. a notes sheet, are skipped.
+#
+#   for label, lens in read_excel_data.iter_embodiments('patent.xlsx'):
+#       ...   # label: sheet title; a sheet's 2nd, 3rd ... lens gets _2, _3 ...
+
+class Embodiment(object):
+    # one lens of a workbook: where it is, and its split_blocks output
+    __slots__ = ('sheet', 'group', 'blocks')
+
+    def __init__(self, sheet, group, blocks):
+        self.sheet = sheet
+        self.group = group
+        self.blocks = blocks
+
+    @property
+    def label(self):
+        # sheet title for a sheet's first lens, with the 1-based group number for the others
+        # (and for every lens of a .csv/.json/.parquet input, which has no sheet title);
+        # known without reading ahead
+        if len(self.sheet) < 1:
+            return str(self.group + 1)
+        if self.group == 0:
+            return self.sheet
+        return f"{self.sheet}_{self.group + 1}"
+
+    def __repr__(self):
+        return f"Embodiment({self.label!r})"
+
+
+def iter_workbook_sheets(fn):
+    # (sheet title, row iterator) of every sheet, in one open of the workbook
+    import openpyxl
+    wb = openpyxl.load_workbook(fn, read_only=True, data_only=True)
+    try:
+        for ws in wb.worksheets:
+            yield ws.title, ws.iter_rows(values_only=True)
+    finally:
+        wb.close()
+
+
+def _read_one_group(fn):
+    # .json/.parquet hold one lens
+    import block_formats
+    yield block_formats.read_blocks(fn)
+
+
+def _iter_sheet_groups(fn):
+    # (sheet title, block groups) of fn, by input format
+    if fn.lower().endswith('.xlsx'):
+        for title, rows in iter_workbook_sheets(fn):
+            yield str(title), split_block_groups(rows)
+    elif fn.lower().endswith('.csv'):
+        import block_formats
+        yield '', split_block_groups(block_formats.iter_csv_rows(fn))
+    else:
+        yield '', _read_one_group(fn)
+
+
+def iter_embodiment_blocks(fn):
+    # yields an Embodiment per lens in fn; each group is let go before the next is read
+    for title, groups in _iter_sheet_groups(fn):
+        group = 0
+        for blocks in groups:
+            if any(key in blocks for key in LENS_DATA_KEYS):
+                yield Embodiment(title, group, blocks)
+                group += 1
+            blocks = None
+
+
+def iter_embodiments(fn, as_prescription=True):
+    # yields (label, lens) for every lens in fn, one at a time (see Embodiment)
+    for embodiment in iter_embodiment_blocks(fn):
+        label, blocks = embodiment.label, embodiment.blocks
+        embodiment = None
+        lens = lens_data_from_blocks(blocks, as_prescription)
+        blocks = None
+        yield label, lens
+        lens = None
+
+
+def read_excel_patent_data_pandas(fn):
+    # original implementation: slices one full-sheet copy per block (kept for reference/benchmarks)
+    import pandas as pd
     df = pd.read_excel(fn, header=None)
 
     data_types = df[0][:].unique()
@@ -40,17 +314,6 @@ def read_excel_patent_data(fn):
     #print(lens_data['SURF']['r'])
     #print(lens_data['SURF']['r'][5])
 
-    # here is an example of how we could handle errors...
-    expected_lens_data_keys = ['META', 'SURF', 'ASPH', 'CONF', 'WAVE'] # excel sheet column 1 values
-    expected_meta_data_keys = ['lens_unit'] # excel sheet META column headers
-    expected_surf_data_keys = ['surf_num', 'r', 'd', 'nd', 'vd', 'cir'] # excel sheet SURF column headers
-    expected_wave_data_keys = ['wave_num', 'wavelength_nm', 'weight'] # excel sheet WAVE column headers
-    #expected_conf_operand_types = ['d_', 'fno', 'y_'] # excel sheet CONF name value types
-
-    check_excel_data_key(expected_lens_data_keys, lens_data.keys(), "lens data", "column 1")
-    check_excel_data_key(expected_meta_data_keys, lens_data['META'].keys(), "meta data", "META data column headers")
-    check_excel_data_key(expected_surf_data_keys, lens_data['SURF'].keys(), "surface data", "SURF data column headers")
-    check_excel_data_key(expected_wave_data_keys, lens_data['WAVE'].keys(), "wave data", "WAVE data column headers")
-
-    
+    check_lens_data_keys(lens_data)
+
     return lens_data
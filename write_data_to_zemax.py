@@ -1,12 +1,39 @@
-import pandas as pd
+import os
+
 import numpy as np
-import matplotlib.pyplot as plt
-from pandas.plotting import table
+
+import import_profiler
+import lde_write_plan
+import lens_prescription
+import mce_engine
+import zos_call_counter
+from lens_prescription import MATERIAL_CATALOG
+from mce_engine import MCE_INFINITY
+
+# version of the ZOS-API writer output; bump it whenever the written system changes, so
+# corpus manifests (import_manifest) re-import workbooks written by an older version
+WRITER_VERSION = 2
+
+# LDE readback: (column, surface property)
+LDE_COLUMNS = [
+    ('surftype', 'Type'),
+    ('comment', 'Comment'),
+    ('radius', 'Radius'),
+    ('thickness', 'Thickness'),
+    ('material', 'Material'),
+    ('clearSD', 'SemiDiameter'),
+    ('chip', 'ChipZone'),
+    ('mechSD', 'MechanicalSemiDiameter'),
+    ('conic', 'Conic'),
+    ]
+LDE_EXPORT_FORMATS = ('csv', 'parquet')
 
 def render_mpl_table(data, col_width=6.0, row_height=0.625, font_size=10):
     """
     plots a pandas df via matplotlib, with some basic formatting
     """
+    # only needed for interactive use; keep matplotlib out of the import path
+    import matplotlib.pyplot as plt
 
     data_print=data.round(4)
     #data_print[data_print >= 1e10] = np.inf
@@ -23,44 +50,80 @@ def render_mpl_table(data, col_width=6.0, row_height=0.625, font_size=10):
     return
 
 
-def display_lde(TheSystem):
-    # build a temporary dataframe, reading values from LDE, then print
+def lde_snapshot(TheSystem):
+    # read the LDE back as a dataframe: each surface is fetched once,
+    # and the columns are collected as lists and built into the frame in one go
+    import pandas as pd
 
-    nsurf = TheSystem.LDE.NumberOfSurfaces
-    lde = pd.DataFrame({
-            'surftype': pd.Series(dtype='str'),
-            'comment': pd.Series(dtype='str'),
-            'radius': pd.Series(dtype='float'),
-            'thickness': pd.Series(dtype='float'),
-            'material': pd.Series(dtype='str'),
-            'clearSD': pd.Series(dtype='float'),
-            'chip': pd.Series(dtype='float'),
-            'mechSD': pd.Series(dtype='float'),
-            'conic': pd.Series(dtype='float'),
-            }, index=np.arange(nsurf))
-
-    # print the values
+    LDE = TheSystem.LDE
+    nsurf = LDE.NumberOfSurfaces
+    columns = {col: [None] * nsurf for col, prop in LDE_COLUMNS}
     for s in range(0, nsurf):
-        lde.loc[s,'surftype'] = TheSystem.LDE.GetSurfaceAt(s).Type.ToString()
-        lde.loc[s,'comment'] = TheSystem.LDE.GetSurfaceAt(s).Comment
-        lde.loc[s,'radius'] = TheSystem.LDE.GetSurfaceAt(s).Radius
-        lde.loc[s,'thickness'] = TheSystem.LDE.GetSurfaceAt(s).Thickness
-        lde.loc[s,'material'] = TheSystem.LDE.GetSurfaceAt(s).Material
-        lde.loc[s,'clearSD'] = TheSystem.LDE.GetSurfaceAt(s).SemiDiameter
-        lde.loc[s,'chip'] = TheSystem.LDE.GetSurfaceAt(s).ChipZone
-        lde.loc[s,'mechSD'] = TheSystem.LDE.GetSurfaceAt(s).MechanicalSemiDiameter
-        lde.loc[s,'conic'] = TheSystem.LDE.GetSurfaceAt(s).Conic
-        
+        this_surf = LDE.GetSurfaceAt(s)
+        for col, prop in LDE_COLUMNS:
+            columns[col][s] = getattr(this_surf, prop)
+    columns['surftype'] = [t.ToString() for t in columns['surftype']]
+
+    lde = pd.DataFrame(columns)
+    for col in ('radius', 'thickness', 'clearSD', 'chip', 'mechSD', 'conic'):
+        lde[col] = lde[col].astype(float)
+    return lde
+
+
+def lde_export_path(out_fn, fmt):
+    # LDE readback file next to the .zmx, e.g. lens_ZemaxImport_LDE.csv
+    return os.path.splitext(out_fn)[0] + '_LDE.' + fmt
+
+
+def save_system(TheSystem, out_fn):
+    # save into a temp directory next to out_fn, then rename what SaveAs wrote there (the
+    # .zmx and its companion files, e.g. the .ZDA) over the outputs, the .zmx last: a crash
+    # mid-save leaves the previous files whole, never a partial one. (a crash between the
+    # renames can still pair a new .ZDA with the old .zmx; the manifest does not count an
+    # output until its stat is recorded after the save.) the system is then reopened from
+    # out_fn, so TheSystem.SystemFile is the real path (warm sessions and --update use it)
+    out_dir = os.path.dirname(os.path.abspath(out_fn))
+    tmp_dir = f"{os.path.abspath(out_fn)}.{os.getpid()}.tmp"
+    os.makedirs(tmp_dir, exist_ok=True)
+    try:
+        TheSystem.SaveAs(os.path.join(tmp_dir, os.path.basename(out_fn)))
+        saved = sorted(os.listdir(tmp_dir), key=lambda fn: fn == os.path.basename(out_fn))
+        for fn in saved:
+            os.replace(os.path.join(tmp_dir, fn), os.path.join(out_dir, fn))
+    finally:
+        for fn in os.listdir(tmp_dir):
+            os.remove(os.path.join(tmp_dir, fn))
+        os.rmdir(tmp_dir)
+    TheSystem.LoadFile(out_fn, False)
+
+
+def export_lde(lde, fn):
+    # .csv, or .parquet (needs pyarrow or fastparquet)
+    if fn.lower().endswith('.parquet'):
+        lde.to_parquet(fn, index=False)
+    else:
+        lde.to_csv(fn, index_label='surface')
+
+
+def display_lde(TheSystem, export_fn=None, show=True):
+    # read values from LDE, then print and/or export them
+    lde = lde_snapshot(TheSystem)
+
     # display the LDE table
-    print(lde)
+    if show:
+        print(lde)
+
+    if export_fn is not None:
+        export_lde(lde, export_fn)
 
     # better yet, make a table with mpl
     # this is giving a weird error, but works...
     #render_mpl_table(lde, col_width=1.0, font_size=10)
+    return lde
 
 
-def set_system_units(TheSystem, PatentData, ZOSAPI):
-    unit = PatentData['META']['lens_unit'][0].lower()
+def set_system_units(TheSystem, Prescription, ZOSAPI):
+    unit = Prescription.meta.lens_unit.lower()
     if (unit=='meters') | (unit=='meter') | (unit=='m'):
         TheSystem.SystemData.Units.LensUnits = ZOSAPI.SystemData.ZemaxSystemUnits.Meters
     elif (unit=='inches') | (unit=='inch') | (unit=='in'):
@@ -71,56 +134,56 @@ def set_system_units(TheSystem, PatentData, ZOSAPI):
         TheSystem.SystemData.Units.LensUnits = ZOSAPI.SystemData.ZemaxSystemUnits.Millimeters
 
 
-def insert_surfaces(TheSystem, PatentData):
+def insert_surfaces(TheSystem, Prescription):
     # add required number of rows to LDE
-    for s in range(0, len(PatentData['SURF']['surf_num']) - 2):
-        TheSystem.LDE.InsertNewSurfaceAt(2)
+    LDE = TheSystem.LDE
+    for s in range(0, Prescription.n_surfaces - 2):
+        LDE.InsertNewSurfaceAt(2)
 
     # set the stop, based on '_STO' substring
-    surf_data = PatentData['SURF']
-    stop_surf = surf_data[surf_data['surf_num'].str.lower().str.contains('_sto')].index[0].item()
-    if not stop_surf:
+    stop_surf = Prescription.stop_surface
+    if stop_surf < 0:
         print("\nERROR: no stop surface found")
         print("ensure there is a '_STO' substring in the surface number data\n\n")
-    TheSystem.LDE.GetSurfaceAt(stop_surf).IsStop = True
-
-
-def set_surface_types(TheSystem, PatentData, ZOSAPI):
-    if 'ASPH' not in PatentData.keys():
         return
-
-    # note: we only allow extended asphere for now
-    TmpSurf = TheSystem.LDE.GetSurfaceAt(1)
-    Asphere = TmpSurf.GetSurfaceTypeSettings(ZOSAPI.Editors.LDE.SurfaceType.ExtendedOddAsphere)
-    # can add other types here...
-
-    for s in range(0, len(PatentData['ASPH']['surf_num'])):
-        ThisSurf = TheSystem.LDE.GetSurfaceAt(PatentData['ASPH']['surf_num'][s])
-        ThisSurf.ChangeType(Asphere)
+    LDE.GetSurfaceAt(stop_surf).IsStop = True
 
 
-def set_glass_catalogs(TheSystem, PatentData):
+def set_glass_catalogs(TheSystem, Prescription, glass_index=None):
     # add all the required glass catalogs into the system explorer
-    materials = PatentData['SURF']['nd'].dropna()
-    catalogs = PatentData['SURF']['vd'].dropna()
-    catalogs_to_use = []
-    for i in materials.index.values:
-        material_name = materials[i]
-        try: 
-            catalog_name = catalogs[i]
-        except:
-            print("error: each SURF 'nd' value must have corresponding 'vd' value")
-        if type(material_name) != str:
+    # with a glass_catalog_index.GlassCatalogIndex, glass validation is a dict lookup (no API
+    # calls per surface), and a blank 'vd' catalog is inferred from the glass name
+    if glass_index is not None:
+        for s in glass_index.resolve_catalogs(Prescription):
+            print(f"error: material {Prescription.glass[s]} not found in any glass catalog\n")
+
+    catalogs_to_use = {}  # ordered set
+    catalog_materials = {}
+    for s in np.flatnonzero(Prescription.material_kind == MATERIAL_CATALOG).tolist():
+        material_name = str(Prescription.glass[s])
+        catalog_name = str(Prescription.catalog[s])
+        if len(catalog_name) < 1:
+            if glass_index is None:
+                print("error: each SURF 'nd' value must have corresponding 'vd' value")
             continue
-        if catalog_name not in catalogs_to_use:
-            catalogs_to_use.append(catalog_name)
+        catalogs_to_use[catalog_name] = None
         # also check here if the glass name exists in the catalog
-        if material_name not in TheSystem.SystemData.MaterialCatalogs.GetMaterialsInCatalog(catalog_name):
+        if glass_index is not None:
+            found = glass_index.has_material(catalog_name, material_name)
+        else:
+            if catalog_name not in catalog_materials:
+                # one API call per catalog, not per surface
+                catalog_materials[catalog_name] = TheSystem.SystemData.MaterialCatalogs.GetMaterialsInCatalog(catalog_name)
+            found = material_name in catalog_materials[catalog_name]
+        if not found:
             print(f"error: material {material_name} not found in catalog {catalog_name}\n")
 
     # add all the catalogs to the System Explorer
-    available_catalogs = TheSystem.SystemData.MaterialCatalogs.GetAvailableCatalogs()
-    default_catalogs = TheSystem.SystemData.MaterialCatalogs.GetCatalogsInUse()
+    if glass_index is not None:
+        available_catalogs = glass_index.catalogs
+    else:
+        available_catalogs = set(TheSystem.SystemData.MaterialCatalogs.GetAvailableCatalogs())
+    default_catalogs = list(TheSystem.SystemData.MaterialCatalogs.GetCatalogsInUse())
     for c in catalogs_to_use:
         if (c not in available_catalogs) and (c not in default_catalogs):
             print(f"error: glass catalog {c} not found in AGF file\n")
@@ -133,224 +196,133 @@ def set_glass_catalogs(TheSystem, PatentData):
             TheSystem.SystemData.MaterialCatalogs.RemoveCatalog(c_default)
 
 
-def set_surface_data(TheSystem, PatentData, ZOSAPI):
-    # set all the surface data values
+def set_surface_data(TheSystem, Prescription, ZOSAPI):
+    # set the surface types and all the surface data values
+    # compiled into a per-surface write plan first (see lde_write_plan), so each
+    # surface is fetched once and default values are not written
+    plan = lde_write_plan.compile_lde_plan(Prescription)
+    lde_write_plan.execute_lde_plan(TheSystem, plan, ZOSAPI)
 
-    # set all standard surface data
-    for s in range(0, len(PatentData['SURF']['surf_num'])):
-        this_surf = TheSystem.LDE.GetSurfaceAt(s)
 
-        # address by key name (alternatively, could use column#...)
-        # apply comment
-        this_surf.Comment = PatentData['SURF']['surf_num'][s]
-        
-        # apply radius of curvature
-        if isinstance(PatentData['SURF']['r'][s], str):
-            # allow string (i.e. "INF") for radius
-            this_surf.Radius = np.inf
-        else:
-            this_surf.Radius = PatentData['SURF']['r'][s]
-        
-        # apply thickness
-        if isinstance(PatentData['SURF']['d'][s], str):
-            # allow string (i.e. "INF") for thickness
-            this_surf.Thickness = np.inf
-        else:
-            this_surf.Thickness = PatentData['SURF']['d'][s]
-        
-        # apply material (if necessary)
-        if type(PatentData['SURF']['nd'][s]) == str:
-            # set material name (we already added the glass catalogs to System Explorer)
-            this_surf.Material = PatentData['SURF']['nd'][s]
-        else:
-            # it is a numeric value (either nd, or nan i.e. no value)
-            if not np.isnan(PatentData['SURF']['nd'][s]):
-                # set material solve by Nd/Vd
-                material_solve = this_surf.MaterialCell.CreateSolveType(ZOSAPI.Editors.SolveType.MaterialModel)._S_MaterialModel
-                material_solve.IndexNd = PatentData['SURF']['nd'][s]  
-                material_solve.AbbeVd = PatentData['SURF']['vd'][s]
-                this_surf.MaterialCell.SetSolveData(material_solve)
-            else:
-                # no material value; do nothing
-                pass
-        
-        # apply semi-diameter (if necessary)
-        if not np.isnan(PatentData['SURF']['cir'][s]):
-            this_surf.SemiDiameter = PatentData['SURF']['cir'][s]
-            this_surf.MechanicalSemiDiameter = PatentData['SURF']['cir'][s]
-
-        
-    if 'ASPH' not in PatentData.keys():
-        return
-    # set all aspheric data
-    asphere_data = PatentData['ASPH']
-    keys = asphere_data.keys()
-    coeff_indices = []
-    for k in range(2, len(keys)):
-        this_coeff_index = int(keys[k].split("_")[1]) # parse out coefficient index
-        coeff_indices.append(this_coeff_index)
-    for s in range(0, len(asphere_data['surf_num'])):
-        ThisSurf = TheSystem.LDE.GetSurfaceAt(asphere_data['surf_num'][s])
-        # set conic constant
-        ThisSurf.Conic = asphere_data['ka'][s]
-        # set asphere meta params
-        num_asphere_terms = len(asphere_data.columns)-2 # don't count name, and conic
-        ThisSurf.GetCellAt(24).IntegerValue = max(coeff_indices) # cell 24 is par(13), the max # of asphere terms
-        ThisSurf.GetCellAt(25).DoubleValue = 1.0 # cell 25 is par(14), the normalization radius
-        # set asphere coefficients
-        for i in range(0, len(coeff_indices)):
-            cell_index = 25 + coeff_indices[i]
-            asphere_value = asphere_data[keys[i+2]][s]
-            ThisSurf.GetCellAt(cell_index).DoubleValue = float(asphere_value)
-
-
-def set_wavelengths(TheSystem, PatentData):
+def set_wavelengths(TheSystem, Prescription):
+    wavelength_um = (0.001*Prescription.wavelength_nm).tolist()
+    weight = Prescription.wave_weight.tolist()
+
     # edit the pre-existing default
-    TheSystem.SystemData.Wavelengths.GetWavelength(1).Wavelength = 0.001*PatentData['WAVE']['wavelength_nm'][0]
-    TheSystem.SystemData.Wavelengths.GetWavelength(1).Weight = PatentData['WAVE']['weight'][0]
+    TheSystem.SystemData.Wavelengths.GetWavelength(1).Wavelength = wavelength_um[0]
+    TheSystem.SystemData.Wavelengths.GetWavelength(1).Weight = weight[0]
 
     # add the other wavelengths and weights
-    for w in range(1, len(PatentData['WAVE']['wave_num'])):
-        this_wavelength = 0.001*PatentData['WAVE']['wavelength_nm'][w]
-        this_weight = PatentData['WAVE']['weight'][w]
-        TheSystem.SystemData.Wavelengths.AddWavelength(this_wavelength, this_weight)
-    
+    for w in range(1, len(wavelength_um)):
+        TheSystem.SystemData.Wavelengths.AddWavelength(wavelength_um[w], weight[w])
+
     # set the primary wavelength
-    wave_data = PatentData['WAVE']
-    pwave = wave_data[wave_data['wave_num'].str.lower().str.contains('_c')].index[0].item()
-    if not pwave:
+    pwave = Prescription.primary_wave
+    if pwave < 0:
         print("\nERROR: no primary wavelength found")
         print("ensure there is a '_c' substring in the wave_num data\n\n")
+        return
     # the indexing if off by 1
     TheSystem.SystemData.Wavelengths.GetWavelength(pwave+1).MakePrimary()
 
 
-def set_system_data(TheSystem, PatentData, ZOSAPI):
+def set_system_data(TheSystem, Prescription, ZOSAPI):
     # set all the system data, based on the first column of the CONF group
     # interpretation of CONF data:
     # d_n : (ignored in this function; see "set_mce()")
     # fno : system f/#
     # y_n : field height, for field number n
-    
+
     # turn on ray aiming
     TheSystem.SystemData.RayAiming.RayAiming = ZOSAPI.SystemData.RayAimingMethod.Real
 
     # break out each relevant data type
-    conf_data = PatentData['CONF']
-    fno_data = conf_data[conf_data['name'].str.lower().str.contains('fno')].reset_index(drop=True)
-    field_data = conf_data[conf_data['name'].str.lower().str.contains('y_')].reset_index(drop=True)
+    fno_rows = mce_engine.conf_rows(Prescription, 'fno')
+    field_rows = mce_engine.conf_rows(Prescription, 'y')
 
     # set system aperture
     # assume image space f/# (could read aperture type from excel...)
     TheSystem.SystemData.Aperture.ApertureType = ZOSAPI.SystemData.ZemaxApertureType.ImageSpaceFNum
-    TheSystem.SystemData.Aperture.ApertureValue = fno_data['config_1'].item()
+    TheSystem.SystemData.Aperture.ApertureValue = float(Prescription.conf_values[fno_rows[0], 0])
 
     # set the fields
     # assume real image height (could read field type from excel...)
+    field_y = Prescription.conf_values[field_rows, 0].tolist()
     TheSystem.SystemData.Fields.SetFieldType(ZOSAPI.SystemData.FieldType.RealImageHeight)
-    TheSystem.SystemData.Fields.GetField(1).Y = field_data['config_1'][0]
-    for f in range(1, len(field_data['name'])):
+    TheSystem.SystemData.Fields.GetField(1).Y = field_y[0]
+    for f in range(1, len(field_y)):
         this_x = 0
-        this_y = field_data['config_1'][f]
+        this_y = field_y[f]
         this_w = 1
         TheSystem.SystemData.Fields.AddField(this_x, this_y, this_w)
 
 
-def set_mce_data(TheSystem, PatentData, ZOSAPI):
-    # set all the multi-config data, based on the first column of the CONF group
-    # interpretation of CONF data:
-    # d_n : thickness value, of surface n
-    # fno : system f/#
-    # y_n : field height, for field number n
-    
-    # first, check if there are multi-configs to add
-    if len(PatentData['CONF'].columns) <= 2:
-        return
-    else:
-        # add the necessary extra configs (beyond 1)
-        for c in range(2, len(PatentData['CONF'].columns)):
-            TheSystem.MCE.AddConfiguration(False)
+def set_mce_data(TheSystem, Prescription, ZOSAPI):
+    # set all the multi-config data, based on the CONF group (see mce_engine for the
+    # CONF operand names: fno, y_N, d_N, r_N, glass_N, ...)
+    # every config and operand is created first, then the cells are filled in one pass
+    mce_engine.write_mce_table(TheSystem, mce_engine.compile_mce_table(Prescription), ZOSAPI)
 
-    # break out each relevant data type
-    conf_data = PatentData['CONF']
-    fno_data = conf_data[conf_data['name'].str.lower().str.contains('fno')].reset_index(drop=True)
-    field_data = conf_data[conf_data['name'].str.lower().str.contains('y_')].reset_index(drop=True)
-    thickness_data = conf_data[conf_data['name'].str.lower().str.contains('d_')].reset_index(drop=True)
-    keys = conf_data.keys()
-
-    # fno operand (assume only 1...)
-    op_fno = TheSystem.MCE.AddOperand()
-    op_fno.ChangeType(ZOSAPI.Editors.MCE.MultiConfigOperandType.APER)
-    # set aperture value for each config 
-    for c in range(1, len(PatentData['CONF'].columns)):
-        op_fno.GetOperandCell(c).DoubleValue = fno_data[keys[c]][0]
-
-    # field operands
-    for f in range(0, len(field_data)):
-        # add operand
-        op_field = TheSystem.MCE.AddOperand()
-        op_field.ChangeType(ZOSAPI.Editors.MCE.MultiConfigOperandType.YFIE)
-        # set the field number
-        field_num = int(field_data['name'].iloc[f].split("_")[1]) # parse the field number
-        op_field.Param1 = field_num-1 # Zemax is expecting the index of the field drop-down list (so field#1 is entered as '0', etc.)
-        # set field Y value for each config 
-        for c in range(1, len(PatentData['CONF'].columns)):
-            this_field = field_data[keys[c]][f]
-            op_field.GetOperandCell(c).DoubleValue = this_field
-
-    # thickness operands
-    for d in range(0, len(thickness_data)):
-        # add operand
-        op_thickness = TheSystem.MCE.AddOperand()
-        op_thickness.ChangeType(ZOSAPI.Editors.MCE.MultiConfigOperandType.THIC)
-        # set the surface number
-        surf_num = int(thickness_data['name'].iloc[d].split("_")[1]) # parse the surface number
-        op_thickness.Param1 = surf_num
-        # set surface thickness value for each config 
-        for c in range(1, len(PatentData['CONF'].columns)):
-            this_thickness = thickness_data[keys[c]][d]
-            if isinstance(this_thickness, str):
-                # allow string (i.e. "INF") for thickness
-                op_thickness.GetOperandCell(c).DoubleValue = 1e10
-            else:
-                op_thickness.GetOperandCell(c).DoubleValue = this_thickness
-
-
-def write_patent_data_to_zemax(PatentData, zos, out_fn):
+
+def _stage(call_counter, name):
+    # counts the ZOS-API calls of one stage (when counting), and profiles it (when profiling)
+    return import_profiler.get_profiler().stage(name, call_counter)
+
+
+def write_patent_data_to_zemax(PatentData, zos, out_fn, glass_index=None, call_counter=None, display=False, lde_export=None):
     # writes data into the lens data editor of a new optical system
+    # PatentData may be a LensPrescription, or the dict of block dataframes from read_excel_data
+    # glass_index (optional): glass_catalog_index.GlassCatalogIndex for glass validation
+    # call_counter (optional): zos_call_counter.CallCounter, counts the API calls of each stage
+    # display: print the LDE after the import
+    # lde_export (optional): 'csv' or 'parquet', save the LDE next to out_fn (see lde_export_path)
 
     # system/variable prep
-    import ZOSAPI
+    ZOSAPI = zos.ZOSAPI
     TheApplication = zos.TheApplication
     TheSystem = TheApplication.PrimarySystem
-    TheSystem.New(False)
+    if (call_counter is None) and import_profiler.get_profiler().enabled:
+        call_counter = zos_call_counter.CallCounter()
+    if call_counter is not None:
+        TheSystem = call_counter.wrap(TheSystem)
+    with _stage(call_counter, 'New'):
+        TheSystem.New(False)
+    Prescription = lens_prescription.as_prescription(PatentData)
 
     # META: set the system units
-    set_system_units(TheSystem, PatentData, ZOSAPI)
+    with _stage(call_counter, 'set_system_units'):
+        set_system_units(TheSystem, Prescription, ZOSAPI)
 
     # SURF: set the number of surfaces, and STOP
-    insert_surfaces(TheSystem, PatentData)
+    with _stage(call_counter, 'insert_surfaces'):
+        insert_surfaces(TheSystem, Prescription)
 
-    # SURF: set the surface types
-    set_surface_types(TheSystem, PatentData, ZOSAPI)
-    
     # SURF: add material catalogs to System Explorer
-    set_glass_catalogs(TheSystem, PatentData)
+    with _stage(call_counter, 'set_glass_catalogs'):
+        set_glass_catalogs(TheSystem, Prescription, glass_index)
 
-    # SURF: set each surface value in the LDE
-    set_surface_data(TheSystem, PatentData, ZOSAPI)
+    # SURF: set the surface types, and each surface value in the LDE
+    with _stage(call_counter, 'set_surface_data'):
+        set_surface_data(TheSystem, Prescription, ZOSAPI)
 
     # WAVE: set the system wavelengths
-    set_wavelengths(TheSystem, PatentData)
+    with _stage(call_counter, 'set_wavelengths'):
+        set_wavelengths(TheSystem, Prescription)
 
     # CONF: set the system data, using values from first column of CONF block
-    set_system_data(TheSystem, PatentData, ZOSAPI)
+    with _stage(call_counter, 'set_system_data'):
+        set_system_data(TheSystem, Prescription, ZOSAPI)
 
     # CONF: set multi-config data, if it is provided
-    set_mce_data(TheSystem, PatentData, ZOSAPI)
+    with _stage(call_counter, 'set_mce_data'):
+        set_mce_data(TheSystem, Prescription, ZOSAPI)
 
-    # display the LDE
-    display_lde(TheSystem)
+    # display and/or export the LDE (opt-in: it reads the whole LDE back)
+    if display or (lde_export is not None):
+        export_fn = lde_export_path(out_fn, lde_export) if lde_export is not None else None
+        with _stage(call_counter, 'display_lde'):
+            display_lde(TheSystem, export_fn, show=display)
 
     # save the system
-    TheSystem.SaveAs(out_fn)
\ No newline at end of file
+    with _stage(call_counter, 'SaveAs'):
+        save_system(TheSystem, out_fn)
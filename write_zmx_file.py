@@ -0,0 +1,272 @@
+# write patent data directly into a Zemax .zmx lens file (no OpticStudio needed)
+# produces the same lens as write_data_to_zemax.write_patent_data_to_zemax, but
+# emits the ZMX text format instead of driving the LDE/MCE through ZOS-API
+#
+# usage:
+#   lens = read_excel_data.read_excel_patent_data('lens.xlsx', as_prescription=True)
+#   write_zmx_file.write_patent_data_to_zmx(lens, 'lens_ZemaxImport.zmx')
+
+import os
+
+import numpy as np
+
+import import_profiler
+import lens_prescription
+import mce_engine
+from lens_prescription import MATERIAL_MODEL, MATERIAL_CATALOG
+from mce_engine import MCE_INFINITY
+
+# version of the .zmx text output; bump it whenever the written file changes, so corpus
+# manifests (import_manifest) re-import workbooks written by an older version
+WRITER_VERSION = 2
+
+# OpticStudio writes .zmx files as UTF-16 (little endian, with BOM) and CRLF line ends
+ZMX_ENCODING = 'utf-16-le'
+ZMX_BOM = '\ufeff'
+ZMX_NEWLINE = '\r\n'
+
+# OpticStudio always lists this many wavelength slots
+ZMX_MAX_WAVELENGTHS = 24
+
+ZMX_UNITS = {
+    'meters': 'METER', 'meter': 'METER', 'm': 'METER',
+    'inches': 'IN', 'inch': 'IN', 'in': 'IN',
+    'centimeters': 'CM', 'centimeter': 'CM', 'cm': 'CM',
+    }
+
+
+def _fmt(value):
+    # shortest repr that round-trips the float
+    return repr(float(value))
+
+
+def _fmt_e(value):
+    # fixed-width exponent format used for XDAT/MCE values
+    return f"{float(value):.12E}"
+
+
+def zmx_units(Prescription):
+    unit = Prescription.meta.lens_unit.lower()
+    return ZMX_UNITS.get(unit, 'MM')
+
+
+def find_stop_surface(Prescription):
+    # the stop, based on '_STO' substring
+    if Prescription.stop_surface < 0:
+        print("\nERROR: no stop surface found")
+        print("ensure there is a '_STO' substring in the surface number data\n\n")
+        return 1
+    return Prescription.stop_surface
+
+
+def find_primary_wavelength(Prescription):
+    if Prescription.primary_wave < 0:
+        print("\nERROR: no primary wavelength found")
+        print("ensure there is a '_c' substring in the wave_num data\n\n")
+        return 1
+    # zemax wavelength numbers start at 1
+    return Prescription.primary_wave + 1
+
+
+def glass_catalogs(Prescription):
+    # catalogs used by named glasses, in order of first use
+    catalogs_to_use = []
+    for s in np.flatnonzero(Prescription.material_kind == MATERIAL_CATALOG).tolist():
+        catalog_name = str(Prescription.catalog[s])
+        if len(catalog_name) < 1:
+            print("error: each SURF 'nd' value must have corresponding 'vd' value")
+            continue
+        if catalog_name not in catalogs_to_use:
+            catalogs_to_use.append(catalog_name)
+    return catalogs_to_use
+
+
+def system_lines(Prescription):
+    # CONF: system data, using values from first column of CONF block
+    fno_rows = mce_engine.conf_rows(Prescription, 'fno')
+    field_y = Prescription.conf_values[mce_engine.conf_rows(Prescription, 'y'), 0].tolist()
+    if len(field_y) < 1:
+        field_y = [0.0]
+    n_fields = len(field_y)
+    n_waves = len(Prescription.wave_names)
+    zeros = ' '.join(['0']*n_fields)
+
+    lines = [
+        'VERS 250819 0 0 00000000',
+        'MODE SEQ',
+        'NAME ',
+        'AUTH ',
+        'IWDP 0',
+        'PFIL 0 0 0',
+        'LANG 0',
+        f"UNIT {zmx_units(Prescription)} X W X CM MR CPMM LU ",
+        # assume image space f/# (same as set_system_data)
+        f"FNUM {_fmt(Prescription.conf_values[fno_rows[0], 0])} 0",
+        'ENVD 20 1 0',
+        'GFAC 0 0',
+        'GCAT ' + ''.join(c + ' ' for c in glass_catalogs(Prescription)),
+        # real ray aiming
+        'RAIM 0 2 1 1 0 0 0 0 0 1',
+        'PUSH 0 0 0 0 0 0',
+        'SDMA 0 1 0',
+        'OMMA 1 1',
+        # real image height fields
+        f"FTYP 3 0 {n_fields} {n_waves} 0 0 0 {n_fields}",
+        'ROPD 2',
+        'HYPR 0',
+        'PICB 1',
+        'XFLN ' + zeros,
+        'YFLN ' + ' '.join(_fmt(y) for y in field_y),
+        'FWGN ' + ' '.join(['1']*n_fields),
+        'VDXN ' + zeros,
+        'VDYN ' + zeros,
+        'VCXN ' + zeros,
+        'VCYN ' + zeros,
+        'VANN ' + zeros,
+        ]
+
+    # WAVE: wavelengths in microns; unused slots keep the OpticStudio default
+    wavelength_um = (0.001*Prescription.wavelength_nm).tolist()
+    weight = Prescription.wave_weight.tolist()
+    for w in range(0, ZMX_MAX_WAVELENGTHS):
+        if w < n_waves:
+            lines.append(f"WAVM {w+1} {_fmt(wavelength_um[w])} {_fmt(weight[w])}")
+        else:
+            lines.append(f"WAVM {w+1} 0.55000000000000004 1")
+    lines += [
+        f"PWAV {find_primary_wavelength(Prescription)}",
+        'POLS 1 0 1 0 0 1 0',
+        'GLRS 1 0',
+        'GSTD 0 100.000 100.000 100.000 100.000 100.000 100.000 0 1 1 0 0 1 1 1 1 1 1',
+        'NSCD 100 500 0 0.001 10 9.9999999999999995e-07 0 0 0 0 0 0 1000000 0 2',
+        'COFN QF "COATING.DAT" "SCATTER_PROFILE.DAT" "ABG_DATA.DAT" "PROFILE.GRD"',
+        'COFN COATING.DAT SCATTER_PROFILE.DAT ABG_DATA.DAT PROFILE.GRD',
+        ]
+    return lines
+
+
+def surface_lines(Prescription):
+    # SURF: one block per surface row, plus the image surface
+    n_surf = Prescription.n_surfaces
+    stop_surf = find_stop_surface(Prescription)
+    surf_names = Prescription.surf_names.tolist()
+    radius = Prescription.radius.tolist()
+    thickness = Prescription.thickness.tolist()
+    material_kind = Prescription.material_kind.tolist()
+    semi_diameter = Prescription.semi_diameter.tolist()
+
+    # asphere rows by surface number; XDAT N+2 holds the coefficient on r^N
+    asph_row = {surf_num: a for a, surf_num in enumerate(Prescription.asph_surf.tolist())}
+    coeff_indices = Prescription.coeff_index.tolist()
+    max_term = max(coeff_indices) if len(coeff_indices) > 0 else 0
+
+    lines = []
+    for s in range(0, n_surf):
+        curvature = 0.0 if np.isinf(radius[s]) or radius[s] == 0 else 1.0/radius[s]
+
+        lines.append(f"SURF {s}")
+        lines.append(f"  COMM {surf_names[s]}")
+        if s == stop_surf:
+            lines.append('  STOP')
+        if s in asph_row:
+            # note: we only allow extended odd asphere for now
+            lines.append('  TYPE XOSPHERE')
+        else:
+            lines.append('  TYPE STANDARD')
+        lines.append(f"  CURV {_fmt(curvature)} 0 0 0 0 \"\"")
+        if s in asph_row:
+            a = asph_row[s]
+            xdat = [0.0]*(max_term + 1)
+            for i in range(0, len(coeff_indices)):
+                # blank ASPH cells (nan) are 0, as in lde_write_plan
+                xdat[coeff_indices[i]] = float(np.nan_to_num(Prescription.asph_coeffs[a, i], nan=0.0))
+            # XDAT 1 is the max # of asphere terms, XDAT 2 the normalization radius
+            lines.append(f"  XDAT 1 {_fmt_e(max_term)} 0 0 1.000000000000E+00 0.000000000000E+00 0 \"\"")
+            lines.append(f"  XDAT 2 {_fmt_e(1.0)} 0 0 1.000000000000E+00 0.000000000000E+00 0 \"\"")
+            for n in range(1, max_term + 1):
+                lines.append(f"  XDAT {n+2} {_fmt_e(xdat[n])} 0 0 1.000000000000E+00 0.000000000000E+00 0 \"\"")
+        lines.append('  DISZ INFINITY' if np.isinf(thickness[s]) else f"  DISZ {_fmt(thickness[s])}")
+        if s in asph_row:
+            lines.append(f"  CONI {_fmt(np.nan_to_num(Prescription.conic[asph_row[s]], nan=0.0))}")
+
+        # apply material (if necessary)
+        if material_kind[s] == MATERIAL_CATALOG:
+            lines.append(f"  GLAS {Prescription.glass[s]} 0 0 1.5 40 0 0 0 0 0 0 ")
+        elif material_kind[s] == MATERIAL_MODEL:
+            # material solve by Nd/Vd
+            lines.append(f"  GLAS ___BLANK 1 0 {_fmt(Prescription.nd[s])} {_fmt(Prescription.vd[s])} 0 0 0 0 0 0 ")
+
+        # apply semi-diameter (if necessary)
+        if np.isnan(semi_diameter[s]):
+            lines.append('  DIAM 0 0 0 0 1 ""')
+            lines.append('  MEMA 0 0 0 0 1 ""')
+        else:
+            lines.append(f"  DIAM {_fmt(semi_diameter[s])} 1 0 0 1 \"\"")
+            lines.append(f"  MEMA {_fmt(semi_diameter[s])} 1 0 0 1 \"\"")
+            lines.append(f"  FLAP 0 {_fmt(semi_diameter[s])} 0")
+
+    # image surface
+    lines += [
+        f"SURF {n_surf}",
+        '  TYPE STANDARD',
+        '  CURV 0.0 0 0 0 0 ""',
+        '  DISZ 0',
+        '  DIAM 0 0 0 0 1 ""',
+        '  MEMA 0 0 0 0 1 ""',
+        ]
+    return lines
+
+
+def _mce_line(operand, param, config, value, param2=0):
+    # value: a number, or the text of a string operand (GLSS); param2 follows the value
+    value = _fmt_e(value) if not isinstance(value, str) else (value or '""')
+    return f"{operand} {param:3d} {config:3d} {value} {param2} 0 0 1 1 1.000000000000E+00 0.000000000000E+00 0 \"\" 0"
+
+
+def mce_lines(Prescription):
+    # CONF: multi-config data, if it is provided (same operands as set_mce_data)
+    # operand numbers are as in the CONF names (field numbers start at 1 in the file)
+    table = mce_engine.compile_mce_table(Prescription)
+    n_configs = table.n_configs
+    if (n_configs <= 1) or (table.n_operands < 1):
+        return []
+    values = table.values.tolist()
+    param1 = table.param1.tolist()
+    param2 = table.param2.tolist()
+
+    lines = [f"MNUM {n_configs} 1"]
+    for i, spec in enumerate(table.specs):
+        row = table.text[i].tolist() if spec.is_string else values[i]
+        for c in range(0, n_configs):
+            if (not spec.is_string) and np.isnan(row[c]):
+                continue
+            lines.append(_mce_line(spec.op_type, param1[i], c + 1, row[c], param2[i]))
+    return lines
+
+
+def patent_data_to_zmx(PatentData, glass_index=None):
+    # build the full .zmx file text
+    # PatentData may be a LensPrescription, or the dict of block dataframes from read_excel_data
+    # glass_index (optional): glass_catalog_index.GlassCatalogIndex, to fill in blank glass catalogs
+    Prescription = lens_prescription.as_prescription(PatentData)
+    if glass_index is not None:
+        for s in glass_index.resolve_catalogs(Prescription):
+            print(f"error: material {Prescription.glass[s]} not found in any glass catalog\n")
+    lines = system_lines(Prescription)
+    lines += surface_lines(Prescription)
+    lines += ['BLNK ', 'TOL TOFF   0   0 0.0000000000000000E+00 0.0000000000000000E+00   0 0 0 0 0']
+    lines += mce_lines(Prescription)
+    return ZMX_NEWLINE.join(lines) + ZMX_NEWLINE
+
+
+def write_patent_data_to_zmx(PatentData, out_fn, glass_index=None):
+    # writes data into a new .zmx file
+    profiler = import_profiler.get_profiler()
+    with profiler.stage('patent_data_to_zmx'):
+        text = patent_data_to_zmx(PatentData, glass_index)
+    with profiler.stage('write_zmx'):
+        # through a temp file and a rename, so a crash never leaves a partial .zmx
+        tmp_fn = f"{out_fn}.{os.getpid()}.tmp"
+        with open(tmp_fn, 'w', encoding=ZMX_ENCODING, newline='') as f:
+            f.write(ZMX_BOM + text)
+        os.replace(tmp_fn, out_fn)
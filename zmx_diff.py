@@ -0,0 +1,393 @@
+# numeric diff of two .zmx lens files, for regression checks of the importer
+# both files are read with zmx_reader, and every configuration is compared as the lens
+# it describes: the MCE operands are applied to the surface, field, wavelength and
+# aperture values first, so a field set by a YFIE operand in one file and by YFLN in the
+# other compares equal. each quantity is compared as a whole array (np.isclose, with
+# its own tolerance in TOLERANCES), and only the cells that differ become Mismatch
+# records (once, when a cell differs the same way in every configuration). surface
+# types are compared by their sag polynomial (an Even Asphere equals
+# the Extended Odd Asphere with the same coefficients), catalog glasses by name, and
+# model glasses by nd/vd. what OpticStudio computes on load (semi-diameters) gets a
+# looser tolerance, and only where both files have it; what it only caches (catalog
+# glass indices, ray aiming) is ignored.
+#
+# in a directory, each <name>_ZemaxImport.zmx (batch_import.default_out_file) is paired
+# with its REFERENCE_<name>.zmx, or with the only REFERENCE_*.zmx next to it; directories
+# are searched recursively and the pairs are compared in parallel.
+#
+# usage:
+#   diff = zmx_diff.diff_files('lens_ZemaxImport.zmx', 'REFERENCE_lens.zmx')
+#   diff.same, diff.mismatches                     # [Mismatch, ...]
+#   diffs = zmx_diff.diff_pairs(zmx_diff.find_pairs(['corpus/'])[0], workers=8)
+#
+#   python zmx_diff.py <dir> [...] [--workers N] [--jsonl diffs.jsonl] [--quiet]
+#   python zmx_diff.py a.zmx b.zmx
+# exits with status 1 when any pair differs
+
+import argparse
+import json
+import os
+import sys
+
+import numpy as np
+
+import zmx_reader
+
+IMPORT_SUFFIX = '_ZemaxImport.zmx'
+REFERENCE_PREFIX = 'REFERENCE_'
+
+# (rtol, atol) per quantity, for np.isclose
+DEFAULT_TOLERANCE = (1e-6, 1e-9)
+TOLERANCES = {
+    # OpticStudio writes a flat surface as 0 or 1e-10
+    'curvature': (1e-6, 1e-9),
+    # computed by OpticStudio from the rays (and the ray aiming) on load
+    'semi_diameter': (1e-4, 1e-6),
+    # asphere coefficients (a_N, on r^N) are tiny: relative only
+    'asphere': (1e-6, 0.0),
+    }
+
+# MCE operand -> (effective quantity, offset from the operand number to the array index)
+# (fields and wavelengths are numbered from 1, surfaces from 0)
+OPERAND_TARGETS = {
+    'APER': ('aperture', None),
+    'XFIE': ('field_x', -1),
+    'YFIE': ('field_y', -1),
+    'THIC': ('thickness', 0),
+    'CRVT': ('curvature', 0),
+    'CONI': ('conic', 0),
+    'SDIA': ('semi_diameter', 0),
+    'GLSS': ('glass', 0),
+    'WAVE': ('wavelength_um', -1),
+    'WLWT': ('wave_weight', -1),
+    }
+
+# computed by OpticStudio: compared only where both files have a value (not nan)
+COMPUTED_QUANTITIES = ('semi_diameter',)
+
+# per-config quantities, in report order; the last axis is 1-based for fields and wavelengths
+CONFIG_QUANTITIES = ['aperture', 'field_x', 'field_y', 'wavelength_um', 'wave_weight',
+                     'curvature', 'thickness', 'conic', 'glass', 'nd', 'vd', 'semi_diameter']
+ONE_BASED = ('field_x', 'field_y', 'wavelength_um', 'wave_weight')
+
+# pairs compared per process, at least (see diff_pairs)
+MIN_PAIRS_PER_WORKER = 50
+
+
+class Mismatch(object):
+    # one differing value: config is 1-based (0 for a quantity of the whole system), index
+    # the surface (from 0), field or wavelength (from 1) number, or -1
+    __slots__ = ('quantity', 'config', 'index', 'a', 'b')
+
+    def __init__(self, quantity, config, index, a, b):
+        self.quantity = quantity
+        self.config = config
+        self.index = index
+        self.a = a
+        self.b = b
+
+    def __str__(self):
+        where = f"[{self.index}]" if self.index >= 0 else ''
+        config = f" (config {self.config})" if self.config > 0 else ''
+        return f"{self.quantity}{where}{config}: {self.a!r} != {self.b!r}"
+
+    def __repr__(self):
+        return f"Mismatch({self.quantity!r}, {self.config}, {self.index}, {self.a!r}, {self.b!r})"
+
+    def to_dict(self):
+        def plain(v):
+            return None if (isinstance(v, float) and np.isnan(v)) else v
+        return {'quantity': self.quantity, 'config': self.config, 'index': self.index, 'a': plain(self.a), 'b': plain(self.b)}
+
+
+class ZmxDiff(object):
+    __slots__ = ('file_a', 'file_b', 'mismatches', 'error')
+
+    def __init__(self, file_a, file_b):
+        self.file_a = file_a
+        self.file_b = file_b
+        self.mismatches = []
+        self.error = ''
+
+    @property
+    def same(self):
+        return (len(self.error) < 1) and (len(self.mismatches) < 1)
+
+    def __repr__(self):
+        state = 'error' if self.error else ('same' if self.same else f"{len(self.mismatches)} mismatches")
+        return f"ZmxDiff({self.file_a!r}, {self.file_b!r}, {state})"
+
+    def to_dict(self):
+        return {'file_a': self.file_a, 'file_b': self.file_b, 'same': self.same, 'error': self.error,
+                'mismatches': [m.to_dict() for m in self.mismatches]}
+
+
+def effective_values(system):
+    # ({quantity: (configs x n) array}, {(op, param1, param2): (configs) values}) of a
+    # ZmxSystem: each configuration's lens, with the MCE operands applied; the operands
+    # without a target in OPERAND_TARGETS are returned as they are
+    n_configs = system.n_configs
+
+    def per_config(values):
+        return np.tile(values, (n_configs, 1))
+
+    values = {
+        'aperture': np.full((n_configs, 1), system.aperture),
+        'field_x': per_config(system.field_x),
+        'field_y': per_config(system.field_y),
+        'wavelength_um': per_config(system.wavelength_um),
+        'wave_weight': per_config(system.wave_weight),
+        'curvature': per_config(system.curvature),
+        'thickness': per_config(system.thickness),
+        'conic': per_config(system.conic),
+        'glass': per_config(system.glass).astype(object),   # GLSS names may be longer
+        'nd': per_config(system.nd),
+        'vd': per_config(system.vd),
+        'semi_diameter': per_config(system.semi_diameter),
+        }
+    other = {}
+    for i, op in enumerate(system.mce_ops):
+        target = OPERAND_TARGETS.get(op[0])
+        cells = system.mce_text[i] if op[0] == 'GLSS' else system.mce_values[i]
+        is_set = (cells != '') if op[0] == 'GLSS' else ~np.isnan(cells)
+        if target is None:
+            other[op] = cells
+            continue
+        name, offset = target
+        index = 0 if offset is None else op[1] + offset
+        if not (0 <= index < values[name].shape[1]):
+            other[op] = cells
+            continue
+        if name == 'thickness':
+            cells = np.where(cells >= zmx_reader.ZMX_INFINITY, np.inf, cells)
+        values[name][is_set, index] = cells[is_set]
+    # the index of a catalog glass is what OpticStudio cached, not part of the lens
+    model = values['glass'] == zmx_reader.MODEL_GLASS
+    values['nd'] = np.where(model, values['nd'], np.nan)
+    values['vd'] = np.where(model, values['vd'], np.nan)
+    return values, other
+
+
+def _common(a, b):
+    # the common (configs x n) part of two arrays
+    n_rows = min(a.shape[0], b.shape[0])
+    n_cols = min(a.shape[1], b.shape[1])
+    return a[:n_rows, :n_cols], b[:n_rows, :n_cols]
+
+
+def _add_mismatches(diff, quantity, differ, a, b, config_axis=True, one_based=False):
+    # Mismatch records of the differing cells of two (configs x n) arrays; a cell that
+    # differs the same way in every configuration is one system-wide mismatch
+    n_rows = differ.shape[0]
+    everywhere = (differ.sum(axis=0) == n_rows) & (a == a[:1]).all(axis=0) & (b == b[:1]).all(axis=0)
+    a = a.tolist()
+    b = b.tolist()
+    for row, col in np.argwhere(differ).tolist():
+        if everywhere[col] and (row > 0):
+            continue
+        index = -1 if quantity == 'aperture' else col + (1 if one_based else 0)
+        config = 0 if (everywhere[col] or not config_axis) else row + 1
+        diff.mismatches.append(Mismatch(quantity, config, index, a[row][col], b[row][col]))
+
+
+def _compare(diff, quantity, a, b, tolerance=DEFAULT_TOLERANCE):
+    # one quantity on its own (text, or an MCE operand compared as it is)
+    a, b = _common(a, b)
+    if a.dtype.kind in 'USO':
+        differ = a != b
+    else:
+        differ = ~np.isclose(a, b, rtol=tolerance[0], atol=tolerance[1], equal_nan=True)
+    _add_mismatches(diff, quantity, differ, a, b)
+
+
+def _compare_quantities(diff, values_a, values_b, tolerances):
+    # every numeric per-config quantity side by side in one (configs x columns) matrix,
+    # with per-column tolerances: one np.isclose for the whole lens
+    names = []
+    blocks_a = []
+    blocks_b = []
+    rtol = []
+    atol = []
+    for name in CONFIG_QUANTITIES:
+        a, b = _common(values_a[name], values_b[name])
+        if a.dtype.kind in 'USO':
+            _compare(diff, name, a, b)
+            continue
+        tolerance = tolerances.get(name, DEFAULT_TOLERANCE)
+        names.append((name, a.shape[1]))
+        blocks_a.append(a)
+        blocks_b.append(b)
+        rtol.append(np.full(a.shape[1], tolerance[0]))
+        atol.append(np.full(a.shape[1], tolerance[1]))
+    a = np.hstack(blocks_a)
+    b = np.hstack(blocks_b)
+    differ = ~np.isclose(a, b, rtol=np.concatenate(rtol), atol=np.concatenate(atol), equal_nan=True)
+    if not differ.any():
+        return
+    start = 0
+    for name, n_cols in names:
+        cols = slice(start, start + n_cols)
+        start += n_cols
+        block = differ[:, cols]
+        if name in COMPUTED_QUANTITIES:
+            block = block & ~(np.isnan(a[:, cols]) | np.isnan(b[:, cols]))
+        if block.any():
+            _add_mismatches(diff, name, block, a[:, cols], b[:, cols], one_based=name in ONE_BASED)
+
+
+def _compare_count(diff, quantity, n_a, n_b):
+    if n_a != n_b:
+        diff.mismatches.append(Mismatch(quantity, 0, -1, n_a, n_b))
+
+
+def diff_systems(a, b, tolerances=None):
+    # ZmxDiff of two ZmxSystems; tolerances: {quantity: (rtol, atol)} over TOLERANCES
+    tolerances = dict(TOLERANCES, **(tolerances or {}))
+    diff = ZmxDiff(a.file, b.file)
+    for name in ('units', 'aperture_type', 'field_type', 'stop_surface', 'primary_wave'):
+        if getattr(a, name) != getattr(b, name):
+            diff.mismatches.append(Mismatch(name, 0, -1, getattr(a, name), getattr(b, name)))
+    _compare_count(diff, 'n_configs', a.n_configs, b.n_configs)
+    _compare_count(diff, 'n_surfaces', a.n_surfaces, b.n_surfaces)
+    _compare_count(diff, 'n_fields', len(a.field_y), len(b.field_y))
+    _compare_count(diff, 'n_wavelengths', len(a.wavelength_um), len(b.wavelength_um))
+
+    # surface types: any two polynomial types are compared by their coefficients below
+    n_surf = min(a.n_surfaces, b.n_surfaces)
+    polynomial = (np.isin(a.surf_type[:n_surf], list(zmx_reader.POLYNOMIAL_TYPES))
+                  & np.isin(b.surf_type[:n_surf], list(zmx_reader.POLYNOMIAL_TYPES)))
+    for s in np.flatnonzero((a.surf_type[:n_surf] != b.surf_type[:n_surf]) & ~polynomial).tolist():
+        diff.mismatches.append(Mismatch('surf_type', 0, s, str(a.surf_type[s]), str(b.surf_type[s])))
+
+    values_a, other_a = effective_values(a)
+    values_b, other_b = effective_values(b)
+    _compare_quantities(diff, values_a, values_b, tolerances)
+
+    # asphere coefficients, as a_N (on r^N) per surface
+    poly_a = a.asphere_polynomial()[:n_surf]
+    poly_b = b.asphere_polynomial()[:n_surf]
+    n_powers = max(poly_a.shape[1], poly_b.shape[1])
+    poly_a = np.pad(poly_a, ((0, 0), (0, n_powers - poly_a.shape[1])))
+    poly_b = np.pad(poly_b, ((0, 0), (0, n_powers - poly_b.shape[1])))
+    rtol, atol = tolerances['asphere']
+    for s, n in np.argwhere(~np.isclose(poly_a, poly_b, rtol=rtol, atol=atol)).tolist():
+        diff.mismatches.append(Mismatch(f"a_{n}", 0, s, poly_a[s, n].item(), poly_b[s, n].item()))
+
+    # MCE operands without an effective quantity: compared as they are
+    for op in sorted(set(other_a) | set(other_b)):
+        name = f"{op[0]} {op[1]} {op[2]}"
+        if (op not in other_a) or (op not in other_b):
+            diff.mismatches.append(Mismatch(name, 0, -1, 'present' if op in other_a else 'missing',
+                                            'present' if op in other_b else 'missing'))
+            continue
+        _compare(diff, name, other_a[op][:, None], other_b[op][:, None])
+    return diff
+
+
+def diff_files(file_a, file_b, tolerances=None):
+    # ZmxDiff of two .zmx files (a file that cannot be read is the diff's error)
+    try:
+        a = zmx_reader.read_zmx(file_a)
+        b = zmx_reader.read_zmx(file_b)
+    except Exception as e:
+        diff = ZmxDiff(file_a, file_b)
+        diff.error = f"{type(e).__name__}: {e}"
+        return diff
+    return diff_systems(a, b, tolerances)
+
+
+def _diff_pair(pair, tolerances=None):
+    return diff_files(pair[0], pair[1], tolerances)
+
+
+def find_pairs(inputs):
+    # ([(import file, reference file)], [unpaired files]) in the directories (searched
+    # recursively); an explicit pair of .zmx files is taken as it is
+    if (len(inputs) == 2) and all(os.path.isfile(fn) and fn.lower().endswith('.zmx') for fn in inputs):
+        return [(inputs[0], inputs[1])], []
+    pairs = []
+    unpaired = []
+    for item in inputs:
+        if not os.path.isdir(item):
+            print(f"warning: '{item}' is not a directory")
+            continue
+        for root, dirs, files in os.walk(item):
+            dirs.sort()
+            imports = sorted(fn for fn in files if fn.endswith(IMPORT_SUFFIX))
+            references = sorted(fn for fn in files if fn.startswith(REFERENCE_PREFIX) and fn.lower().endswith('.zmx'))
+            left = []
+            for fn in imports:
+                reference = REFERENCE_PREFIX + fn[:-len(IMPORT_SUFFIX)] + '.zmx'
+                if reference in references:
+                    pairs.append((os.path.join(root, fn), os.path.join(root, reference)))
+                    references.remove(reference)
+                else:
+                    left.append(fn)
+            if (len(left) == 1) and (len(references) == 1):
+                # one lens per directory, e.g. Sample_1_ZemaxImport.zmx and REFERENCE_<design>.zmx
+                pairs.append((os.path.join(root, left[0]), os.path.join(root, references[0])))
+            else:
+                unpaired += [os.path.join(root, fn) for fn in left + references]
+    return pairs, unpaired
+
+
+def diff_pairs(pairs, workers=None, tolerances=None):
+    # [ZmxDiff] of every (a, b) pair, in order; workers > 1 spreads the pairs over a
+    # process pool (only for batches big enough to pay for the start-up)
+    import functools
+    if workers is None:
+        workers = os.cpu_count() or 1
+    workers = max(1, min(workers, len(pairs) // MIN_PAIRS_PER_WORKER))
+    if workers == 1:
+        return [_diff_pair(pair, tolerances) for pair in pairs]
+    import concurrent.futures
+    import multiprocessing as mp
+    chunksize = max(1, len(pairs) // (4*workers))
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers, mp_context=mp.get_context('spawn')) as pool:
+        return list(pool.map(functools.partial(_diff_pair, tolerances=tolerances), pairs, chunksize=chunksize))
+
+
+def print_diff(diff, quiet=False):
+    if diff.error:
+        print(f"ERROR: {diff.file_a} vs {diff.file_b}: {diff.error}")
+    elif not diff.same:
+        print(f"{diff.file_a}\n  vs {diff.file_b}: {len(diff.mismatches)} mismatches")
+        for mismatch in diff.mismatches:
+            print(f"    {mismatch}")
+    elif not quiet:
+        print(f"same: {diff.file_a}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Compare imported .zmx files with their references, value by value.')
+    parser.add_argument('inputs', nargs='+', help='directories (searched for *_ZemaxImport.zmx / REFERENCE_*.zmx pairs), or two .zmx files')
+    parser.add_argument('--workers', type=int, default=None, help='parallel processes (default: one per CPU)')
+    parser.add_argument('--rtol', type=float, default=None, help=f"relative tolerance of every quantity (default: {DEFAULT_TOLERANCE[0]}, see TOLERANCES)")
+    parser.add_argument('--jsonl', default=None, help='also write every diff to this JSON lines file')
+    parser.add_argument('--quiet', action='store_true', help='only print the pairs that differ')
+    args = parser.parse_args(argv)
+
+    pairs, unpaired = find_pairs(args.inputs)
+    for fn in unpaired:
+        print(f"warning: no pair for {fn}")
+    if len(pairs) < 1:
+        print("ERROR: no .zmx pairs found")
+        return 1
+    tolerances = None
+    if args.rtol is not None:
+        names = set(TOLERANCES) | set(CONFIG_QUANTITIES)
+        tolerances = {name: (args.rtol, TOLERANCES.get(name, DEFAULT_TOLERANCE)[1]) for name in names}
+    diffs = diff_pairs(pairs, args.workers, tolerances)
+    for diff in diffs:
+        print_diff(diff, args.quiet)
+    if args.jsonl is not None:
+        with open(args.jsonl, 'w') as f:
+            for diff in diffs:
+                f.write(json.dumps(diff.to_dict()) + '\n')
+    n_same = sum(diff.same for diff in diffs)
+    print(f"\nzmx diff: {n_same} of {len(diffs)} pairs the same ({len(diffs) - n_same} differ)")
+    return 0 if n_same == len(diffs) else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,307 @@
+# fast reader of Zemax .zmx lens files, into NumPy arrays (no OpticStudio needed)
+# one streaming pass over the lines (UTF-16 with BOM as OpticStudio saves them, or
+# UTF-8), keeping only what describes the lens: units, aperture, fields, wavelengths,
+# every surface (type, curvature, thickness, conic, glass, semi-diameter, PARM and
+# XDAT parameters) and the multi-configuration operands. everything else (ray aiming,
+# tolerances, NSC settings, ...) is skipped, so a file is read in well under a millisecond.
+#
+# asphere_polynomial() puts the polynomial asphere types on one footing (coefficient on
+# r^N in column N), so an Even Asphere reference compares with the Extended Odd Asphere
+# the importer writes.
+#
+# usage:
+#   system = zmx_reader.read_zmx('lens_ZemaxImport.zmx')
+#   system.curvature, system.thickness, system.glass         # one entry per surface
+#   system.mce_ops, system.mce_values                        # (op, param1, param2), (operands x configs)
+#   system.asphere_polynomial()                              # (surfaces x powers)
+
+import codecs
+
+import numpy as np
+
+# surface types with a sag polynomial: (parameters, first power, power step), see
+# asphere_polynomial. PARM n of an Even Asphere is on r^2n, of an Odd Asphere on r^n;
+# XDAT n+2 of an Extended Odd Asphere is on (r/R)^n, of an Extended Asphere on (r/R)^2n,
+# with XDAT 1 the number of terms and XDAT 2 the normalization radius R
+POLYNOMIAL_TYPES = {
+    'STANDARD': None,
+    'EVENASPH': ('parm', 2, 2),
+    'ODDASPH': ('parm', 1, 1),
+    'XOSPHERE': ('xdat', 1, 1),
+    'XASPHERE': ('xdat', 2, 2),
+    }
+
+# thickness OpticStudio writes for an infinite MCE thickness
+ZMX_INFINITY = 1e10
+
+# .zmx model glass name (the index and Abbe number follow it)
+MODEL_GLASS = '___BLANK'
+
+# the lines of a SURF block that are read (HIDE, MIRR, POPS, ... are skipped unsplit)
+SURFACE_KEYS = frozenset(['TYPE', 'COMM', 'CURV', 'DISZ', 'CONI', 'DIAM', 'STOP', 'GLAS', 'PARM', 'XDAT'])
+
+
+class ZmxSystem(object):
+    __slots__ = (
+        'file',
+        'units',           # UNIT lens unit, e.g. 'MM'
+        'aperture_type',   # 'FNUM', 'ENPD', 'OBNA' or 'FLOA'
+        'aperture',        # float64 aperture value
+        'field_type',      # int FTYP field type (3: real image height)
+        'field_x',         # float64 (fields)
+        'field_y',         # float64 (fields)
+        'field_weight',    # float64 (fields)
+        'wavelength_um',   # float64 (wavelengths in use)
+        'wave_weight',     # float64 (wavelengths in use)
+        'primary_wave',    # int index into the wave arrays, -1 when not given
+        # one entry per surface, object to image
+        'surf_type',       # str TYPE, e.g. 'STANDARD', 'XOSPHERE'
+        'comment',         # str
+        'curvature',       # float64
+        'thickness',       # float64, inf for INFINITY
+        'conic',           # float64
+        'glass',           # str, '' for air, MODEL_GLASS for a model glass
+        'nd',              # float64, nan unless a model glass
+        'vd',              # float64, nan unless a model glass
+        'semi_diameter',   # float64, nan for an automatic one not computed yet (DIAM 0 0, as
+                           # write_zmx_file leaves it for OpticStudio)
+        'stop_surface',    # int, -1 when there is no STOP
+        'parm',            # float64 (surfaces x PARM numbers), column n holds PARM n
+        'xdat',            # float64 (surfaces x XDAT numbers), column n holds XDAT n
+        # multi-configuration editor (n_configs is 1 without one)
+        'n_configs',
+        'mce_ops',         # [(operand type, param1, param2)], as in the file
+        'mce_values',      # float64 (operands x configs), nan for text and unset cells
+        'mce_text',        # str (operands x configs), the text cells (GLSS), '' elsewhere
+        )
+
+    @property
+    def n_surfaces(self):
+        return len(self.curvature)
+
+    def asphere_polynomial(self, n_powers=None):
+        # (surfaces x n_powers) coefficient on r^N in column N of every polynomial
+        # surface type; zero for the standard surface and for the other types
+        rows = []
+        for s, surf_type in enumerate(self.surf_type):
+            layout = POLYNOMIAL_TYPES.get(surf_type)
+            if layout is None:
+                continue
+            source, first, step = layout
+            if source == 'parm':
+                values = self.parm[s, 1:]
+                radius = 1.0
+            else:
+                n_terms = int(np.nan_to_num(self.xdat[s, 1])) if self.xdat.shape[1] > 1 else 0
+                values = self.xdat[s, 3:3 + n_terms]
+                radius = self.xdat[s, 2] if (self.xdat.shape[1] > 2) and (self.xdat[s, 2] > 0) else 1.0
+            powers = first + step*np.arange(len(values))
+            rows.append((s, powers, np.nan_to_num(values)/radius**powers))
+        max_power = max([int(powers[-1]) for s, powers, coeffs in rows if len(powers) > 0] + [0])
+        n_powers = max(n_powers or 0, max_power + 1)
+        polynomial = np.zeros((self.n_surfaces, n_powers))
+        for s, powers, coeffs in rows:
+            polynomial[s, powers] = coeffs
+        return polynomial
+
+    def __repr__(self):
+        return (f"ZmxSystem({self.n_surfaces} surfaces, {len(self.field_y)} fields, {len(self.wavelength_um)} wavelengths, "
+                f"{len(self.mce_ops)} MCE operands x {self.n_configs} configs)")
+
+
+def _float(token):
+    if token.upper().startswith('INF'):
+        return np.inf
+    try:
+        return float(token)
+    except ValueError:
+        return np.nan
+
+
+def _floats(tokens):
+    return [_float(t) for t in tokens]
+
+
+def _grow(rows, n):
+    # rows of a ragged list -> (len(rows) x n) float64, nan padded
+    array = np.full((len(rows), n), np.nan)
+    for i, row in enumerate(rows):
+        for k, v in row.items():
+            array[i, k] = v
+    return array
+
+
+class _Surface(object):
+    __slots__ = ('surf_type', 'comment', 'curvature', 'thickness', 'conic', 'glass', 'nd', 'vd', 'semi_diameter',
+                 'stop', 'parm', 'xdat')
+
+    def __init__(self):
+        self.surf_type = 'STANDARD'
+        self.comment = ''
+        self.curvature = 0.0
+        self.thickness = 0.0
+        self.conic = 0.0
+        self.glass = ''
+        self.nd = np.nan
+        self.vd = np.nan
+        self.semi_diameter = 0.0
+        self.stop = False
+        self.parm = {}
+        self.xdat = {}
+
+
+def _surface_line(surf, key, rest, tokens):
+    # one indented line of a SURF block
+    if key == 'TYPE':
+        surf.surf_type = tokens[1]
+    elif key == 'COMM':
+        surf.comment = rest
+    elif key == 'CURV':
+        surf.curvature = _float(tokens[1])
+    elif key == 'DISZ':
+        surf.thickness = _float(tokens[1])
+    elif key == 'CONI':
+        surf.conic = _float(tokens[1])
+    elif key == 'DIAM':
+        surf.semi_diameter = _float(tokens[1])
+        if (surf.semi_diameter == 0) and (len(tokens) > 2) and (tokens[2] == '0'):
+            surf.semi_diameter = np.nan
+    elif key == 'STOP':
+        surf.stop = True
+    elif key == 'GLAS':
+        surf.glass = tokens[1]
+        if (tokens[1] == MODEL_GLASS) and (len(tokens) > 5):
+            surf.nd = _float(tokens[4])
+            surf.vd = _float(tokens[5])
+    elif key == 'PARM':
+        surf.parm[int(tokens[1])] = _float(tokens[2])
+    elif key == 'XDAT':
+        surf.xdat[int(tokens[1])] = _float(tokens[2])
+
+
+def iter_lines(fn):
+    # the lines of a .zmx file, decoded by its BOM (UTF-16 LE/BE, UTF-8, or none: UTF-8)
+    with open(fn, 'rb') as f:
+        head = f.read(4)
+        if head.startswith((codecs.BOM_UTF16_LE, codecs.BOM_UTF16_BE)):
+            encoding = 'utf-16'
+        elif head.startswith(codecs.BOM_UTF8):
+            encoding = 'utf-8-sig'
+        else:
+            encoding = 'utf-8'
+    with open(fn, 'r', encoding=encoding, errors='replace', newline=None) as f:
+        for line in f:
+            yield line.rstrip('\r\n')
+
+
+def read_zmx(fn):
+    # ZmxSystem of a .zmx file
+    system = ZmxSystem()
+    system.file = fn
+    system.units = 'MM'
+    system.aperture_type = 'FNUM'
+    system.aperture = np.nan
+    system.field_type = 0
+    system.primary_wave = -1
+    n_fields = None
+    n_waves = None
+    field_x = []
+    field_y = []
+    field_weight = []
+    waves = {}    # slot -> (wavelength, weight)
+    surfaces = []
+    surf = None
+    n_configs = 1
+    in_mce = False   # the operand lines follow MNUM
+    mce = {}      # (op, param1, param2) -> {config: value or text}
+
+    for line in iter_lines(fn):
+        if len(line) < 4:
+            continue
+        if line[0] == ' ':
+            if surf is not None:
+                stripped = line.lstrip()
+                key = stripped[:4]
+                if key in SURFACE_KEYS:
+                    _surface_line(surf, key, stripped[5:], stripped.split())
+            continue
+        tokens = line.split()
+        key = tokens[0]
+        if key == 'SURF':
+            surf = _Surface()
+            surfaces.append(surf)
+            continue
+        surf = None
+        if key == 'UNIT':
+            system.units = tokens[1]
+        elif key in ('FNUM', 'ENPD', 'OBNA', 'FLOA'):
+            system.aperture_type = key
+            system.aperture = _float(tokens[1]) if len(tokens) > 1 else np.nan
+        elif key == 'FTYP':
+            system.field_type = int(tokens[1])
+            if len(tokens) > 4:
+                n_fields = int(tokens[3])
+                n_waves = int(tokens[4])
+        elif key == 'XFLN':
+            field_x = _floats(tokens[1:])
+        elif key == 'YFLN':
+            field_y = _floats(tokens[1:])
+        elif key == 'FWGN':
+            field_weight = _floats(tokens[1:])
+        elif key == 'WAVM':
+            waves[int(tokens[1])] = (_float(tokens[2]), _float(tokens[3]) if len(tokens) > 3 else 1.0)
+        elif key == 'PWAV':
+            system.primary_wave = int(tokens[1]) - 1
+        elif key == 'MNUM':
+            n_configs = int(tokens[1])
+            in_mce = True
+        elif in_mce and (len(tokens) > 4) and tokens[1].isdigit() and tokens[2].isdigit():
+            # MCE operand: TYPE param1 config value param2 ... (MOFF is an empty row)
+            if key == 'MOFF':
+                continue
+            op = (key, int(tokens[1]), int(tokens[4]) if tokens[4].lstrip('-').isdigit() else 0)
+            value = tokens[3]
+            mce.setdefault(op, {})[int(tokens[2])] = '' if value == '""' else value
+
+    # fields: FTYP gives the count; older files without it use the XFLN/YFLN lengths
+    if n_fields is None:
+        n_fields = max(len(field_x), len(field_y))
+    system.field_x = np.array((field_x + [0.0]*n_fields)[:n_fields], dtype=np.float64)
+    system.field_y = np.array((field_y + [0.0]*n_fields)[:n_fields], dtype=np.float64)
+    system.field_weight = np.array((field_weight + [1.0]*n_fields)[:n_fields], dtype=np.float64)
+    # wavelengths: the first n_waves slots (every slot when the count is not given)
+    slots = sorted(waves.keys())
+    if n_waves is not None:
+        slots = [w for w in slots if w <= n_waves]
+    system.wavelength_um = np.array([waves[w][0] for w in slots], dtype=np.float64)
+    system.wave_weight = np.array([waves[w][1] for w in slots], dtype=np.float64)
+
+    system.surf_type = np.array([s.surf_type for s in surfaces], dtype=str)
+    system.comment = np.array([s.comment for s in surfaces], dtype=str)
+    system.curvature = np.array([s.curvature for s in surfaces], dtype=np.float64)
+    system.thickness = np.array([s.thickness for s in surfaces], dtype=np.float64)
+    system.conic = np.array([s.conic for s in surfaces], dtype=np.float64)
+    system.glass = np.array([s.glass for s in surfaces], dtype=str)
+    system.nd = np.array([s.nd for s in surfaces], dtype=np.float64)
+    system.vd = np.array([s.vd for s in surfaces], dtype=np.float64)
+    system.semi_diameter = np.array([s.semi_diameter for s in surfaces], dtype=np.float64)
+    stops = [i for i, s in enumerate(surfaces) if s.stop]
+    system.stop_surface = stops[0] if len(stops) > 0 else -1
+    system.parm = _grow([s.parm for s in surfaces], 1 + max([max(s.parm) for s in surfaces if s.parm] + [0]))
+    system.xdat = _grow([s.xdat for s in surfaces], 1 + max([max(s.xdat) for s in surfaces if s.xdat] + [0]))
+
+    system.n_configs = n_configs
+    system.mce_ops = list(mce.keys())
+    system.mce_values = np.full((len(mce), n_configs), np.nan)
+    text = [[''] * n_configs for op in mce]
+    for i, cells in enumerate(mce.values()):
+        for config, value in cells.items():
+            if not (1 <= config <= n_configs):
+                continue
+            number = _float(value) if value else np.nan
+            if np.isnan(number) and value:
+                text[i][config - 1] = value
+            else:
+                system.mce_values[i, config - 1] = number
+    system.mce_text = np.array(text, dtype=str).reshape(len(mce), n_configs)
+    return system
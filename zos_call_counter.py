@@ -0,0 +1,135 @@
+# ZOS-API call accounting
+# wraps an API object (e.g. TheSystem) in a proxy that counts every member access, method
+# call and property write that crosses into OpticStudio, attributed to the current stage
+#
+# usage:
+#   counter = zos_call_counter.CallCounter()
+#   TheSystem = counter.wrap(zos.TheSystem)
+#   with counter.stage('set_surface_data'):
+#       ...                                  # every TheSystem.* access is counted
+#   counter.print_summary()
+#
+# latency (seconds) adds a simulated cost to every call, e.g. to model the cross-process
+# round trip of a live OpticStudio on top of fake_zosapi
+
+import collections
+import contextlib
+import time
+
+# values returned as-is (already python, no further API calls through them)
+_PLAIN_TYPES = (bool, int, float, complex, str, bytes, type(None))
+
+
+def _unwrap(value):
+    # proxies must not be passed back into the API
+    if isinstance(value, CountingProxy):
+        return object.__getattribute__(value, '_target')
+    return value
+
+
+class CallCounter(object):
+
+    def __init__(self, latency=0.0):
+        self.current_stage = ''
+        self.latency = latency
+        # {stage: Counter({member name: calls})}
+        self.counts = collections.defaultdict(collections.Counter)
+
+    def wrap(self, target):
+        return CountingProxy(target, self)
+
+    def record(self, member):
+        self.counts[self.current_stage][member] += 1
+        if self.latency > 0:
+            # spin rather than sleep: sleep() is too coarse for sub-millisecond latencies
+            end = time.perf_counter() + self.latency
+            while time.perf_counter() < end:
+                pass
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        previous = self.current_stage
+        self.current_stage = name
+        try:
+            yield self
+        finally:
+            self.current_stage = previous
+
+    def stage_totals(self):
+        # {stage: total calls}, in the order the stages ran
+        return {stage: sum(members.values()) for stage, members in self.counts.items()}
+
+    def total(self):
+        return sum(self.stage_totals().values())
+
+    def reset(self):
+        self.counts.clear()
+
+    def print_summary(self, members=False):
+        print(f"{'stage':24s} {'API calls':>10s}")
+        for stage, members_count in self.counts.items():
+            print(f"{stage or '(none)':24s} {sum(members_count.values()):10d}")
+            if members:
+                for member, n in members_count.most_common():
+                    print(f"    {member:20s} {n:10d}")
+        print(f"{'total':24s} {self.total():10d}")
+
+
+class CountingProxy(object):
+    # every attribute read/write and method call on the target counts as one API call;
+    # returned API objects are wrapped in turn, plain python values are not
+    __slots__ = ('_target', '_counter')
+
+    def __init__(self, target, counter):
+        object.__setattr__(self, '_target', target)
+        object.__setattr__(self, '_counter', counter)
+
+    def _wrap(self, value):
+        if isinstance(value, _PLAIN_TYPES):
+            return value
+        return CountingProxy(value, object.__getattribute__(self, '_counter'))
+
+    def __getattr__(self, name):
+        target = object.__getattribute__(self, '_target')
+        counter = object.__getattribute__(self, '_counter')
+        value = getattr(target, name)
+        if callable(value) and not isinstance(value, type):
+            def call(*args, **kwargs):
+                counter.record(name)
+                result = value(*[_unwrap(a) for a in args], **{k: _unwrap(v) for k, v in kwargs.items()})
+                return self._wrap(result)
+            return call
+        counter.record(name)
+        return self._wrap(value)
+
+    def __setattr__(self, name, value):
+        object.__getattribute__(self, '_counter').record(name)
+        setattr(object.__getattribute__(self, '_target'), name, _unwrap(value))
+
+    # collections returned by the API (catalog lists, ...) are fetched in one call
+    def __iter__(self):
+        return iter(object.__getattribute__(self, '_target'))
+
+    def __len__(self):
+        return len(object.__getattribute__(self, '_target'))
+
+    def __contains__(self, item):
+        return item in object.__getattribute__(self, '_target')
+
+    def __getitem__(self, index):
+        return object.__getattribute__(self, '_target')[index]
+
+    def __eq__(self, other):
+        return object.__getattribute__(self, '_target') == _unwrap(other)
+
+    def __ne__(self, other):
+        return not self.__eq__(other)
+
+    def __hash__(self):
+        return hash(object.__getattribute__(self, '_target'))
+
+    def __str__(self):
+        return str(object.__getattribute__(self, '_target'))
+
+    def __repr__(self):
+        return f"CountingProxy({object.__getattribute__(self, '_target')!r})"